@@ -1,31 +1,45 @@
 import asyncio
+import importlib
 import logging
 import os
+import signal
 import sys
 
+from services.startup_profile import startup_profile  # first, so STARTUP_PROFILE=1 times the imports below
+
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 from aiogram.types import BotCommand
-from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiogram.webhook.aiohttp_server import setup_application
 from aiohttp import web
 from dotenv import load_dotenv
 
 from database import db
-from handlers_likes import router as likes_router
-from handlers_profile import router as profile_router
-from handlers_main import router as main_router
-from handlers_matching import router as matching_router
-from handlers_chat import router as chat_router
-from handlers_confession import router as confession_router
-from handlers_admin import router as admin_router
-from handlers_admin import ADMIN_IDS
-from handlers_crushes import router as crushes_router
-from handlers_leaderboard import router as leaderboard_router
-from handlers_coin_and_shop import router as coin_and_shop_router
-from handlers_invite import router as invite_router
-from notifications import setup_scheduler, shutdown_scheduler
+from notifications import setup_scheduler, shutdown_scheduler, start_workers, shutdown_workers
+from bot_config import (
+    ENABLE_TEST_ROUTERS, FSM_STORAGE, LOG_FILE, ROUTERS, RUN_WORKERS_IN_WEB, WEBHOOK_LANES, WEBHOOK_QUEUE_SIZE
+)
 from middlewares.rate_limit import RateLimitMiddleware, GracefulFallbackMiddleware, BanCheckMiddleware
+from middlewares.api_calls import UpdateCallCounterMiddleware
+from middlewares.fsm_flush import FSMWriteCoalescingMiddleware
+from middlewares.metrics import HandlerMetricsMiddleware
+from middlewares.profiling import ProfilingMiddleware
+from middlewares.tracing import UpdateTracingMiddleware
+from services.outbound import setup_bot_session
+from services.broadcast_service import BroadcastService
+from services.reachability import unreachable_writer
+from services.ban_cache import banned_users
+from services.invalidation import invalidation_bus
+from services.log_pipeline import log_pipeline
+from services.loop_monitor import loop_monitor
+from services.memory_diag import memory_stores
+from services.fsm_storage import PostgresStorage
+from services.update_queue import QueuedRequestHandler, UpdateQueue
+from services.sharding import serve_shard
+from services import health
+
+startup_profile.mark("imports done")
 
 # -------------------- Env --------------------
 load_dotenv()  # optional locally; Render sets env vars from render.yaml
@@ -38,37 +52,63 @@ WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
 PORT = int(os.getenv("PORT", "8080"))
 bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
 # -------------------- Logging --------------------
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[logging.FileHandler("bot.log"), logging.StreamHandler(sys.stdout)],
-)
+log_pipeline.start(LOG_FILE)  # queued; file/stdout writes happen on a background thread
 logger = logging.getLogger(__name__)
 
 # -------------------- Dispatcher --------------------
-dp = Dispatcher()
+dp = Dispatcher(storage=PostgresStorage(db) if FSM_STORAGE == "postgres" else None)
+memory_stores.register(
+    "fsm_storage",
+    lambda: dp.storage.buffered() if isinstance(dp.storage, PostgresStorage) else dp.storage.storage,
+)
 
-def setup_handlers(dp: Dispatcher):
-    dp.include_router(profile_router)
-    dp.include_router(main_router)
-    dp.include_router(matching_router)
-    dp.include_router(chat_router)
-    dp.include_router(confession_router)
-    dp.include_router(admin_router)
-    dp.include_router(leaderboard_router)
-    dp.include_router(crushes_router)
-    dp.include_router(likes_router)
-    dp.include_router(coin_and_shop_router)
-    dp.include_router(invite_router)
-    
-    
-    #For testing handlers
-    from test_match_queue import setup_test_handlers
-    dp.include_router(setup_test_handlers(db))
+# -------------------- Routers --------------------
+# Name -> module exposing `router`, in include order (the first matching handler wins).
+# ROUTERS (env) selects and orders a subset; modules are imported only when mounted.
+ROUTER_MODULES = {
+    "profile": "handlers_profile",
+    "main": "handlers_main",
+    "matching": "handlers_matching",
+    "chat": "handlers_chat",
+    "confession": "handlers_confession",
+    "admin": "handlers_admin",
+    "leaderboard": "handlers_leaderboard",
+    "crushes": "handlers_crushes",
+    "likes": "handlers_likes",
+    "coin_and_shop": "handlers_coin_and_shop",
+    "invite": "handlers_invite",
+}
 
 
-    dp.message.middleware(RateLimitMiddleware(rate_limit=1))
-    dp.callback_query.middleware(RateLimitMiddleware(rate_limit=1))
+def setup_handlers(dp: Dispatcher):
+    for name in ROUTERS or ROUTER_MODULES:
+        module = ROUTER_MODULES.get(name)
+        if module is None:
+            logger.error(f"Unknown router '{name}' in ROUTERS; known: {', '.join(ROUTER_MODULES)}")
+            continue
+        dp.include_router(importlib.import_module(module).router)
+
+    # Test-only handlers (/test_fake_match); never mounted unless asked for
+    if ENABLE_TEST_ROUTERS:
+        from test_match_queue import setup_test_handlers
+        dp.include_router(setup_test_handlers(db))
+    startup_profile.mark("routers mounted")
+
+
+    dp.update.outer_middleware(UpdateTracingMiddleware())
+    dp.update.outer_middleware(UpdateCallCounterMiddleware())
+    if isinstance(dp.storage, PostgresStorage):
+        dp.update.outer_middleware(FSMWriteCoalescingMiddleware(dp.storage))
+
+    dp.message.middleware(HandlerMetricsMiddleware("message"))
+    dp.callback_query.middleware(HandlerMetricsMiddleware("callback_query"))
+    dp.message.middleware(ProfilingMiddleware())
+    dp.callback_query.middleware(ProfilingMiddleware())
+
+    # One limiter for both event types, so taps and messages share a bucket
+    rate_limiter = RateLimitMiddleware()
+    dp.message.middleware(rate_limiter)
+    dp.callback_query.middleware(rate_limiter)
     
     dp.message.middleware(BanCheckMiddleware(db))
     dp.callback_query.middleware(BanCheckMiddleware(db))
@@ -76,6 +116,8 @@ def setup_handlers(dp: Dispatcher):
     # dp.message.middleware(GracefulFallbackMiddleware())
     # dp.callback_query.middleware(GracefulFallbackMiddleware())
 
+setup_bot_session(bot)
+
 # -------------------- Bot Commands --------------------
 from aiogram.types import BotCommandScopeDefault, BotCommandScopeChat
 
@@ -89,6 +131,8 @@ user_commands = [
 admin_commands = [
     BotCommand(command="admin", description="🛠️ Admin Panel"),
     BotCommand(command="broadcast", description="📢 Broadcast Message"),
+    BotCommand(command="profiler", description="🔬 Profile Updates / Sample Stacks"),
+    BotCommand(command="memory", description="🧠 Memory Diagnostics"),
 ]
 
 
@@ -98,13 +142,23 @@ async def setup_bot_commands(bot: Bot):
     await bot.set_my_commands(user_commands, scope=BotCommandScopeDefault())
 
     # Admin‑only commands (scoped to each admin’s chat)
+    from handlers_admin import ADMIN_IDS
+
     for admin_id in ADMIN_IDS:
         await bot.set_my_commands(admin_commands + user_commands, scope=BotCommandScopeChat(chat_id=admin_id))
 async def on_startup(bot: Bot):
     logger.info("Bot is starting up...")
+    loop_monitor.start()
     await db.connect()
+    startup_profile.mark("db connected")
+    unreachable_writer.start(db)
+    await invalidation_bus.start(db)
+    await banned_users.start(db)
     await setup_bot_commands(bot)
     setup_scheduler(bot)
+    if RUN_WORKERS_IN_WEB:
+        start_workers(bot)
+    await BroadcastService(db, bot).resume_unfinished()
     # if ADMIN_GROUP_ID:
     #     try:
     #         await bot.send_message(
@@ -113,12 +167,20 @@ async def on_startup(bot: Bot):
     #         )
     #     except Exception as e:
     #         logger.error(f"Could not send startup message to admin group: {e}")
+    startup_profile.mark("startup complete")
+    startup_profile.log_report()
     logger.info("Bot startup complete!")
 
 async def on_shutdown(bot: Bot):
     logger.info("Bot is shutting down...")
     shutdown_scheduler()
+    await shutdown_workers()
+    await banned_users.close()
+    await invalidation_bus.close()
+    await dp.storage.close()  # flush buffered FSM writes
+    await unreachable_writer.close()
     await db.close()
+    await loop_monitor.close()
     # if ADMIN_GROUP_ID:
     #     try:
     #         await bot.send_message(ADMIN_GROUP_ID, "🤖 AAUPulse Bot Stopped ⏸️")
@@ -137,13 +199,19 @@ async def create_app() -> web.Application:
         raise RuntimeError("BOT_TOKEN is missing")
 
     bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    setup_bot_session(bot)
     setup_handlers(dp)
 
     app = web.Application()
     app.router.add_get("/health", health_check)
+    app.router.add_get("/ready", health.ready)
+    app.router.add_get("/metrics", health.metrics)
 
-    webhook_handler = SimpleRequestHandler(dispatcher=dp, bot=bot)
+    webhook_handler = QueuedRequestHandler(
+        dispatcher=dp, bot=bot, maxsize=WEBHOOK_QUEUE_SIZE, lanes=WEBHOOK_LANES
+    )
     webhook_handler.register(app, path=WEBHOOK_PATH)
+    health.update_queue_collector(webhook_handler.queue)
 
     setup_application(app, dp, bot=bot)
 
@@ -170,6 +238,7 @@ async def start_polling():
         raise RuntimeError("BOT_TOKEN is missing")
 
     bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    setup_bot_session(bot)
     setup_handlers(dp)
     dp.startup.register(on_startup)
     dp.shutdown.register(on_shutdown)
@@ -181,10 +250,39 @@ async def start_polling():
     finally:
         await bot.session.close()
 
+# -------------------- Shard Mode (supervisor.py) --------------------
+async def start_shard(socket_path: str):
+    """Processes updates forwarded by supervisor.py's ingress over a unix socket."""
+    if not BOT_TOKEN:
+        raise RuntimeError("BOT_TOKEN is missing")
+
+    bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    setup_bot_session(bot)
+    setup_handlers(dp)
+    await on_startup(bot)
+
+    queue = UpdateQueue(dp, maxsize=WEBHOOK_QUEUE_SIZE, lanes=WEBHOOK_LANES)
+    queue.start()
+    server = await serve_shard(socket_path, queue, bot)
+    logger.info(f"Shard listening on {socket_path}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    server.close()
+    await queue.close()
+    await on_shutdown(bot)
+    await bot.session.close()
+
 # -------------------- Entrypoint --------------------
 if __name__ == "__main__":
     if "--polling" in sys.argv:
         asyncio.run(start_polling())
+    elif "--socket" in sys.argv:
+        asyncio.run(start_shard(sys.argv[sys.argv.index("--socket") + 1]))
     else:
         logger.info(f"Starting webhook server on http://0.0.0.0:{PORT}")
         web.run_app(create_app(), host="0.0.0.0", port=PORT)
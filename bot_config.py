@@ -7,6 +7,36 @@ BOT_TOKEN = os.getenv('BOT_TOKEN')
 CHANNEL_ID = os.getenv('CHANNEL_ID', '@AAUPulse')
 ADMIN_GROUP_ID = os.getenv('ADMIN_GROUP_ID')
 ADMIN_NEW_USER_GROUP_ID = os.getenv('ADMIN_NEW_USER_GROUP_ID')
+# Run job worker / match queue scheduler / outbox in the web process (set 0 when worker.py runs
+# separately; the Procfile does, since it starts a worker process)
+RUN_WORKERS_IN_WEB = os.getenv('RUN_WORKERS_IN_WEB', '1') == '1'
+# Webhook updates are acknowledged at once and processed from a bounded queue,
+# split into lanes by user (in order per user, parallel across users)
+WEBHOOK_LANES = int(os.getenv('WEBHOOK_LANES', '16'))
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', '1000'))
+# FSM state/data: 'postgres' (shared by all web processes) or 'memory' (single process only)
+FSM_STORAGE = os.getenv('FSM_STORAGE', 'postgres')
+# Logging: records are queued and written by a background thread (LOG_FORMAT 'json' or 'text').
+# Below WARNING, LOG_SAMPLING keeps a share per logger ('aiogram.event=0.1,handlers_chat=0.5')
+# and LOG_RATE_LIMIT caps records/second per logger (0 = no cap)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+LOG_FILE = os.getenv('LOG_FILE', 'bot.log')
+LOG_SAMPLING = os.getenv('LOG_SAMPLING', 'aiogram.event=0.1')
+LOG_RATE_LIMIT = float(os.getenv('LOG_RATE_LIMIT', '50'))
+# Share of updates traced (0..1) and optional JSON-lines file for the spans (else in-memory only)
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0.01'))
+TRACE_FILE = os.getenv('TRACE_FILE', '')
+# Loop monitor: callbacks holding the event loop longer than this (seconds) are reported;
+# debug mode also captures the blocking stack (watchdog thread)
+LOOP_BLOCK_THRESHOLD = float(os.getenv('LOOP_BLOCK_THRESHOLD', '0.1'))
+LOOP_MONITOR_DEBUG = os.getenv('LOOP_MONITOR_DEBUG', '0') == '1'
+# Routers to mount, in order (names from bot.ROUTER_MODULES, e.g. 'profile,main,chat'); empty = all
+ROUTERS = [name.strip() for name in os.getenv('ROUTERS', '').split(',') if name.strip()]
+# Mount the test-only routers (/test_fake_match); keep off in production
+ENABLE_TEST_ROUTERS = os.getenv('ENABLE_TEST_ROUTERS', '0') == '1'
+# Where rate limit buckets live: 'memory' (per process) or 'postgres' (shared by all web processes)
+RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'memory')
 SUPABASE_URL = os.getenv('VITE_SUPABASE_URL')
 SUPABASE_KEY = os.getenv('VITE_SUPABASE_ANON_KEY')
 
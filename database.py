@@ -3,17 +3,32 @@ import random
 import asyncpg
 import logging
 import json
+import time
+from contextlib import asynccontextmanager
 from typing import Optional, Dict, List, Any, Tuple
 from datetime import datetime, date, timedelta
 
 from dotenv import load_dotenv
 
+from services.chat_writer import ChatMessageWriter
 from services.match_classifier import classify_match
+from services.metrics import db_pool_wait_seconds, db_query_seconds, timed_methods
+from services.tracing import traced_methods
 from utils import calculate_vibe_compatibility, recency_score
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Likes only mark the leaderboard dirty; one rebuild job runs this many seconds later
+LEADERBOARD_REBUILD_DELAY = 30
+
+# Invalidation bus (services/invalidation.py): NOTIFY channel and event types
+INVALIDATION_CHANNEL = "invalidation"
+USER_UPDATED = "user_updated"
+USER_BANNED = "user_banned"
+LIKE_ADDED = "like_added"
+MATCH_CREATED = "match_created"
+
 # --- Helper Function ---
 def _dict_from_row(row: asyncpg.Record) -> Optional[Dict[str, Any]]:
     """Converts an asyncpg.Record object to a dictionary."""
@@ -21,18 +36,27 @@ def _dict_from_row(row: asyncpg.Record) -> Optional[Dict[str, Any]]:
         return None
     return dict(row.items())
 load_dotenv()
+@traced_methods("db", skip=("connect", "close", "fetch", "fetchrow", "execute"))
+@timed_methods(db_query_seconds, skip=("connect", "close", "fetch", "fetchrow", "execute"))
 class Database:
     """
     An async-compatible PostgreSQL database class for AAUPulse.
     This class handles all database operations, replacing the original SQLite implementation.
     """
     def __init__(self, dsn: str = None):
-        self.dsn = dsn or os.getenv("POSTGRES_DSN")
-        if not self.dsn:
-            raise ValueError("POSTGRES_DSN not set in environment or passed to Database.")
+        self._dsn = dsn
         self._pool: asyncpg.Pool | None = None
+        self._chat_writer: ChatMessageWriter | None = None
         
     
+    @property
+    def dsn(self) -> str:
+        """Resolved on first use, so importing this module (and the global db) needs no environment."""
+        dsn = self._dsn or os.getenv("POSTGRES_DSN")
+        if not dsn:
+            raise ValueError("POSTGRES_DSN not set in environment or passed to Database.")
+        return dsn
+
     @property
     def pool(self):
         if not self._pool:
@@ -44,21 +68,28 @@ class Database:
         Initializes the database pool and creates tables.
         If reset=True, drops existing schema before re-initializing.
         """
+        dsn = self.dsn
         try:
-            self._pool = await asyncpg.create_pool(dsn=self.dsn, min_size=1, max_size=10)
-            async with self._pool.acquire() as conn:
+            self._pool = await asyncpg.create_pool(dsn=dsn, min_size=1, max_size=10)
+            async with self._acquire() as conn:
                 await conn.execute("SET TIME ZONE 'UTC'")
                 if reset:
                     logger.warning("⚠️ Resetting database schema...")
                     await conn.execute("DROP SCHEMA public CASCADE; CREATE SCHEMA public;")
                 await self._initialize_db(conn)
+            self._chat_writer = ChatMessageWriter(self._pool)
+            self._chat_writer.start()
             logger.info("Database pool created and tables initialized.")
         except Exception as e:
-            logger.critical(f"FATAL: Could not connect to database at {self.dsn}: {e}")
+            logger.critical(f"FATAL: Could not connect to database at {dsn}: {e}")
             raise
 
     async def close(self):
         """Closes the database pool."""
+        if self._chat_writer:
+            # Commit any buffered chat messages before the pool goes away
+            await self._chat_writer.close()
+            self._chat_writer = None
         if self._pool:
             await self._pool.close()
             logger.info("Database pool closed.")
@@ -277,6 +308,193 @@ class Database:
         """)
 
 
+        # --- Broadcast Jobs ---
+        # Recipients are walked in users.id order; last_user_id is the resume cursor.
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS broadcast_jobs (
+                id SERIAL PRIMARY KEY,
+                text TEXT NOT NULL,
+                created_by BIGINT,
+                admin_chat_id BIGINT,
+                progress_message_id BIGINT,
+                status TEXT DEFAULT 'pending',
+                last_user_id BIGINT DEFAULT 0,
+                total INTEGER DEFAULT 0,
+                sent INTEGER DEFAULT 0,
+                failed INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT NOW(),
+                started_at TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT NOW(),
+                finished_at TIMESTAMP
+            );
+        """)
+
+        # Channel-post ranking, computed once per row (see MatchQueueService.queue_match)
+        await conn.execute("""
+            CREATE OR REPLACE FUNCTION match_queue_priority(vibe FLOAT, interests JSONB, special TEXT)
+            RETURNS FLOAT AS $$
+                SELECT COALESCE(vibe, 0) * 2
+                    + CASE WHEN jsonb_typeof(interests) = 'array' THEN jsonb_array_length(interests) ELSE 0 END * 5
+                    + CASE special
+                        WHEN 'high-vibe' THEN 100
+                        WHEN 'freshman-senior' THEN 80
+                        WHEN 'cross-campus' THEN 60
+                        WHEN 'shared-interests' THEN 40
+                        WHEN 'same-department' THEN 20
+                        WHEN 'opposite-department' THEN 10
+                        ELSE 0
+                      END
+            $$ LANGUAGE sql IMMUTABLE;
+        """)
+        # NULL until set by queue_match or the backfill job
+        await conn.execute("ALTER TABLE match_queue ADD COLUMN IF NOT EXISTS priority FLOAT;")
+        # Lease taken by the poster (scheduler / admin Post Now); other instances skip leased rows
+        await conn.execute("ALTER TABLE match_queue ADD COLUMN IF NOT EXISTS claimed_until TIMESTAMPTZ;")
+
+        # Wakes the match queue scheduler (LISTEN match_queue) as soon as a match is queued
+        await conn.execute("""
+            CREATE OR REPLACE FUNCTION notify_match_queue() RETURNS trigger AS $$
+            BEGIN
+                PERFORM pg_notify('match_queue', NEW.id::text);
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+        await conn.execute("DROP TRIGGER IF EXISTS match_queue_notify ON match_queue;")
+        await conn.execute("""
+            CREATE TRIGGER match_queue_notify
+            AFTER INSERT ON match_queue
+            FOR EACH ROW EXECUTE FUNCTION notify_match_queue();
+        """)
+
+        # --- Outbox ---
+        # Side-effect messages (admin logs, like/match notifications, moderation notices),
+        # written with the DB change that causes them and sent by services.outbox.OutboxWorker
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id BIGSERIAL PRIMARY KEY,
+                chat_id BIGINT NOT NULL,
+                kind TEXT NOT NULL,
+                payload JSONB NOT NULL,
+                priority SMALLINT DEFAULT 2,
+                status TEXT DEFAULT 'pending',
+                attempts INTEGER DEFAULT 0,
+                next_attempt_at TIMESTAMP DEFAULT NOW(),
+                last_error TEXT,
+                created_at TIMESTAMP DEFAULT NOW(),
+                sent_at TIMESTAMP
+            );
+        """)
+        await conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_outbox_pending ON outbox (next_attempt_at) WHERE status = 'pending';"
+        )
+        # Wakes the outbox worker once the enqueuing transaction commits
+        await conn.execute("""
+            CREATE OR REPLACE FUNCTION notify_outbox() RETURNS trigger AS $$
+            BEGIN
+                PERFORM pg_notify('outbox', '');
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+        await conn.execute("DROP TRIGGER IF EXISTS outbox_notify ON outbox;")
+        await conn.execute("""
+            CREATE TRIGGER outbox_notify
+            AFTER INSERT ON outbox
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_outbox();
+        """)
+
+        # --- Background Jobs ---
+        # Durable queue drained by services.jobs.JobWorker (web process or worker.py).
+        # dedupe_key is unique among pending/running jobs, so repeated enqueues coalesce.
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id BIGSERIAL PRIMARY KEY,
+                queue TEXT NOT NULL DEFAULT 'default',
+                name TEXT NOT NULL,
+                payload JSONB DEFAULT '{}',
+                status TEXT DEFAULT 'pending',
+                attempts INTEGER DEFAULT 0,
+                max_attempts INTEGER DEFAULT 5,
+                run_at TIMESTAMP DEFAULT NOW(),
+                dedupe_key TEXT,
+                locked_by TEXT,
+                locked_at TIMESTAMP,
+                last_error TEXT,
+                created_at TIMESTAMP DEFAULT NOW(),
+                finished_at TIMESTAMP
+            );
+        """)
+        await conn.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_dedupe ON jobs (dedupe_key) "
+            "WHERE status IN ('pending', 'running');"
+        )
+        await conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs (queue, run_at) WHERE status IN ('pending', 'running');"
+        )
+        await conn.execute("""
+            CREATE OR REPLACE FUNCTION notify_jobs() RETURNS trigger AS $$
+            BEGIN
+                PERFORM pg_notify('jobs', NEW.queue);
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+        await conn.execute("DROP TRIGGER IF EXISTS jobs_notify ON jobs;")
+        await conn.execute("""
+            CREATE TRIGGER jobs_notify
+            AFTER INSERT ON jobs
+            FOR EACH ROW EXECUTE FUNCTION notify_jobs();
+        """)
+
+        # --- Scheduler State ---
+        # Admin stop/start, shared by every bot instance and kept across restarts
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS scheduler_state (
+                name TEXT PRIMARY KEY,
+                paused BOOLEAN DEFAULT FALSE,
+                updated_by BIGINT,
+                updated_at TIMESTAMP DEFAULT NOW()
+            );
+        """)
+
+        # --- FSM Storage ---
+        # aiogram FSM state/data shared by all web processes (services/fsm_storage.py)
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS fsm_storage (
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data BYTEA,
+                expires_at TIMESTAMP NOT NULL
+            );
+        """)
+        await conn.execute("CREATE INDEX IF NOT EXISTS idx_fsm_storage_expires ON fsm_storage (expires_at);")
+
+        # --- Notification Cursors ---
+        # Last user id reached by each recurring notification job (fair rotation)
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS notification_cursors (
+                job TEXT PRIMARY KEY,
+                last_user_id BIGINT DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT NOW()
+            );
+        """)
+
+        # --- Rate Limits ---
+        # Shared token buckets (RATE_LIMIT_BACKEND=postgres): one theoretical
+        # arrival time per key; unlogged, losing it on a crash only resets limits
+        await conn.execute("""
+            CREATE UNLOGGED TABLE IF NOT EXISTS rate_limits (
+                key TEXT PRIMARY KEY,
+                tat DOUBLE PRECISION NOT NULL,
+                allowed BOOLEAN NOT NULL DEFAULT TRUE
+            );
+        """)
+
+        # --- Reachability ---
+        # FALSE once a send fails permanently (bot blocked, account deleted)
+        await conn.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS is_reachable BOOLEAN DEFAULT TRUE;")
+
         # --- Indexes ---
         await  conn.execute("CREATE INDEX IF NOT EXISTS idx_likes_liker_id ON likes (liker_id);")
         await  conn.execute("CREATE INDEX IF NOT EXISTS idx_likes_liked_id ON likes (liked_id);")
@@ -286,26 +504,72 @@ class Database:
         await conn.execute("CREATE INDEX IF NOT EXISTS idx_passes_user_id_created ON passes (user_id, created_at);")
         await conn.execute("CREATE INDEX IF NOT EXISTS idx_transactions_user_id_created ON transactions (user_id, created_at);")
         await conn.execute("CREATE INDEX IF NOT EXISTS idx_interests_user_id ON interests(user_id);")
+        # Top-N due matches by priority, and the earliest pending post time
+        await conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_match_queue_pending_priority ON match_queue (priority DESC NULLS LAST, created_at) "
+            "WHERE sent = FALSE;"
+        )
+        await conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_match_queue_pending_time ON match_queue (next_post_time) WHERE sent = FALSE;"
+        )
+        # Fan-out recipients (notifications, broadcasts) paged by id
+        await conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_users_recipients ON users (id) "
+            "WHERE is_active = TRUE AND is_banned = FALSE AND is_reachable = TRUE;"
+        )
+        # Banned id set loaded by the ban cache
+        await conn.execute("CREATE INDEX IF NOT EXISTS idx_users_banned ON users (id) WHERE is_banned = TRUE;")
         
         
      
 
-    async def fetch(self, sql: str, *args):
+    @asynccontextmanager
+    async def _acquire(self):
+        """Pool connection, recording how long the pool made us wait."""
+        started = time.perf_counter()
         async with self._pool.acquire() as conn:
+            db_pool_wait_seconds.observe(time.perf_counter() - started)
+            yield conn
+
+    async def ping(self, timeout: float = 2.0) -> bool:
+        try:
+            async with self._acquire() as conn:
+                await conn.fetchval("SELECT 1", timeout=timeout)
+            return True
+        except Exception as e:
+            logger.error(f"Database ping failed: {e}")
+            return False
+
+    async def get_backlog_counts(self) -> Dict[str, int]:
+        """Pending match queue items and live FSM keys (for /metrics)."""
+        try:
+            row = await self.fetchrow(
+                """
+                SELECT (SELECT COUNT(*) FROM match_queue WHERE sent = FALSE) AS match_queue,
+                       (SELECT COUNT(*) FROM fsm_storage WHERE expires_at > NOW()) AS fsm_keys
+                """
+            )
+            return dict(row)
+        except Exception as e:
+            logger.error(f"Error counting backlogs: {e}")
+            return {}
+
+    async def fetch(self, sql: str, *args):
+        async with self._acquire() as conn:
             return await conn.fetch(sql, *args)
 
     async def fetchrow(self, sql: str, *args):
-        async with self._pool.acquire() as conn:
+        async with self._acquire() as conn:
             return await conn.fetchrow(sql, *args)
 
     async def execute(self, sql: str, *args):
-        async with self._pool.acquire() as conn:
+        async with self._acquire() as conn:
             return await conn.execute(sql, *args)
 
 
-    async def get_user(self, user_id: int) -> Optional[Dict]:
+    async def get_user(self, user_id: int, conn=None) -> Optional[Dict]:
             try:
-                row = await self.fetchrow(
+                row = await (conn or self).fetchrow(
                     "SELECT * FROM users WHERE id = $1", user_id
                 )
                 return _dict_from_row(row)
@@ -343,6 +607,7 @@ class Database:
             sql = f"UPDATE users SET {set_clause} WHERE id = ${len(values)}"
             
             await self.execute(sql, *values)
+            await self.publish_event(USER_UPDATED, user_id=user_id, fields=list(updates))
             return True
         except Exception as e:
             logger.error(f"Error updating user {user_id}: {e}")
@@ -521,14 +786,14 @@ class Database:
 
     # --- Interests Helpers ---
 
-    async def get_user_interests(self, user_id: int) -> List[str]:
+    async def get_user_interests(self, user_id: int, conn=None) -> List[str]:
         query = """
             SELECT ic.name
             FROM interests i
             JOIN interest_catalog ic ON i.interest_id = ic.id
             WHERE i.user_id = $1
         """
-        rows = await self.fetch(query, user_id)
+        rows = await (conn or self).fetch(query, user_id)
         return [row["name"] for row in rows]
 
     async def get_other_user_ids(self, user_id: int) -> List[int]:
@@ -571,6 +836,7 @@ class Database:
                     user_id, interest_id
                 )
 
+            await self.publish_event(USER_UPDATED, user_id=user_id, fields=["interests"])
         except Exception as e:
             logger.error(f"Error setting interests for user {user_id}: {e}")
 
@@ -588,119 +854,143 @@ class Database:
         - creates match
         - classifies match
         - QUEUES special matches via MatchQueueService
+        All writes (and the queue's admin log, via the outbox) share one transaction.
         """
 
         try:
-            # ----------------------------------------------------
-            # INSERT LIKE (idempotent)
-            # ----------------------------------------------------
-            await self.execute(
-                "INSERT INTO likes (liker_id, liked_id) VALUES ($1, $2) "
-                "ON CONFLICT (liker_id, liked_id) DO NOTHING",
-                liker_id, liked_id
-            )
-
-            # ----------------------------------------------------
-            # CHECK REVERSE LIKE (mutual)
-            # ----------------------------------------------------
-            reverse_like = await self.fetchrow(
-                "SELECT id FROM likes WHERE liker_id = $1 AND liked_id = $2",
-                liked_id, liker_id
-            )
-
-            if not reverse_like:
-                await self.update_leaderboard_cache()
-                return {"status": "liked"}  # one-sided like → done
+            async with self._acquire() as conn:
+                async with conn.transaction():
+                    result = await self._add_like_tx(conn, liker_id, liked_id, bot)
+                    await self.request_leaderboard_rebuild(conn)
 
-            # ----------------------------------------------------
-            # MUTUAL LIKE → CREATE MATCH
-            # ----------------------------------------------------
-            row = await self.fetchrow(
-                """
-                SELECT liker_id
-                FROM likes
-                WHERE (liker_id = $1 AND liked_id = $2)
-                OR (liker_id = $3 AND liked_id = $4)
-                ORDER BY id ASC
-                LIMIT 1
-                """,
-                liker_id, liked_id, liked_id, liker_id
-            )
-            initiator_id = row["liker_id"] if row else liker_id
+            # DO NOT reward coins here
+            return result
 
-            user1_id = min(liker_id, liked_id)
-            user2_id = max(liker_id, liked_id)
+        except Exception as e:
+            logger.error(f"Error adding like from {liker_id} to {liked_id}: {e}")
+            return {"status": "error"}
 
-            match_row = await self.fetchrow(
-                "INSERT INTO matches (user1_id, user2_id, initiator_id) "
-                "VALUES ($1,$2,$3) RETURNING id",
-                user1_id, user2_id, initiator_id
-            )
-            match_id = match_row["id"]
+    async def _add_like_tx(self, conn, liker_id: int, liked_id: int, bot=None) -> dict:
+        # ----------------------------------------------------
+        # SERIALIZE THE PAIR
+        # ----------------------------------------------------
+        # A→B and B→A racing under READ COMMITTED would each miss the other's
+        # uncommitted like and neither would create the match. Both directions
+        # take the same lock, so the second one sees the first one's like.
+        await conn.execute(
+            "SELECT pg_advisory_xact_lock(hashtext(LEAST($1::bigint, $2::bigint)::text), hashtext(GREATEST($1::bigint, $2::bigint)::text))",
+            liker_id, liked_id
+        )
 
-            # ----------------------------------------------------
-            # COLLECT USER PROFILES + INTERESTS
-            # ----------------------------------------------------
-            user1 = await self.get_user(user1_id)
-            user2 = await self.get_user(user2_id)
+        # ----------------------------------------------------
+        # INSERT LIKE (idempotent)
+        # ----------------------------------------------------
+        await conn.execute(
+            "INSERT INTO likes (liker_id, liked_id) VALUES ($1, $2) "
+            "ON CONFLICT (liker_id, liked_id) DO NOTHING",
+            liker_id, liked_id
+        )
+        await self.publish_event(LIKE_ADDED, conn=conn, liker_id=liker_id, liked_id=liked_id)
+
+        # ----------------------------------------------------
+        # CHECK REVERSE LIKE (mutual)
+        # ----------------------------------------------------
+        reverse_like = await conn.fetchrow(
+            "SELECT id FROM likes WHERE liker_id = $1 AND liked_id = $2",
+            liked_id, liker_id
+        )
 
-            interests1 = await self.get_user_interests(user1_id)
-            interests2 = await self.get_user_interests(user2_id)
+        if not reverse_like:
+            return {"status": "liked"}  # one-sided like → done
 
-            # ----------------------------------------------------
-            # VIBE SCORE (JSON)
-            # ----------------------------------------------------
-            try:
-                vibe1 = json.loads(user1.get("vibe_score", "{}") or "{}")
-            except:
-                vibe1 = {}
+        # ----------------------------------------------------
+        # MUTUAL LIKE → CREATE MATCH
+        # ----------------------------------------------------
+        row = await conn.fetchrow(
+            """
+            SELECT liker_id
+            FROM likes
+            WHERE (liker_id = $1 AND liked_id = $2)
+            OR (liker_id = $3 AND liked_id = $4)
+            ORDER BY id ASC
+            LIMIT 1
+            """,
+            liker_id, liked_id, liked_id, liker_id
+        )
+        initiator_id = row["liker_id"] if row else liker_id
 
-            try:
-                vibe2 = json.loads(user2.get("vibe_score", "{}") or "{}")
-            except:
-                vibe2 = {}
+        user1_id = min(liker_id, liked_id)
+        user2_id = max(liker_id, liked_id)
 
-            try:
-                from utils import calculate_vibe_compatibility
-                vibe_score = calculate_vibe_compatibility(vibe1, vibe2) or 0.0
-            except:
-                vibe_score = 0.0
-
-            # ----------------------------------------------------
-            # CLASSIFY MATCH
-            # ----------------------------------------------------
-            special_type, shared_interests, vibe_score = classify_match(
-                user1, user2, interests1, interests2, vibe_score
-            )
+        match_row = await conn.fetchrow(
+            "INSERT INTO matches (user1_id, user2_id, initiator_id) "
+            "VALUES ($1,$2,$3) RETURNING id",
+            user1_id, user2_id, initiator_id
+        )
+        match_id = match_row["id"]
+        await self.publish_event(
+            MATCH_CREATED, conn=conn, match_id=match_id, user1_id=user1_id, user2_id=user2_id
+        )
 
-            # ----------------------------------------------------
-            # DECIDE IF THIS MATCH SHOULD BE QUEUED
-            # ----------------------------------------------------
-            should_queue = bool(special_type) or (random.random() < 0.10)
-            from services.match_queue_service import MatchQueueService
+        # ----------------------------------------------------
+        # COLLECT USER PROFILES + INTERESTS
+        # ----------------------------------------------------
+        # Read through the transaction's connection: a second pool connection
+        # per like can exhaust the pool while every holder waits for one
+        user1 = await self.get_user(user1_id, conn)
+        user2 = await self.get_user(user2_id, conn)
 
+        interests1 = await self.get_user_interests(user1_id, conn)
+        interests2 = await self.get_user_interests(user2_id, conn)
 
-            if should_queue:
-                # use the official queueing service
-                queue_service = MatchQueueService(self, bot)
+        # ----------------------------------------------------
+        # VIBE SCORE (JSON)
+        # ----------------------------------------------------
+        try:
+            vibe1 = json.loads(user1.get("vibe_score", "{}") or "{}")
+        except:
+            vibe1 = {}
 
-                await queue_service.queue_match(
-                    match={"id": match_id},
-                    user1=user1,
-                    user2=user2,
-                    special_type=special_type,
-                    vibe_score=vibe_score,
-                    interests=shared_interests
-                )
+        try:
+            vibe2 = json.loads(user2.get("vibe_score", "{}") or "{}")
+        except:
+            vibe2 = {}
 
-            # DO NOT reward coins here
-            await self.update_leaderboard_cache()
+        try:
+            from utils import calculate_vibe_compatibility
+            vibe_score = calculate_vibe_compatibility(vibe1, vibe2) or 0.0
+        except:
+            vibe_score = 0.0
+
+        # ----------------------------------------------------
+        # CLASSIFY MATCH
+        # ----------------------------------------------------
+        special_type, shared_interests, vibe_score = classify_match(
+            user1, user2, interests1, interests2, vibe_score
+        )
 
-            return {"status": "match", "match_id": match_id}
+        # ----------------------------------------------------
+        # DECIDE IF THIS MATCH SHOULD BE QUEUED
+        # ----------------------------------------------------
+        should_queue = bool(special_type) or (random.random() < 0.10)
+        from services.match_queue_service import MatchQueueService
+
+
+        if should_queue:
+            # use the official queueing service
+            queue_service = MatchQueueService(self, bot)
+
+            await queue_service.queue_match(
+                match={"id": match_id},
+                user1=user1,
+                user2=user2,
+                special_type=special_type,
+                vibe_score=vibe_score,
+                interests=shared_interests,
+                conn=conn
+            )
 
-        except Exception as e:
-            logger.error(f"Error adding like from {liker_id} to {liked_id}: {e}")
-            return {"status": "error"}
+        return {"status": "match", "match_id": match_id}
         
     async def get_user_stats(self, user_id: int) -> Dict:
         stats = {'likes_sent': 0, 'likes_received': 0, 'matches': 0, 'referrals': 0}
@@ -760,7 +1050,7 @@ class Database:
                 "DELETE FROM likes WHERE liker_id = $1 AND liked_id = $2",
                 liker_id, liked_id
             )
-            await self.update_leaderboard_cache()
+            await self.request_leaderboard_rebuild()
             # asyncpg returns e.g. "DELETE 1" or "DELETE 0"
             return status.startswith("DELETE 1")
         except Exception as e:
@@ -815,7 +1105,7 @@ class Database:
             other_user_id = user2_id if user1_id == user_id else user1_id
 
             # ✅ use self._pool instead of self.pool
-            async with self._pool.acquire() as conn:
+            async with self._acquire() as conn:
                 await conn.execute(
                     "UPDATE matches SET chat_active = FALSE, revealed = FALSE WHERE id = $1",
                     match_id
@@ -967,18 +1257,38 @@ class Database:
             }
         return None
 
-    async def save_chat_message(self, match_id: int, sender_id: int, message: str) -> bool:
+    async def save_chat_message(self, match_id: int, sender_id: int, message: str) -> Optional[int]:
+        """
+        Persists a chat message and returns its chats.id (None on failure).
+        Goes through the group-commit writer when the pool is up, so the call
+        returns only once the row is committed.
+        """
         try:
-            sql = "INSERT INTO chats (match_id, sender_id, message) VALUES ($1, $2, $3)"
-            await self.execute(sql, match_id, sender_id, message)
-            return True
+            if self._chat_writer:
+                return await self._chat_writer.write(match_id, sender_id, message)
+            sql = "INSERT INTO chats (match_id, sender_id, message) VALUES ($1, $2, $3) RETURNING id"
+            row = await self.fetchrow(sql, match_id, sender_id, message)
+            return row["id"] if row else None
         except Exception as e:
             logger.error(f"Error saving chat message for match {match_id}: {e}")
-            return False
+            return None
+
+    async def get_chat_message(self, chat_id: int) -> Optional[Dict]:
+        """Fetches a single chat message by its chats.id."""
+        try:
+            row = await self.fetchrow(
+                "SELECT id, match_id, sender_id, message, created_at FROM chats WHERE id = $1",
+                chat_id
+            )
+            return _dict_from_row(row)
+        except Exception as e:
+            logger.error(f"Error getting chat message {chat_id}: {e}")
+            return None
 
     async def get_chat_history(self, match_id: int, limit: int = 20) -> List[Dict]:
         try:
-            sql = "SELECT * FROM chats WHERE match_id = $1 ORDER BY created_at DESC LIMIT $2"
+            # Rows committed in the same batch share created_at, so id breaks the tie
+            sql = "SELECT * FROM chats WHERE match_id = $1 ORDER BY created_at DESC, id DESC LIMIT $2"
             rows = await self.fetch(sql, match_id, limit)
             return list(reversed([dict(r.items()) for r in rows]))
         except Exception as e:
@@ -1305,12 +1615,12 @@ class Database:
 
     async def get_active_user_ids(self, limit: Optional[int] = None) -> List[int]:
         """
-        Retrieves IDs of all active, non-banned users, optionally limiting the count.
+        Retrieves IDs of all active, non-banned, reachable users, optionally limiting the count.
         Used for scheduled broadcast notifications.
         """
         try:
             params = []
-            sql = "SELECT id FROM users WHERE is_active = TRUE AND is_banned = FALSE"
+            sql = "SELECT id FROM users WHERE is_active = TRUE AND is_banned = FALSE AND is_reachable = TRUE"
             if limit is not None:
                 sql += " LIMIT $1"
                 params.append(limit)
@@ -1324,15 +1634,40 @@ class Database:
 
 
     async def get_all_active_user_ids(self) -> List[int]:
-        """Returns a list of IDs for all active, non-banned users."""
+        """Returns a list of IDs for all active, non-banned, reachable users."""
         try:
-            sql = "SELECT id FROM users WHERE is_active = TRUE AND is_banned = FALSE"
+            sql = "SELECT id FROM users WHERE is_active = TRUE AND is_banned = FALSE AND is_reachable = TRUE"
             rows = await self.fetch(sql)
             return [row['id'] for row in rows]
         except Exception as e:
             logger.error(f"Error getting active user IDs: {e}")
             return []
 
+    async def get_active_user_ids_after(self, after_id: int, limit: int) -> List[int]:
+        """
+        Keyset page of active, non-banned, reachable user IDs with id > after_id, in id order.
+        Lets fan-out jobs walk the whole user base in batches and resume from a cursor.
+        """
+        try:
+            sql = """
+                SELECT id FROM users
+                WHERE is_active = TRUE AND is_banned = FALSE AND is_reachable = TRUE AND id > $1
+                ORDER BY id
+                LIMIT $2
+            """
+            rows = await self.fetch(sql, after_id, limit)
+            return [r["id"] for r in rows]
+        except Exception as e:
+            logger.error(f"Error paging active user IDs after {after_id}: {e}")
+            return []
+
+    async def count_active_user_ids(self) -> int:
+        """Number of active, non-banned, reachable users (recipients of a broadcast)."""
+        row = await self.fetchrow(
+            "SELECT COUNT(*) AS cnt FROM users WHERE is_active = TRUE AND is_banned = FALSE AND is_reachable = TRUE"
+        )
+        return row["cnt"] if row else 0
+
     async def reveal_match_identity(self, match_id: int, user_id: int) -> bool:
         """Sets the 'revealed' flag to True for a specific match, ensuring the user is one of the participants."""
         try:
@@ -1391,18 +1726,32 @@ class Database:
             logger.error(f"Error counting users: {e}")
             return 0
 
-    async def set_user_banned(self, user_id: int, banned: bool = True) -> bool:
-        """Toggle a user's banned status."""
+    async def set_user_banned(self, user_id: int, banned: bool = True, notice: Optional[Dict] = None) -> bool:
+        """Toggle a user's banned status; `notice` (an outbox payload) is queued to the user in the same transaction."""
         try:
-            await self.execute(
-                "UPDATE users SET is_banned = $1 WHERE id = $2",
-                banned, user_id
-            )
+            async with self._acquire() as conn:
+                async with conn.transaction():
+                    await conn.execute(
+                        "UPDATE users SET is_banned = $1 WHERE id = $2",
+                        banned, user_id
+                    )
+                    if notice:
+                        await self.enqueue_outbox(user_id, "moderation", notice, conn=conn)
+                    await self.publish_event(USER_BANNED, conn=conn, user_id=user_id, banned=banned)
             return True
         except Exception as e:
             logger.error(f"Error setting banned={banned} for user {user_id}: {e}")
             return False
 
+    async def get_banned_user_ids(self) -> Optional[set]:
+        """All banned user ids, or None if they could not be loaded."""
+        try:
+            rows = await self.fetch("SELECT id FROM users WHERE is_banned = TRUE")
+            return {r["id"] for r in rows}
+        except Exception as e:
+            logger.error(f"Error loading banned user ids: {e}")
+            return None
+
     async def set_user_active(self, user_id: int, active: bool = True) -> bool:
         """Toggle a user's active status."""
         try:
@@ -1410,20 +1759,522 @@ class Database:
                 "UPDATE users SET is_active = $1 WHERE id = $2",
                 active, user_id
             )
+            await self.publish_event(USER_UPDATED, user_id=user_id, fields=["is_active"])
             return True
         except Exception as e:
             logger.error(f"Error setting active={active} for user {user_id}: {e}")
             return False
 
+    async def mark_users_unreachable(self, user_ids: List[int]) -> int:
+        """Flags users whose sends fail permanently (blocked bot, deleted account)."""
+        try:
+            status = await self.execute(
+                "UPDATE users SET is_reachable = FALSE WHERE id = ANY($1) AND is_reachable = TRUE",
+                user_ids
+            )
+            return int(status.split()[-1])
+        except Exception as e:
+            logger.error(f"Error marking {len(user_ids)} users unreachable: {e}")
+            return 0
+
+    async def set_user_reachable(self, user_id: int) -> bool:
+        """Clears the unreachable flag once the user talks to the bot again."""
+        try:
+            await self.execute(
+                "UPDATE users SET is_reachable = TRUE WHERE id = $1 AND is_reachable = FALSE",
+                user_id
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Error setting user {user_id} reachable: {e}")
+            return False
+
     async def delete_user(self, user_id: int) -> bool:
         """Hard delete a user row (use with caution)."""
         try:
-            await self.execute("DELETE FROM users WHERE id = $1", user_id)
+            async with self._acquire() as conn:
+                async with conn.transaction():
+                    await conn.execute("DELETE FROM users WHERE id = $1", user_id)
+                    await self.publish_event(USER_UPDATED, conn=conn, user_id=user_id, deleted=True)
             return True
         except Exception as e:
             logger.error(f"Error deleting user {user_id}: {e}")
             return False
 
+    # --- Invalidation Events ---
+
+    async def publish_event(self, event_type: str, conn=None, **fields) -> bool:
+        """
+        Publishes a typed event on the invalidation bus (every process's caches).
+        With `conn` it is sent only if the caller's transaction commits, and
+        errors propagate so the transaction rolls back with it.
+        """
+        payload = json.dumps({"type": event_type, "ts": time.time(), **fields})
+        if conn is not None:
+            await conn.execute("SELECT pg_notify($1, $2)", INVALIDATION_CHANNEL, payload)
+            return True
+        try:
+            await self.execute("SELECT pg_notify($1, $2)", INVALIDATION_CHANNEL, payload)
+            return True
+        except Exception as e:
+            logger.error(f"Error publishing {event_type} event: {e}")
+            return False
+
+    # --- Outbox ---
+
+    async def enqueue_outbox(self, chat_id: int, kind: str, payload: Dict, priority: int = 2, conn=None) -> Optional[int]:
+        """
+        Queues a message for the outbox worker. Pass `conn` to write it in the
+        caller's transaction, so it is sent only if that transaction commits.
+        Unlike most helpers this raises on failure when `conn` is given, so the
+        surrounding transaction rolls back with it.
+        """
+        sql = "INSERT INTO outbox (chat_id, kind, payload, priority) VALUES ($1, $2, $3, $4) RETURNING id"
+        args = (chat_id, kind, json.dumps(payload), int(priority))
+        if conn is not None:
+            return await conn.fetchval(sql, *args)
+        try:
+            row = await self.fetchrow(sql, *args)
+            return row["id"] if row else None
+        except Exception as e:
+            logger.error(f"Error queueing {kind} message for {chat_id}: {e}")
+            return None
+
+    async def claim_outbox(self, limit: int, lease_seconds: int) -> List[Dict]:
+        """
+        Claims due messages: bumps attempts and hides them for lease_seconds, so
+        another worker only picks them up again if this one dies mid-send.
+        """
+        try:
+            rows = await self.fetch(
+                """
+                UPDATE outbox
+                SET attempts = attempts + 1, next_attempt_at = NOW() + make_interval(secs => $2)
+                WHERE id IN (
+                    SELECT id FROM outbox
+                    WHERE status = 'pending' AND next_attempt_at <= NOW()
+                    ORDER BY priority, id
+                    LIMIT $1
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING *
+                """,
+                limit, lease_seconds
+            )
+            return sorted((dict(r) for r in rows), key=lambda r: (r["priority"], r["id"]))
+        except Exception as e:
+            logger.error(f"Error claiming outbox messages: {e}")
+            return []
+
+    async def mark_outbox_sent(self, ids: List[int]) -> bool:
+        try:
+            await self.execute(
+                "UPDATE outbox SET status = 'sent', sent_at = NOW(), last_error = NULL WHERE id = ANY($1)",
+                ids
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Error marking {len(ids)} outbox messages sent: {e}")
+            return False
+
+    async def mark_outbox_retry(self, message_id: int, error: str, delay_seconds: float) -> bool:
+        try:
+            await self.execute(
+                "UPDATE outbox SET last_error = $2, next_attempt_at = NOW() + make_interval(secs => $3) WHERE id = $1",
+                message_id, error, float(delay_seconds)
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Error rescheduling outbox message {message_id}: {e}")
+            return False
+
+    async def mark_outbox_failed(self, message_id: int, error: str) -> bool:
+        try:
+            await self.execute(
+                "UPDATE outbox SET status = 'failed', last_error = $2 WHERE id = $1",
+                message_id, error
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Error failing outbox message {message_id}: {e}")
+            return False
+
+    async def purge_outbox(self, older_than_days: int) -> int:
+        """Deletes sent messages older than the given age; failed ones are kept for inspection."""
+        try:
+            status = await self.execute(
+                "DELETE FROM outbox WHERE status = 'sent' AND sent_at < NOW() - make_interval(days => $1)",
+                older_than_days
+            )
+            return int(status.split()[-1])
+        except Exception as e:
+            logger.error(f"Error purging outbox: {e}")
+            return 0
+
+    # --- Background Jobs ---
+
+    async def enqueue_job(
+        self,
+        name: str,
+        queue: str = "default",
+        payload: Optional[Dict] = None,
+        delay_seconds: float = 0,
+        dedupe_key: Optional[str] = None,
+        max_attempts: int = 5,
+        conn=None
+    ) -> Optional[int]:
+        """
+        Adds a job; returns its id, or None if a pending/running job with the
+        same dedupe_key already exists. With `conn` the job is part of the
+        caller's transaction (and errors propagate to it).
+        """
+        sql = """
+            INSERT INTO jobs (name, queue, payload, run_at, dedupe_key, max_attempts)
+            VALUES ($1, $2, $3, NOW() + make_interval(secs => $4), $5, $6)
+            ON CONFLICT (dedupe_key) WHERE status IN ('pending', 'running') DO NOTHING
+            RETURNING id
+        """
+        args = (name, queue, json.dumps(payload or {}), float(delay_seconds), dedupe_key, max_attempts)
+        if conn is not None:
+            return await conn.fetchval(sql, *args)
+        try:
+            row = await self.fetchrow(sql, *args)
+            return row["id"] if row else None
+        except Exception as e:
+            logger.error(f"Error enqueueing job {name}: {e}")
+            return None
+
+    async def claim_jobs(self, queue: str, limit: int, worker_id: str, lease_seconds: int) -> List[Dict]:
+        """
+        Claims up to `limit` due jobs of a queue. Running jobs whose lease ran
+        out (worker died without heartbeat) are claimed again.
+        """
+        try:
+            rows = await self.fetch(
+                """
+                UPDATE jobs
+                SET status = 'running', attempts = attempts + 1, locked_by = $3, locked_at = NOW()
+                WHERE id IN (
+                    SELECT id FROM jobs
+                    WHERE queue = $1
+                    AND (
+                        (status = 'pending' AND run_at <= NOW())
+                        OR (status = 'running' AND locked_at < NOW() - make_interval(secs => $4))
+                    )
+                    ORDER BY run_at, id
+                    LIMIT $2
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING *
+                """,
+                queue, limit, worker_id, float(lease_seconds)
+            )
+            return [dict(r) for r in rows]
+        except Exception as e:
+            logger.error(f"Error claiming jobs from {queue}: {e}")
+            return []
+
+    async def heartbeat_jobs(self, job_ids: List[int], worker_id: str) -> bool:
+        try:
+            await self.execute(
+                "UPDATE jobs SET locked_at = NOW() WHERE id = ANY($1) AND locked_by = $2 AND status = 'running'",
+                job_ids, worker_id
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Error extending job leases: {e}")
+            return False
+
+    async def complete_job(self, job_id: int) -> bool:
+        try:
+            await self.execute(
+                "UPDATE jobs SET status = 'done', finished_at = NOW(), last_error = NULL WHERE id = $1",
+                job_id
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Error completing job {job_id}: {e}")
+            return False
+
+    async def retry_job(self, job_id: int, error: str, delay_seconds: float) -> bool:
+        try:
+            await self.execute(
+                """
+                UPDATE jobs
+                SET status = 'pending', last_error = $2, locked_by = NULL,
+                    run_at = NOW() + make_interval(secs => $3)
+                WHERE id = $1
+                """,
+                job_id, error, float(delay_seconds)
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Error rescheduling job {job_id}: {e}")
+            return False
+
+    async def fail_job(self, job_id: int, error: str) -> bool:
+        try:
+            await self.execute(
+                "UPDATE jobs SET status = 'failed', last_error = $2, finished_at = NOW() WHERE id = $1",
+                job_id, error
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Error failing job {job_id}: {e}")
+            return False
+
+    async def release_jobs(self, job_ids: List[int]) -> bool:
+        """Hands interrupted jobs back (worker shutdown) without counting the attempt."""
+        try:
+            await self.execute(
+                """
+                UPDATE jobs SET status = 'pending', attempts = GREATEST(attempts - 1, 0), locked_by = NULL
+                WHERE id = ANY($1) AND status = 'running'
+                """,
+                job_ids
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Error releasing {len(job_ids)} jobs: {e}")
+            return False
+
+    async def purge_jobs(self, older_than_days: int) -> int:
+        try:
+            status = await self.execute(
+                "DELETE FROM jobs WHERE status = 'done' AND finished_at < NOW() - make_interval(days => $1)",
+                older_than_days
+            )
+            return int(status.split()[-1])
+        except Exception as e:
+            logger.error(f"Error purging jobs: {e}")
+            return 0
+
+    async def request_leaderboard_rebuild(self, conn=None):
+        """Coalesced, slightly delayed leaderboard rebuild instead of one per like."""
+        await self.enqueue_job(
+            "rebuild_leaderboard",
+            delay_seconds=LEADERBOARD_REBUILD_DELAY,
+            dedupe_key="rebuild_leaderboard",
+            conn=conn
+        )
+
+    # --- Scheduler State ---
+
+    async def is_scheduler_paused(self, name: str) -> bool:
+        try:
+            row = await self.fetchrow("SELECT paused FROM scheduler_state WHERE name = $1", name)
+            return bool(row and row["paused"])
+        except Exception as e:
+            logger.error(f"Error reading scheduler state for {name}: {e}")
+            return False
+
+    async def set_scheduler_paused(self, name: str, paused: bool, updated_by: Optional[int] = None) -> bool:
+        """Persists the flag and notifies the scheduler's channel so every instance picks it up now."""
+        try:
+            async with self._acquire() as conn:
+                async with conn.transaction():
+                    await conn.execute(
+                        """
+                        INSERT INTO scheduler_state (name, paused, updated_by, updated_at)
+                        VALUES ($1, $2, $3, NOW())
+                        ON CONFLICT (name) DO UPDATE
+                        SET paused = EXCLUDED.paused, updated_by = EXCLUDED.updated_by, updated_at = NOW()
+                        """,
+                        name, paused, updated_by
+                    )
+                    await conn.execute("SELECT pg_notify($1, 'state')", name)
+            return True
+        except Exception as e:
+            logger.error(f"Error setting scheduler {name} paused={paused}: {e}")
+            return False
+
+    # --- Notification Cursors ---
+
+    async def get_notification_cursor(self, job: str) -> int:
+        """Last user id a recurring notification job reached (0 = start of the user base)."""
+        try:
+            row = await self.fetchrow("SELECT last_user_id FROM notification_cursors WHERE job = $1", job)
+            return row["last_user_id"] if row else 0
+        except Exception as e:
+            logger.error(f"Error getting notification cursor for {job}: {e}")
+            return 0
+
+    async def set_notification_cursor(self, job: str, last_user_id: int) -> bool:
+        try:
+            await self.execute(
+                """
+                INSERT INTO notification_cursors (job, last_user_id, updated_at)
+                VALUES ($1, $2, NOW())
+                ON CONFLICT (job) DO UPDATE SET last_user_id = EXCLUDED.last_user_id, updated_at = NOW()
+                """,
+                job, last_user_id
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Error saving notification cursor for {job}: {e}")
+            return False
+
+    # --- FSM Storage ---
+
+    async def get_fsm_record(self, key: str) -> Optional[Tuple[Optional[str], Optional[bytes]]]:
+        """(state, serialized data) for an unexpired FSM key, or None."""
+        try:
+            row = await self.fetchrow(
+                "SELECT state, data FROM fsm_storage WHERE key = $1 AND expires_at > NOW()", key
+            )
+            return (row["state"], row["data"]) if row else None
+        except Exception as e:
+            logger.error(f"Error reading FSM record {key}: {e}")
+            return None
+
+    async def save_fsm_records(self, records: List[Tuple]) -> bool:
+        """
+        Upserts (key, state, data, set_state, set_data, ttl_seconds) tuples in
+        one round trip; a record only overwrites the fields it sets. Rows left
+        with no state and no data are removed.
+        """
+        try:
+            async with self._acquire() as conn:
+                async with conn.transaction():
+                    await conn.executemany(
+                        """
+                        INSERT INTO fsm_storage AS f (key, state, data, expires_at)
+                        VALUES ($1, $2, $3, NOW() + make_interval(secs => $6))
+                        ON CONFLICT (key) DO UPDATE SET
+                            state = CASE WHEN $4 THEN EXCLUDED.state
+                                         WHEN f.expires_at > NOW() THEN f.state END,
+                            data = CASE WHEN $5 THEN EXCLUDED.data
+                                        WHEN f.expires_at > NOW() THEN f.data END,
+                            expires_at = EXCLUDED.expires_at
+                        """,
+                        records
+                    )
+                    await conn.execute(
+                        "DELETE FROM fsm_storage WHERE key = ANY($1) AND state IS NULL AND data IS NULL",
+                        [r[0] for r in records]
+                    )
+            return True
+        except Exception as e:
+            logger.error(f"Error saving {len(records)} FSM records: {e}")
+            return False
+
+    async def purge_fsm_storage(self) -> int:
+        try:
+            result = await self.execute("DELETE FROM fsm_storage WHERE expires_at <= NOW()")
+            return int(result.split()[-1])
+        except Exception as e:
+            logger.error(f"Error purging FSM storage: {e}")
+            return 0
+
+    # --- Rate Limits ---
+
+    async def consume_rate_limit(self, key: str, cost: float, rate: float, burst: float,
+                                 now: float) -> Tuple[bool, float]:
+        """
+        Atomic GCRA check for a shared token bucket. Returns (allowed, retry_after).
+        Fails open: a database error lets the event through.
+        """
+        try:
+            row = await self.fetchrow(
+                """
+                INSERT INTO rate_limits AS r (key, tat, allowed)
+                VALUES ($1, $2::float8 + $3::float8 / $4::float8, TRUE)
+                ON CONFLICT (key) DO UPDATE SET
+                    tat = CASE WHEN GREATEST(r.tat, $2) + $3 / $4 - $2 <= $5::float8 / $4
+                               THEN GREATEST(r.tat, $2) + $3 / $4 ELSE r.tat END,
+                    allowed = GREATEST(r.tat, $2) + $3 / $4 - $2 <= $5 / $4
+                RETURNING tat, allowed
+                """,
+                key, float(now), float(cost), float(rate), float(burst)
+            )
+            if row["allowed"]:
+                return True, 0.0
+            return False, row["tat"] + cost / rate - now - burst / rate
+        except Exception as e:
+            logger.error(f"Error checking rate limit for {key}: {e}")
+            return True, 0.0
+
+    async def purge_rate_limits(self, now: float) -> int:
+        """Drops buckets that have refilled completely (same as having no row)."""
+        try:
+            result = await self.execute("DELETE FROM rate_limits WHERE tat <= $1", float(now))
+            return int(result.split()[-1])
+        except Exception as e:
+            logger.error(f"Error purging rate limits: {e}")
+            return 0
+
+    # --- Broadcast Jobs ---
+
+    async def create_broadcast_job(self, text: str, created_by: int, admin_chat_id: int) -> Optional[int]:
+        try:
+            total = await self.count_active_user_ids()
+            row = await self.fetchrow(
+                """
+                INSERT INTO broadcast_jobs (text, created_by, admin_chat_id, total)
+                VALUES ($1, $2, $3, $4)
+                RETURNING id
+                """,
+                text, created_by, admin_chat_id, total
+            )
+            return row["id"] if row else None
+        except Exception as e:
+            logger.error(f"Error creating broadcast job: {e}")
+            return None
+
+    async def get_broadcast_job(self, job_id: int) -> Optional[Dict]:
+        row = await self.fetchrow("SELECT * FROM broadcast_jobs WHERE id = $1", job_id)
+        return _dict_from_row(row)
+
+    async def get_broadcast_jobs_by_status(self, statuses: List[str]) -> List[Dict]:
+        rows = await self.fetch(
+            "SELECT * FROM broadcast_jobs WHERE status = ANY($1) ORDER BY id",
+            statuses
+        )
+        return [dict(r.items()) for r in rows]
+
+    async def get_recent_broadcast_jobs(self, limit: int = 5) -> List[Dict]:
+        rows = await self.fetch("SELECT * FROM broadcast_jobs ORDER BY id DESC LIMIT $1", limit)
+        return [dict(r.items()) for r in rows]
+
+    async def set_broadcast_status(self, job_id: int, status: str, from_statuses: Optional[List[str]] = None) -> bool:
+        """
+        Moves a job to a new status. If from_statuses is given the change only
+        applies while the job is in one of them (e.g. don't resume a cancelled job).
+        """
+        sql = """
+            UPDATE broadcast_jobs
+            SET status = $2,
+                updated_at = NOW(),
+                started_at = CASE WHEN $2 = 'running' THEN COALESCE(started_at, NOW()) ELSE started_at END,
+                finished_at = CASE WHEN $2 IN ('done', 'cancelled') THEN NOW() ELSE finished_at END
+            WHERE id = $1
+        """
+        params = [job_id, status]
+        if from_statuses:
+            sql += " AND status = ANY($3)"
+            params.append(from_statuses)
+        result = await self.execute(sql, *params)
+        return result.endswith(" 1")
+
+    async def set_broadcast_progress_message(self, job_id: int, message_id: int):
+        await self.execute(
+            "UPDATE broadcast_jobs SET progress_message_id = $2 WHERE id = $1",
+            job_id, message_id
+        )
+
+    async def checkpoint_broadcast(self, job_id: int, last_user_id: int, sent: int, failed: int) -> Optional[str]:
+        """Advances the cursor and counters after a batch. Returns the job's current status."""
+        row = await self.fetchrow(
+            """
+            UPDATE broadcast_jobs
+            SET last_user_id = $2, sent = sent + $3, failed = failed + $4, updated_at = NOW()
+            WHERE id = $1
+            RETURNING status
+            """,
+            job_id, last_user_id, sent, failed
+        )
+        return row["status"] if row else None
+
 
 db = Database()
 
@@ -2,13 +2,16 @@
 # Unified, paste-ready admin panel with FSM, pagination, broadcast,
 # and fully integrated ban/unban flows (with templates, notes, and unban requests).
 
+import html
 import random
+import time
 from aiogram import Router, F
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.types import (
     Message, CallbackQuery,
     ReplyKeyboardMarkup, KeyboardButton,
-    InlineKeyboardMarkup, InlineKeyboardButton
+    InlineKeyboardMarkup, InlineKeyboardButton,
+    BufferedInputFile
 )
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
@@ -20,6 +23,11 @@ from bot_config import ADMIN_GROUP_ID, CHANNEL_ID, COIN_REWARDS
 from database import db
 from services.content_builder import build_match_drop_text
 from services.match_queue_service import MatchQueueService
+from services.broadcast_service import BroadcastService, broadcast_controls_kb, format_progress
+from services.outbox import message_payload
+from middlewares.rate_limit import unban_requests_today
+from services.memory_diag import allocation_tracker, memory_stores, process_memory
+from services.profiler import profiler
 router = Router()
 
 logger = logging.getLogger(__name__)
@@ -240,12 +248,15 @@ async def approve_confession(callback: CallbackQuery):
                     tx_type="confession",
                     description=f"Confession #{confession_id} approved"
                 )
-            # Notify user privately
-            await callback.bot.send_message(
+            # Notify user privately (outbox)
+            await db.enqueue_outbox(
                 confession["sender_id"],
-                f"✅ Your confession #{confession_id} was approved!\n\n"
-                f"🪙 +{reward} coins have been added to your balance.\n\n"
-                "Check out @AAUPulse to see it live!"
+                "moderation",
+                message_payload(
+                    f"✅ Your confession #{confession_id} was approved!\n\n"
+                    f"🪙 +{reward} coins have been added to your balance.\n\n"
+                    "Check out @AAUPulse to see it live!"
+                )
             )
         except Exception as e:
             logger.warning(f"Could not add coins or notify user: {e}")
@@ -335,13 +346,11 @@ async def reject_reason(callback: CallbackQuery):
 
     reason_text = REJECT_REASONS.get(reason_key, REJECT_REASONS["other"])
 
-    try:
-        await callback.bot.send_message(
-            confession["sender_id"],
-            f"{reason_text}\n\nConfession #{confession_id}."
-        )
-    except Exception as e:
-        logger.warning(f"Could not notify user of rejection: {e}")
+    await db.enqueue_outbox(
+        confession["sender_id"],
+        "moderation",
+        message_payload(f"{reason_text}\n\nConfession #{confession_id}.")
+    )
 
     await callback.message.edit_text(
         f"❌ Confession #{confession_id} rejected and user notified.\nReason: {reason_key}"
@@ -372,17 +381,42 @@ async def broadcast_send(callback: CallbackQuery, state: FSMContext):
         return await callback.answer("⛔️ Admin only!")
     data = await state.get_data()
     text = data.get("text", "")
-    user_ids = await db.get_all_active_user_ids()
-    success, fail = 0, 0
-    for uid in user_ids:
-        try:
-            await callback.bot.send_message(uid, text, parse_mode=ParseMode.HTML)
-            success += 1
-        except Exception:
-            fail += 1
     await state.clear()
-    await callback.message.answer(f"✅ Broadcast complete!\nSuccess: {success}\nFailed: {fail}")
-    await callback.answer("Sent")
+
+    # Sending runs as a persisted background job; this handler returns right away
+    service = BroadcastService(db, callback.bot)
+    job_id = await service.create(text, callback.from_user.id, callback.message.chat.id)
+    if not job_id:
+        await callback.message.answer("❌ Could not start the broadcast. Check logs.")
+        return await callback.answer("Failed", show_alert=True)
+    await callback.answer(f"Broadcast #{job_id} started")
+
+@router.callback_query(F.data.regexp(r"^bcast_(pause|resume|cancel)_\d+$"))
+async def broadcast_control(callback: CallbackQuery):
+    if not is_admin(callback.from_user.id):
+        return await callback.answer("⛔️ Admin only!")
+    _, action, job_id = callback.data.split("_")
+    job_id = int(job_id)
+
+    service = BroadcastService(db, callback.bot)
+    if action == "pause":
+        ok = await service.pause(job_id)
+    elif action == "resume":
+        ok = await service.resume(job_id)
+    else:
+        ok = await service.cancel(job_id)
+
+    await callback.answer("Done ✅" if ok else "Not possible in the job's current state", show_alert=not ok)
+
+@router.message(Command("broadcasts"))
+async def broadcast_jobs_list(message: Message):
+    if not is_admin(message.from_user.id):
+        return
+    jobs = await db.get_recent_broadcast_jobs(limit=5)
+    if not jobs:
+        return await message.answer("No broadcasts yet.")
+    for job in jobs:
+        await message.answer(format_progress(job), reply_markup=broadcast_controls_kb(job["id"], job["status"]))
 
 @router.callback_query(F.data == "broadcast_cancel")
 async def broadcast_cancel(callback: CallbackQuery, state: FSMContext):
@@ -391,6 +425,121 @@ async def broadcast_cancel(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
+# --- Profiling ---
+PROFILE_USAGE = (
+    "🔬 <b>Profiling</b>\n"
+    "/profiler updates N handler_name|user_id — cProfile the next N matching updates\n"
+    "/profiler sample SECONDS — sample all stacks for SECONDS\n"
+    "/profiler stop — finish now and send the results"
+)
+
+
+def _fit_message(text: str, limit: int = 3900) -> str:
+    lines = text.splitlines()
+    while lines and len("\n".join(lines)) > limit:
+        lines.pop()
+    return "\n".join(lines)
+
+
+async def send_profile_report(bot, chat_id: int, report: dict):
+    title = html.escape(report["title"])
+    if not report["collapsed"]:
+        await bot.send_message(chat_id, f"🔬 {title}")
+        return
+    await bot.send_document(
+        chat_id,
+        BufferedInputFile(report["collapsed"].encode(), filename=f"profile-{int(time.time())}.collapsed"),
+        caption=f"🔬 {title}\nCollapsed stacks — open with flamegraph.pl or speedscope.app",
+    )
+    await bot.send_message(chat_id, f"<pre>{html.escape(_fit_message(report['top']))}</pre>")
+
+
+@router.message(Command("profiler"))
+async def profiler_command(message: Message, command: CommandObject):
+    if not is_admin(message.from_user.id):
+        return
+    args = (command.args or "").split()
+    bot, chat_id = message.bot, message.chat.id
+
+    async def deliver(report):
+        await send_profile_report(bot, chat_id, report)
+
+    if args == ["stop"]:
+        if not await profiler.finish():
+            await message.answer("No profiling session running.")
+        return
+
+    if len(args) == 3 and args[0] == "updates" and args[1].isdigit():
+        target = int(args[2]) if args[2].isdigit() else args[2]
+        session = profiler.start_updates(int(args[1]), target, deliver)
+    elif len(args) == 2 and args[0] == "sample" and args[1].isdigit():
+        session = profiler.start_sampling(int(args[1]), deliver)
+    else:
+        status = profiler.session.describe() if profiler.session else "No session running."
+        await message.answer(f"{PROFILE_USAGE}\n\n{html.escape(status)}")
+        return
+
+    if session is None:
+        await message.answer(f"⚠️ A session is already running: {html.escape(profiler.session.describe())}")
+        return
+    await message.answer(f"🔬 Started — {html.escape(session.describe())}")
+
+
+# --- Memory diagnostics ---
+MEMORY_USAGE = (
+    "/memory — in-memory stores and process RSS\n"
+    "/memory snapshot — top allocation sites (starts tracemalloc; becomes the diff baseline)\n"
+    "/memory diff — allocation growth since the last snapshot\n"
+    "/memory stop — stop tracemalloc"
+)
+
+
+def _format_bytes(n: float) -> str:
+    for unit in ("B", "KB", "MB"):
+        if n < 1024:
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} GB"
+
+
+@router.message(Command("memory"))
+async def memory_command(message: Message, command: CommandObject):
+    if not is_admin(message.from_user.id):
+        return
+    arg = (command.args or "").strip()
+
+    if arg == "snapshot":
+        started, lines = await allocation_tracker.snapshot()
+        note = "tracemalloc started — allocations before now are not tracked.\n" if started else ""
+        table = html.escape(_fit_message("\n".join(lines) or "No tracked allocations yet."))
+        await message.answer(f"🧠 <b>Top allocation sites</b>\n{note}<pre>{table}</pre>")
+    elif arg == "diff":
+        lines = await allocation_tracker.diff()
+        if lines is None:
+            await message.answer("Take a /memory snapshot first.")
+            return
+        table = html.escape(_fit_message("\n".join(lines) or "No change."))
+        await message.answer(f"🧠 <b>Growth since last snapshot</b>\n<pre>{table}</pre>")
+    elif arg == "stop":
+        stopped = allocation_tracker.stop()
+        await message.answer("tracemalloc stopped." if stopped else "tracemalloc was not running.")
+    elif arg:
+        await message.answer(MEMORY_USAGE)
+    else:
+        rows = memory_stores.report()  # on the loop: the stores are mutated by handlers
+        proc = process_memory()
+        lines = [f"{'store':<22} {'entries':>8} {'~size':>10}"]
+        for name, entries, size in rows:
+            lines.append(f"{name:<22} {entries if entries is not None else '-':>8} {_format_bytes(size):>10}")
+        header = "🧠 <b>Memory</b>"
+        if proc:
+            header += f"\nRSS {_format_bytes(proc.get('rss', 0))} (peak {_format_bytes(proc.get('peak_rss', 0))})"
+        if allocation_tracker.tracing:
+            header += "\n⚠️ tracemalloc is running (/memory stop)"
+        table = html.escape(_fit_message("\n".join(lines)))
+        await message.answer(f"{header}\n<pre>{table}</pre>")
+
+
 # --- User Management menu ---
 def get_user_management_panel() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -616,31 +765,24 @@ async def moderation_confirm(callback: CallbackQuery, state: FSMContext):
 
     try:
         if action == "ban":
-            # Unified helper (stores note if supported)
-            ok = await db.set_user_banned(uid, True)  # change to (uid, True, note) if your helper supports note
+            # Ban and the note to the user are written in one transaction (outbox)
+            notice = message_payload(f"🚫 You’ve been banned.\n\n📝 Note from admin:\n{note}")
+            ok = await db.set_user_banned(uid, True, notice=notice)
             if not ok:
                 raise RuntimeError("DB set_user_banned failed")
 
-            try:
-                await callback.bot.send_message(uid, f"🚫 You’ve been banned.\n\n📝 Note from admin:\n{note}")
-            except Exception:
-                pass
             await callback.message.answer(f"User {uid} banned. Note sent.")
         else:
-            ok = await db.set_user_banned(uid, False)  # change to (uid, False) plus note as context if you store
-            if not ok:
-                raise RuntimeError("DB set_user_banned failed")
-
             card = (
                 "✅ You’ve been unbanned\n\n"
                 "Here’s the context so you’re informed:\n"
                 f"• Previous ban reason: {note}\n\n"
                 "Please keep the community respectful. Reach out if you have questions."
             )
-            try:
-                await callback.bot.send_message(uid, card)
-            except Exception:
-                pass
+            ok = await db.set_user_banned(uid, False, notice=message_payload(card))
+            if not ok:
+                raise RuntimeError("DB set_user_banned failed")
+
             await callback.message.answer(f"User {uid} unbanned. Card sent.")
     except Exception as e:
         logger.error(f"Moderation error: {e}")
@@ -686,8 +828,7 @@ async def delete_user(callback: CallbackQuery):
 
 
 # --- Unban request flow (user -> admin group) ---
-# In-memory tracker for per-day unban requests
-unban_requests_today = {}  # {user_id: {"date": date, "count": int}}
+# Per-day unban request counts live in middlewares.rate_limit.unban_requests_today
 
 @router.message(F.text == "🙏 Request Unban")
 async def request_unban(message: Message):
@@ -740,14 +881,12 @@ async def admin_unban_request(callback: CallbackQuery):
     if not is_admin(callback.from_user.id):
         return await callback.answer("⛔️ Admin only!")
     user_id = int(callback.data.split("_")[-1])
-    ok = await db.set_user_banned(user_id, False)
+    ok = await db.set_user_banned(
+        user_id, False, notice=message_payload("✅ Your unban request was approved. Welcome back!")
+    )
     if ok:
         await callback.answer("✅ User unbanned")
         await callback.message.answer(f"User {user_id} has been unbanned.")
-        try:
-            await callback.bot.send_message(user_id, "✅ Your unban request was approved. Welcome back!")
-        except Exception:
-            pass
     else:
         await callback.answer("❌ Failed", show_alert=True)
 
@@ -758,10 +897,9 @@ async def admin_ignore_request(callback: CallbackQuery):
     user_id = int(callback.data.split("_")[-1])
     await callback.answer("❌ Request ignored")
     await callback.message.answer(f"Unban request from user {user_id} was ignored.")
-    try:
-        await callback.bot.send_message(user_id, "❌ Your unban request was reviewed but not approved.")
-    except Exception:
-        pass
+    await db.enqueue_outbox(
+        user_id, "moderation", message_payload("❌ Your unban request was reviewed but not approved.")
+    )
 
 
 
@@ -776,6 +914,7 @@ from aiogram.fsm.state import StatesGroup, State
 
 from services.match_queue_service import MatchQueueService
 from services.content_builder import build_match_drop_text
+from scheduler.match_queue_scheduler import match_queue_scheduler
 from bot_config import ADMIN_GROUP_ID, CHANNEL_ID
 from database import Database  # your DB wrapper / pool type
 
@@ -811,9 +950,6 @@ def get_scheduler_menu() -> ReplyKeyboardMarkup:
         input_field_placeholder="⚙️ Scheduler controls..."
     )
 
-# In-memory scheduler flag (consider persisting for restarts)
-scheduler_running = True
-
 # --- Open scheduler menu (safe delete_reply_markup) ---
 @router.message(F.text == "⚙️ Scheduler Controls")
 async def open_scheduler_menu(message: Message, bot: Bot):
@@ -835,25 +971,34 @@ async def back_to_admin_menu(message: Message):
 @router.message(F.text == "⚡️ Post Now")
 async def admin_post_now(message: Message, bot: Bot):
     service = MatchQueueService(db, bot)
-    items = await service.get_due_items()
+    # Lease the top item (committed) so the scheduler can't post it at the same time
+    items = await service.claim_due_items(1)
     if not items:
         await message.answer("No due matches right now.")
         return
 
-    ranked = sorted(items, key=lambda i: service.compute_score(i), reverse=True)
-    item = ranked[0]
+    item = items[0]
+    # Marked sent before posting, so a posted item can't be claimed again
+    try:
+        await service.mark_sent(item["id"])
+    except Exception as e:
+        logger.error(f"Could not mark match queue item {item['id']} sent: {e}")
+        await message.answer(f"Not posted: marking queue ID {item['id']} sent failed: {e}")
+        return
+
     try:
         text = build_match_drop_text(item)
         await bot.send_message(CHANNEL_ID, text)
-        await service.mark_sent(item["id"])
-        await bot.send_message(
-            ADMIN_GROUP_ID,
-            f"⚡️ FORCE POSTED\nQueue ID: {item['id']}\nBy: {message.from_user.id}"
-        )
-        await message.answer(f"Force posted queue ID {item['id']}")
     except Exception as e:
-        await service.record_error(item["id"], str(e))
+        await service.record_error(item["id"], str(e))  # back to unsent
         await message.answer(f"Error posting item {item['id']}: {e}")
+        return
+
+    await message.answer(f"Force posted queue ID {item['id']}")
+    await bot.send_message(
+        ADMIN_GROUP_ID,
+        f"⚡️ FORCE POSTED\nQueue ID: {item['id']}\nBy: {message.from_user.id}"
+    )
         
         
 # --- Delete Match (stateful) ---
@@ -898,13 +1043,11 @@ async def admin_delete_invalid(message: Message, state: FSMContext):
     await message.answer("Please send a numeric Queue ID or type Cancel.")
 
 # --- Stop / Start Scheduler ---
-scheduler_running = True  # global flag
-
 @router.message(F.text == "⏹ Stop Scheduler")
-async def admin_stop_scheduler(message: Message):
-    from bot import bot
-    global scheduler_running
-    scheduler_running = False
+async def admin_stop_scheduler(message: Message, bot: Bot):
+    if not await match_queue_scheduler.stop(message.from_user.id):
+        await message.answer("❌ Could not stop the scheduler. Check logs.", reply_markup=get_scheduler_menu())
+        return
     await message.answer("Scheduler stopped.", reply_markup=get_scheduler_menu())
     await bot.send_message(
         ADMIN_GROUP_ID,
@@ -912,10 +1055,10 @@ async def admin_stop_scheduler(message: Message):
     )
 
 @router.message(F.text == "▶ Start Scheduler")
-async def admin_start_scheduler(message: Message):
-    from bot import bot
-    global scheduler_running
-    scheduler_running = True
+async def admin_start_scheduler(message: Message, bot: Bot):
+    if not await match_queue_scheduler.resume(message.from_user.id):
+        await message.answer("❌ Could not start the scheduler. Check logs.", reply_markup=get_scheduler_menu())
+        return
     await message.answer("Scheduler started.", reply_markup=get_scheduler_menu())
     await bot.send_message(
         ADMIN_GROUP_ID,
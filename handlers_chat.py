@@ -20,6 +20,8 @@ from database import db
 
 from utils import calculate_vibe_compatibility, format_profile_text, get_random_icebreaker, vibe_label
 from handlers_main import show_main_menu
+from services.memory_diag import memory_stores
+from services.outbound import Priority, outbound_priority
 import random
 logger = logging.getLogger(__name__)
 router = Router()
@@ -49,10 +51,14 @@ active_chats: Dict[int, Dict] = {}
 # Per-user pinned profile card: user_id -> { match_id -> pinned_message_id }
 pinned_cards: Dict[int, Dict[int, int]] = {}
 
-# Map messageId (on receiver side) to a logical chat message for reaction/engaging reply
-# receiver_user_id -> { message_id -> { 'match_id': int, 'sender_id': int } }
+# Map chats.id to the relayed message for reactions and quoted replies
+# match_id -> { chat_msg_id -> { 'sender_id': int, 'text': str, 'message_id': receiver-side message_id } }
 message_map: Dict[int, Dict[int, Dict]] = {}
 
+memory_stores.register("chat.active_chats", lambda: active_chats)
+memory_stores.register("chat.pinned_cards", lambda: pinned_cards)
+memory_stores.register("chat.message_map", lambda: message_map)
+
 
 # ---------- UI helpers ----------
 
@@ -289,7 +295,7 @@ async def handle_unmatch(callback: CallbackQuery, state: FSMContext):
 
     # Fetch the updated match row for notifications
     updated_match = await db.get_match_by_id(match_id)
-    logger.info(f"Updated match after unmatch: {updated_match}")
+    logger.debug("Updated match after unmatch: %s", updated_match)
 
     # Clean up active session and pinned state
     active_chats.pop(user_id, None)
@@ -370,17 +376,36 @@ chat_actions_kb = ReplyKeyboardMarkup(
 )
 
 
-def build_message_actions(match_id: int, msg_id: int) -> InlineKeyboardMarkup:
+def build_message_actions(match_id: int, chat_msg_id: int) -> InlineKeyboardMarkup:
+    """
+    Reply/reaction buttons for a relayed message. Keyed by our own chats.id
+    (known before sending), so the keyboard goes out with the message itself.
+    """
     return InlineKeyboardMarkup(inline_keyboard=[
         [
-            InlineKeyboardButton(text="💬 Reply", callback_data=f"reply_{match_id}_{msg_id}"),
-            InlineKeyboardButton(text="❤️", callback_data=f"react_{match_id}_heart_{msg_id}"),
-            InlineKeyboardButton(text="😂", callback_data=f"react_{match_id}_laugh_{msg_id}"),
-            InlineKeyboardButton(text="🔥", callback_data=f"react_{match_id}_fire_{msg_id}"),
+            InlineKeyboardButton(text="💬 Reply", callback_data=f"reply_{match_id}_{chat_msg_id}"),
+            InlineKeyboardButton(text="❤️", callback_data=f"react_{match_id}_heart_{chat_msg_id}"),
+            InlineKeyboardButton(text="😂", callback_data=f"react_{match_id}_laugh_{chat_msg_id}"),
+            InlineKeyboardButton(text="🔥", callback_data=f"react_{match_id}_fire_{chat_msg_id}"),
         ]
     ])
 
 
+async def get_relayed_message(match_id: int, chat_msg_id: int) -> Optional[dict]:
+    """
+    Looks up a relayed message for reactions/replies. Falls back to the chats
+    table when the in-memory map was lost (restart, other worker).
+    """
+    original = message_map.get(match_id, {}).get(chat_msg_id)
+    if original:
+        return original
+
+    row = await db.get_chat_message(chat_msg_id)
+    if not row or row["match_id"] != match_id:
+        return None
+    return {"sender_id": row["sender_id"], "text": row["message"]}
+
+
 
 def sent_confirmation_variants(to_name: str) -> List[str]:
     to_display = h(to_name)
@@ -778,8 +803,8 @@ async def handle_chat_message(message: Message, state: FSMContext):
         return
 
     # --- Persist ---
-    success = await db.save_chat_message(match_id, user_id, content_text)
-    if not success:
+    chat_msg_id = await db.save_chat_message(match_id, user_id, content_text)
+    if not chat_msg_id:
         await message.answer("Failed to send message 💀")
         return
 
@@ -834,22 +859,26 @@ async def handle_chat_message(message: Message, state: FSMContext):
 
     # --- Reply quoting context ---
     data = await state.get_data()
-    logger.info(f"FSM data before send: {data}")
     reply_to_msg_id = data.get("reply_to_msg_id")
     reply_to_chat_id = data.get("reply_to_chat_id")
 
-    kwargs = {"parse_mode": ParseMode.HTML}
+    # Actions are keyed by chats.id, so the keyboard rides along with the send
+    kwargs = {
+        "parse_mode": ParseMode.HTML,
+        "reply_markup": build_message_actions(match_id, chat_msg_id),
+    }
     quoted_text = ""
 
+    original = None
     if reply_to_msg_id:
-        original = message_map.get(match_id, {}).get(reply_to_msg_id)
+        original = await get_relayed_message(match_id, reply_to_msg_id)
         if original and original.get("text"):
             quoted_text = f"🔁 Replying to: {h(original['text'])}\n\n"
 
     # Only set reply_to_message_id if sending into the same chat;
     # otherwise, anchor to the receiver's pinned card if available
-    if message.chat.id == other_user_id and reply_to_msg_id:
-        kwargs["reply_to_message_id"] = reply_to_msg_id
+    if message.chat.id == other_user_id and original and original.get("message_id"):
+        kwargs["reply_to_message_id"] = original["message_id"]
     elif receiver_pinned_id:
         kwargs["reply_to_message_id"] = receiver_pinned_id
 
@@ -857,39 +886,34 @@ async def handle_chat_message(message: Message, state: FSMContext):
 
     # --- Send media or text ---
     try:
-        if message.voice:
-            sent = await message.bot.send_voice(
-                other_user_id,
-                voice=message.voice.file_id,
-                caption=notification,
-                **kwargs
-            )
-        elif message.photo:
-            sent = await message.bot.send_photo(
-                other_user_id,
-                photo=message.photo[-1].file_id,
-                caption=notification,
-                **kwargs
-            )
-        elif message.sticker:
-            await message.bot.send_sticker(other_user_id, message.sticker.file_id)
-            sent = await message.bot.send_message(other_user_id, notification, **kwargs)
-        else:
-            sent = await message.bot.send_message(other_user_id, notification, **kwargs)
-
-        # Build inline keyboard AFTER sending
-        actions_kb = build_message_actions(match_id, sent.message_id)
-        await message.bot.edit_message_reply_markup(
-            chat_id=other_user_id,
-            message_id=sent.message_id,
-            reply_markup=actions_kb
-        )
+        with outbound_priority(Priority.CHAT_RELAY):
+            if message.voice:
+                sent = await message.bot.send_voice(
+                    other_user_id,
+                    voice=message.voice.file_id,
+                    caption=notification,
+                    **kwargs
+                )
+            elif message.photo:
+                sent = await message.bot.send_photo(
+                    other_user_id,
+                    photo=message.photo[-1].file_id,
+                    caption=notification,
+                    **kwargs
+                )
+            elif message.sticker:
+                await message.bot.send_sticker(other_user_id, message.sticker.file_id)
+                sent = await message.bot.send_message(other_user_id, notification, **kwargs)
+            else:
+                sent = await message.bot.send_message(other_user_id, notification, **kwargs)
 
-        # ✅ Track message for reactions and replies keyed by match_id
+        # ✅ Track message for reactions and replies keyed by match_id -> chats.id
         msg_map = message_map.setdefault(match_id, {})
-        msg_map[sent.message_id] = {"sender_id": user_id, "text": content_text}
-        logger.info(f"Built actions for match {match_id}, receiver_msg_id={sent.message_id}")
-        logger.info(f"Replying with reply_to_message_id={reply_to_msg_id} in chat {other_user_id}")
+        msg_map[chat_msg_id] = {"sender_id": user_id, "text": content_text, "message_id": sent.message_id}
+        logger.debug(
+            "Relayed chat message %s for match %s, receiver_msg_id=%s, reply_to=%s",
+            chat_msg_id, match_id, sent.message_id, reply_to_msg_id,
+        )
 
         # Clear reply_to only after successful send
         if reply_to_msg_id:
@@ -938,7 +962,7 @@ async def inline_reply_click(callback: CallbackQuery, state: FSMContext):
     }
     await state.set_state(ChatState.in_chat)
 
-    # ✅ store both message_id and chat_id for reply
+    # ✅ store the replied chats.id (and our chat id) for the quoted reply
     await state.update_data(
         active_chat=match_id,
         reply_to_msg_id=replied_msg_id,
@@ -968,7 +992,7 @@ async def inline_reply_click(callback: CallbackQuery, state: FSMContext):
         "💬 Reply mode on — type something sweet or drop a voice note 🎙️",
         reply_markup=back_to_crushes_kb
     )
-    logger.info(f"Reply click: match_id={match_id}, replied_msg_id={replied_msg_id}")
+    logger.debug("Reply click: match_id=%s, replied_msg_id=%s", match_id, replied_msg_id)
 
     await callback.answer()
 
@@ -986,9 +1010,8 @@ async def react_to_message(callback: CallbackQuery):
 
     emoji = {"heart": "❤️", "laugh": "😂", "fire": "🔥"}.get(emoji_key, "✨")
 
-    # Look up original sender + text from message_map keyed by match_id
-    msg_map = message_map.get(match_id, {})
-    original = msg_map.get(msg_id)
+    # Look up original sender + text by chats.id
+    original = await get_relayed_message(match_id, msg_id)
 
     if original:
         sender_id = original.get("sender_id")
@@ -1123,7 +1146,8 @@ async def confirm_icebreaker(callback: CallbackQuery, state: FSMContext):
     other_user_id = chat["other_user_id"]
 
     # Save to DB
-    if not await db.save_chat_message(match_id, user_id, icebreaker):
+    chat_msg_id = await db.save_chat_message(match_id, user_id, icebreaker)
+    if not chat_msg_id:
         await callback.answer("Failed to send 💀")
         return
 
@@ -1155,30 +1179,23 @@ async def confirm_icebreaker(callback: CallbackQuery, state: FSMContext):
     sender_name = h(sender_user["name"]) if chat["revealed"] else "Anonymous 🎭"
     notification = bubble(f"💬 {sender_name}", h(icebreaker))
 
-    # Send message first
+    # Send message with its action keyboard in one call
     try:
-        sent = await callback.bot.send_message(other_user_id, notification, parse_mode=ParseMode.HTML)
+        with outbound_priority(Priority.CHAT_RELAY):
+            sent = await callback.bot.send_message(
+                other_user_id,
+                notification,
+                parse_mode=ParseMode.HTML,
+                reply_markup=build_message_actions(match_id, chat_msg_id)
+            )
     except Exception as e:
         logger.error(f"Could not notify other user: {e}")
         await callback.answer("Failed to send icebreaker 💀")
         return
 
-    # Build inline keyboard now that we have sent.message_id
-    actions_kb = build_message_actions(match_id, sent.message_id)
-
-    # Edit message to add inline keyboard
-    try:
-        await callback.bot.edit_message_reply_markup(
-            chat_id=other_user_id,
-            message_id=sent.message_id,
-            reply_markup=actions_kb
-        )
-    except Exception:
-        pass
-
     # Track message for reactions/replies
-    msg_map = message_map.setdefault(other_user_id, {})
-    msg_map[sent.message_id] = {"match_id": match_id, "sender_id": user_id}
+    msg_map = message_map.setdefault(match_id, {})
+    msg_map[chat_msg_id] = {"sender_id": user_id, "text": icebreaker, "message_id": sent.message_id}
 
     # Clear FSM
     await state.update_data(pending_icebreaker=None, pending_match=None, icebreaker_rotations=0)
@@ -18,6 +18,8 @@ from handlers_chat import get_match_data_for_chat
 from handlers_crushes import _render_crush_list_view
 from handlers_main import get_main_menu_keyboard
 from handlers_matching import get_swiping_reply_keyboard, show_candidate, start_matching_flow
+from services.outbound import Priority
+from services.outbox import message_payload
 from utils import calculate_vibe_compatibility, format_profile_text, vibe_label
 
 router = Router()
@@ -52,21 +54,22 @@ def liked_notification_keyboard(liker_id: int) -> InlineKeyboardMarkup:
 
 
 async def notify_like(bot, liker_id: int, liked_id: int):
-    """Notify the liked user that someone liked them with an inline keyboard."""
-    try:
-        await bot.send_message(
-            liked_id,
+    """Queue a notification (outbox) telling the liked user that someone liked them."""
+    await db.enqueue_outbox(
+        liked_id,
+        "like",
+        message_payload(
             (
                 "👀 Someone just liked you!\n\n"
                 "To see the full list of admirers, head to:\n"
                 "👉 <b>💖 My Crushes → 👀 Who Liked Me</b>\n\n"
                 "From there you can explore who’s interested and decide your next move."
             ),
-            reply_markup=liked_notification_keyboard(liker_id),
-            parse_mode="HTML"
-        )
-    except Exception as e:
-        logger.warning("Could not notify %s of new like: %s", liked_id, e)
+            parse_mode="HTML",
+            reply_markup=liked_notification_keyboard(liker_id)
+        ),
+        priority=Priority.CHAT_RELAY
+    )
 
 
 # -----------------------
@@ -465,6 +468,15 @@ async def celebrate_match(bot, user_id: int, other_id: int, match_id: int, conte
     except Exception as e:
         logger.error(f"[celebrate_match] Failed to add match reward coins: {e}")
 
+    async def queue_celebration(to_user: int, caption: str, actions_kb: InlineKeyboardMarkup):
+        # Sent by the outbox worker; the handler only writes the row
+        await db.enqueue_outbox(
+            to_user,
+            "match_celebration",
+            message_payload(caption, parse_mode=ParseMode.HTML, reply_markup=actions_kb),
+            priority=Priority.INTERACTIVE
+        )
+
     # Fetch match row
     match_row = await db.get_active_match_between(user_id, other_id)
     initiator_id = match_row.get("initiator_id") if match_row else None
@@ -513,7 +525,7 @@ async def celebrate_match(bot, user_id: int, other_id: int, match_id: int, conte
                 f"💰 +10 coins added!\n"
                 f"Use the buttons below to start chatting or view profile."
             )
-            await bot.send_message(to_user, caption, reply_markup=actions_kb, parse_mode=ParseMode.HTML)
+            await queue_celebration(to_user, caption, actions_kb)
             return
 
         # --- Second liker who liked before (flip reveal in DB, keep your logic) ---
@@ -536,7 +548,7 @@ async def celebrate_match(bot, user_id: int, other_id: int, match_id: int, conte
                 f"💰 +10 coins added!\n"
                 f"Use the buttons below to start chatting or view profile."
             )
-            await bot.send_message(to_user, caption, reply_markup=actions_kb, parse_mode=ParseMode.HTML)
+            await queue_celebration(to_user, caption, actions_kb)
             return
 
         # --- Default second liker: identity-hidden profile text (unchanged) ---
@@ -556,7 +568,7 @@ async def celebrate_match(bot, user_id: int, other_id: int, match_id: int, conte
             f"{profile_text}\n\n"
             f"💰 +10 coins added!"
         )
-        await bot.send_message(to_user, caption, reply_markup=actions_kb, parse_mode=ParseMode.HTML)
+        await queue_celebration(to_user, caption, actions_kb)
     # Deliver to both users
     await send_profile(
         bot,
@@ -1,9 +1,11 @@
 from aiogram import Router, F, html
-from aiogram.types import Message, CallbackQuery, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardRemove
+from aiogram.filters import ChatMemberUpdatedFilter, KICKED, MEMBER
+from aiogram.types import Message, CallbackQuery, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardRemove, ChatMemberUpdated
 from database import db
 from services.match_queue_service import MatchQueueService
 from utils import generate_referral_link, get_random_icebreaker
 from handlers_profile import show_edit_profile_menu_from_main # Import the new function
+from services.reachability import unreachable_writer
 from aiogram.fsm.context import FSMContext
 import logging
 from typing import Tuple
@@ -304,5 +306,19 @@ async def mini_games(message: Message):
 
 
 
+# --- Bot blocked / unblocked by the user ---
+@router.my_chat_member(F.chat.type == "private", ChatMemberUpdatedFilter(member_status_changed=KICKED))
+async def bot_blocked(event: ChatMemberUpdated):
+    # Picked up by the batched writer; fan-outs stop targeting this user
+    unreachable_writer.add(event.from_user.id)
+    logger.info("User %s blocked the bot", event.from_user.id)
+
+@router.my_chat_member(F.chat.type == "private", ChatMemberUpdatedFilter(member_status_changed=MEMBER))
+async def bot_unblocked(event: ChatMemberUpdated):
+    unreachable_writer.discard(event.from_user.id)
+    await db.set_user_reachable(event.from_user.id)
+    logger.info("User %s unblocked the bot", event.from_user.id)
+
+
 #test Mode
 
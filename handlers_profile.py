@@ -14,6 +14,7 @@ from typing import Callable, Dict, List, Tuple, Optional, Union
 from database import db
 from bot_config import AAU_CAMPUSES, AAU_DEPARTMENTS, ADMIN_GROUP_ID, INTEREST_CATEGORIES, YEARS, GENDERS, VIBE_QUESTIONS, MAX_BIO_LENGTH
 from utils import calculate_vibe_compatibility, format_profile_text, validate_bio, download_and_resize_image
+from middlewares.rate_limit import unban_requests_today
 
 logger = logging.getLogger(__name__)
 router = Router()
@@ -606,6 +607,9 @@ async def cmd_start(message: Message, state: FSMContext):
             logger.warning(f"Invalid referrer ID received: {message.text}")
 
     if user:
+        if user.get("is_reachable") is False:
+            # They are talking to us again, so sends will work
+            await db.set_user_reachable(user_id)
         from handlers_main import show_main_menu
         await show_main_menu(message)
     else:
@@ -1076,7 +1080,6 @@ async def finish_interests(callback: CallbackQuery, state: FSMContext):
     await state.clear()
     await callback.answer()
 
-unban_requests_today = {} 
 # --- View Profile Handlers (Uses the new helper) ---
 @router.message(F.text == "🙏 Request Unban")
 async def request_unban(message: Message):
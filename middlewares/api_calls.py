@@ -0,0 +1,84 @@
+import logging
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import Update
+
+logger = logging.getLogger(__name__)
+
+# Per-update tally of outbound Bot API calls: method name -> count.
+# Set by UpdateCallCounterMiddleware, incremented by OutboundCallCounter.
+_update_calls: ContextVar[Optional[Counter]] = ContextVar("update_api_calls", default=None)
+
+
+class ApiCallStats:
+    """Process-wide totals used to compare outbound calls per update."""
+
+    def __init__(self):
+        self.updates = 0
+        self.calls_in_updates = 0
+        self.calls_outside_updates = 0
+        self.calls_by_method: Counter = Counter()
+        self.max_calls_per_update = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "updates": self.updates,
+            "calls_in_updates": self.calls_in_updates,
+            "calls_outside_updates": self.calls_outside_updates,
+            "avg_calls_per_update": round(self.calls_in_updates / self.updates, 3) if self.updates else 0.0,
+            "max_calls_per_update": self.max_calls_per_update,
+            "calls_by_method": dict(self.calls_by_method),
+        }
+
+
+api_call_stats = ApiCallStats()
+
+
+class OutboundCallCounter(BaseRequestMiddleware):
+    """Bot session middleware: counts every Bot API request by method."""
+
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        api_call_stats.calls_by_method[name] += 1
+
+        calls = _update_calls.get()
+        if calls is not None:
+            calls[name] += 1
+        else:
+            # Scheduler jobs, background tasks, startup
+            api_call_stats.calls_outside_updates += 1
+
+        return await make_request(bot, method)
+
+
+class UpdateCallCounterMiddleware(BaseMiddleware):
+    """Outer update middleware: opens a fresh counter for each incoming update."""
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        calls = Counter()
+        token = _update_calls.set(calls)
+        try:
+            return await handler(event, data)
+        finally:
+            _update_calls.reset(token)
+
+            total = sum(calls.values())
+            api_call_stats.updates += 1
+            api_call_stats.calls_in_updates += total
+            api_call_stats.max_calls_per_update = max(api_call_stats.max_calls_per_update, total)
+            logger.debug("Update %s made %d Bot API calls: %s", event.update_id, total, dict(calls))
+
+
+def current_update_calls() -> Dict[str, int]:
+    """Calls made so far while handling the current update (empty outside handlers)."""
+    calls = _update_calls.get()
+    return dict(calls) if calls is not None else {}
@@ -0,0 +1,22 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+from services.fsm_storage import PostgresStorage
+
+
+class FSMWriteCoalescingMiddleware(BaseMiddleware):
+    """Outer update middleware: FSM writes made while handling an update are saved together when it ends."""
+
+    def __init__(self, storage: PostgresStorage):
+        self.storage = storage
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        async with self.storage.update_scope():
+            return await handler(event, data)
@@ -0,0 +1,37 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from services.metrics import handler_errors_total, handler_seconds, updates_total
+from services.tracing import tracer
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner middleware: counts and times each handler, labelled by its module and function."""
+
+    def __init__(self, event: str):
+        self.event = event
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        handler_object = data.get("handler")
+        callback = getattr(handler_object, "callback", None)
+        router = getattr(callback, "__module__", "unknown")
+        name = getattr(callback, "__name__", "unknown")
+
+        updates_total.inc(event=self.event, router=router, handler=name)
+        tracer.annotate(router=router, handler=name)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors_total.inc(router=router, handler=name)
+            raise
+        finally:
+            handler_seconds.observe(time.perf_counter() - started, router=router, handler=name)
@@ -0,0 +1,35 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from services.profiler import UpdateProfileSession, profiler
+
+
+class ProfilingMiddleware(BaseMiddleware):
+    """Inner middleware: runs handlers under cProfile while an admin update-profiling session wants them."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        session = profiler.session
+        if not isinstance(session, UpdateProfileSession):
+            return await handler(event, data)
+
+        callback = getattr(data.get("handler"), "callback", None)
+        user = data.get("event_from_user")
+        if not session.matches(
+            user.id if user else None,
+            getattr(callback, "__module__", ""),
+            getattr(callback, "__name__", ""),
+        ):
+            return await handler(event, data)
+
+        try:
+            with session.profiling():
+                return await handler(event, data)
+        finally:
+            profiler.on_update_done(session)
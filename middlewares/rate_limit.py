@@ -2,18 +2,52 @@ from asyncio.log import logger
 import random
 from aiogram import BaseMiddleware
 from aiogram.types import Message, CallbackQuery
-from typing import Callable, Dict, Any, Awaitable
-from datetime import datetime, timedelta
+from typing import Callable, Dict, Any, Awaitable, Optional, Tuple
+from datetime import timedelta
 import json
 
-from bot_config import RATE_LIMIT_MESSAGES
-from database import Database
+from bot_config import RATE_LIMIT_BACKEND, RATE_LIMIT_MESSAGES
+from database import Database, db
+from services.ban_cache import banned_users
+from services.memory_diag import memory_stores
+from services.rate_limiter import (
+    COST_CHAT, COST_DECK, COST_TAP, MemoryBucketStore, PostgresBucketStore, TokenBucketLimiter
+)
+
+
+# Events that build a candidate deck; chat relays are cheaper than taps
+DECK_TEXTS = {"❤️ Find Matches"}
+DECK_CALLBACKS = {"start_swiping", "start_swiping_from_filter"}
+CHAT_STATE = "ChatState:in_chat"
+
+
+def action_cost(event: Message | CallbackQuery, raw_state: Optional[str]) -> Tuple[str, float]:
+    """Maps an event to its cost class: (action, tokens)."""
+    if isinstance(event, CallbackQuery):
+        if event.data in DECK_CALLBACKS:
+            return "deck", COST_DECK
+        return "tap", COST_TAP
+    if event.text in DECK_TEXTS:
+        return "deck", COST_DECK
+    if raw_state == CHAT_STATE:
+        return "chat", COST_CHAT
+    return "tap", COST_TAP
 
 
 class RateLimitMiddleware(BaseMiddleware):
-    def __init__(self, rate_limit: int = 1):
-        self.rate_limit = rate_limit
-        self.user_last_action: Dict[int, datetime] = {}
+    """
+    Per-user token bucket shared by messages and callbacks (register one
+    instance on both). Throttled callbacks get an alert; messages are
+    dropped silently so the chat stays clean.
+    """
+
+    def __init__(self, limiter: Optional[TokenBucketLimiter] = None):
+        if limiter is None:
+            store = PostgresBucketStore(db) if RATE_LIMIT_BACKEND == "postgres" else MemoryBucketStore()
+            limiter = TokenBucketLimiter(store)
+        self.limiter = limiter
+        if isinstance(limiter.store, MemoryBucketStore):
+            memory_stores.register("rate_limit_buckets", limiter.store.buckets)
 
     async def __call__(
         self,
@@ -21,21 +55,18 @@ class RateLimitMiddleware(BaseMiddleware):
         event: Message | CallbackQuery,
         data: Dict[str, Any]
     ) -> Any:
-        user_id = event.from_user.id
-        now = datetime.now()
-
-        if user_id in self.user_last_action:
-            time_passed = (now - self.user_last_action[user_id]).total_seconds()
-            if time_passed < self.rate_limit:
-                rate_limit_msg = random.choice(RATE_LIMIT_MESSAGES)
+        if not event.from_user:
+            return await handler(event, data)
 
-                if isinstance(event, CallbackQuery):
-                    # Show popup with OK button
-                    await event.answer(rate_limit_msg, show_alert=True)
-                # For Message events, just ignore (no chat clutter)
-                return
+        action, cost = action_cost(event, data.get("raw_state"))
+        allowed, _ = await self.limiter.hit(event.from_user.id, cost, action)
+        if not allowed:
+            if isinstance(event, CallbackQuery):
+                # Show popup with OK button
+                await event.answer(random.choice(RATE_LIMIT_MESSAGES), show_alert=True)
+            # For Message events, just ignore (no chat clutter)
+            return
 
-        self.user_last_action[user_id] = now
         return await handler(event, data)
 
 
@@ -63,12 +94,12 @@ class GracefulFallbackMiddleware(BaseMiddleware):
 import logging
 from aiogram import BaseMiddleware
 from aiogram.types import Message, CallbackQuery, ReplyKeyboardMarkup, KeyboardButton
-from datetime import datetime, date
 
 logger = logging.getLogger(__name__)
 
 # In-memory tracker for unban requests per day
 unban_requests_today: dict[int, dict] = {}  # {user_id: {"date": date, "count": int}}
+memory_stores.register("unban_requests_today", lambda: unban_requests_today)
 
 def get_banned_user_kb() -> ReplyKeyboardMarkup:
     """Keyboard shown to banned users."""
@@ -120,8 +151,12 @@ class BanCheckMiddleware(BaseMiddleware):
             user_text = event.data or ""
 
         if user_id:
-            user = await self.db.get_user(user_id)
-            if user and user.get("is_banned"):
+            banned = banned_users.is_banned(user_id)
+            if banned is None:
+                # Ban cache not loaded yet
+                user = await self.db.get_user(user_id)
+                banned = bool(user and user.get("is_banned"))
+            if banned:
                 # Block if exact match OR prefix match
                 if user_text in BLOCKED_ACTIONS or any(
                     user_text.startswith(prefix) for prefix in BLOCKED_PREFIXES
@@ -0,0 +1,23 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+from services.tracing import hash_user_id, tracer
+
+
+class UpdateTracingMiddleware(BaseMiddleware):
+    """Outer update middleware: opens the root span of a (sampled) update trace."""
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        attrs = {"update_id": event.update_id, "type": event.event_type}
+        if user:
+            attrs["user"] = hash_user_id(user.id)
+        with tracer.trace("update", **attrs):
+            return await handler(event, data)
@@ -2,13 +2,16 @@ import logging
 from datetime import datetime, time
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from database import db
-from bot_config import CHANNEL_ID
+from bot_config import ADMIN_GROUP_ID, CHANNEL_ID
+from services.jobs import DEFAULT_QUEUE, NOTIFICATIONS_QUEUE, JobWorker, enqueue, job
+from services.notification_pipeline import DeliveryReport, NotificationPipeline
+from services.outbound import Priority, with_priority
 import random
-from typing import List
 
 logger = logging.getLogger(__name__)
 
 scheduler = AsyncIOScheduler()
+job_worker: JobWorker = None
 
 DAILY_MESSAGES = [
     "Your crush might be waiting for you... 😏",
@@ -23,29 +26,39 @@ WEEKLY_MESSAGES = {
     'sunday': "😍 Blind Date Sunday! Find your match today 💘"
 }
 
+# Seconds each fan-out is spread over (the whole active base, not a capped sample)
+DAILY_WINDOW = 45 * 60
+WEEKLY_WINDOW = 60 * 60
+
+
+async def run_notification(bot, job: str, text: str, window_seconds: float) -> DeliveryReport:
+    """Sends `text` to every active user via the pipeline and reports to the admin group."""
+    report = await NotificationPipeline(db, bot, job, window_seconds=window_seconds).run(text)
+    if ADMIN_GROUP_ID:
+        try:
+            await bot.send_message(ADMIN_GROUP_ID, report.summary())
+        except Exception as e:
+            logger.error(f"Failed to post {job} delivery report: {e}")
+    return report
+
+@job("daily_notifications", queue=NOTIFICATIONS_QUEUE)
+@with_priority(Priority.NOTIFICATION)
 async def send_daily_notifications(bot):
     """Sends a daily motivational notification to active users."""
     try:
-        # Fetch up to 100 active user IDs using the local DB wrapper
-        user_ids: List[int] = await db.get_active_user_ids(limit=100) 
-
         message = random.choice(DAILY_MESSAGES)
-
-        for user_id in user_ids:
-            try:
-                await bot.send_message(
-                    user_id,
-                    f"🔔 Daily Reminder!\n\n{message}\n\nOpen AAUPulse now! 💯"
-                )
-            except Exception as e:
-                # Log non-critical errors (e.g., user blocked the bot)
-                logger.error(f"Failed to send daily notification to {user_id}: {e}")
-
-        logger.info(f"Sent daily notifications to {len(user_ids)} users")
+        await run_notification(
+            bot,
+            "daily",
+            f"🔔 Daily Reminder!\n\n{message}\n\nOpen AAUPulse now! 💯",
+            DAILY_WINDOW
+        )
 
     except Exception as e:
         logger.error(f"Error sending daily notifications: {e}")
 
+@job("friday_confessions", queue=NOTIFICATIONS_QUEUE)
+@with_priority(Priority.NOTIFICATION)
 async def send_weekly_confession_reminder(bot):
     """Posts a Confession Friday reminder to the channel and sends a personal message to active users."""
     try:
@@ -59,24 +72,21 @@ async def send_weekly_confession_reminder(bot):
         )
 
         # 2. Notify Users
-        # Fetch up to 200 active user IDs
-        user_ids: List[int] = await db.get_active_user_ids(limit=200)
-
-        for user_id in user_ids:
-            try:
-                await bot.send_message(
-                    user_id,
-                    "💌 Confession Friday! 💌\n\n"
-                    "Post an anonymous confession and get 5 coins! 🪙"
-                )
-            except Exception as e:
-                logger.error(f"Failed to send Friday reminder to {user_id}: {e}")
+        await run_notification(
+            bot,
+            "friday_confessions",
+            "💌 Confession Friday! 💌\n\n"
+            "Post an anonymous confession and get 5 coins! 🪙",
+            WEEKLY_WINDOW
+        )
 
         logger.info("Sent Confession Friday reminders")
 
     except Exception as e:
         logger.error(f"Error sending Friday reminders: {e}")
 
+@job("sunday_matches", queue=NOTIFICATIONS_QUEUE)
+@with_priority(Priority.NOTIFICATION)
 async def send_weekly_match_reminder(bot):
     """Posts a Blind Date Sunday reminder to the channel and sends a personal message to active users."""
     try:
@@ -90,18 +100,13 @@ async def send_weekly_match_reminder(bot):
         )
 
         # 2. Notify Users
-        # Fetch up to 200 active user IDs
-        user_ids: List[int] = await db.get_active_user_ids(limit=200)
-
-        for user_id in user_ids:
-            try:
-                await bot.send_message(
-                    user_id,
-                    "😍 Blind Date Sunday! 😍\n\n"
-                    "Your match is waiting... start swiping! 💯"
-                )
-            except Exception as e:
-                logger.error(f"Failed to send Sunday reminder to {user_id}: {e}")
+        await run_notification(
+            bot,
+            "sunday_matches",
+            "😍 Blind Date Sunday! 😍\n\n"
+            "Your match is waiting... start swiping! 💯",
+            WEEKLY_WINDOW
+        )
 
         logger.info("Sent Blind Date Sunday reminders")
 
@@ -110,6 +115,8 @@ async def send_weekly_match_reminder(bot):
 
 
 
+@job("weekly_leaderboard", queue=NOTIFICATIONS_QUEUE)
+@with_priority(Priority.NOTIFICATION)
 async def update_weekly_leaderboard(bot):
     """Updates the leaderboard cache and posts an announcement to the channel."""
     try:
@@ -148,58 +155,136 @@ async def update_weekly_leaderboard(bot):
         logger.error("Error posting leaderboard: %s", e)
 
 
+@job("rebuild_leaderboard", queue=DEFAULT_QUEUE)
+async def rebuild_leaderboard(bot):
+    """Coalesced rebuild requested by likes (Database.request_leaderboard_rebuild)."""
+    if not await db.update_leaderboard_cache():
+        raise RuntimeError("Leaderboard cache rebuild failed")
+
+
+@job("match_queue_priority_backfill", queue=DEFAULT_QUEUE)
+async def backfill_match_queue_priority(bot):
+    """Fills match_queue.priority for rows queued before the column existed."""
+    from services.match_queue_service import MatchQueueService
+
+    try:
+        updated = await MatchQueueService(db, bot).backfill_priorities()
+        if updated:
+            logger.info(f"Backfilled priority for {updated} match queue items")
+    except Exception as e:
+        logger.error(f"Error backfilling match queue priority: {e}")
+
+
+@job("fsm_cleanup", queue=DEFAULT_QUEUE)
+async def cleanup_fsm_storage(bot):
+    """Deletes expired FSM keys (services/fsm_storage.py)."""
+    removed = await db.purge_fsm_storage()
+    if removed:
+        logger.info(f"Removed {removed} expired FSM keys")
+
+
+async def enqueue_scheduled(name: str):
+    """
+    APScheduler callback: only queues the job. The minute-stamped dedupe key
+    keeps several web processes with their own scheduler from queueing it twice.
+    """
+    await enqueue(db, name, dedupe_key=f"{name}:{datetime.now():%Y-%m-%dT%H:%M}")
+
+
 def setup_scheduler(bot):
-    """Configures and starts the APScheduler jobs."""
+    """Configures and starts the APScheduler jobs (they only enqueue; workers run them)."""
     scheduler.add_job(
-        send_daily_notifications,
+        enqueue_scheduled,
         'cron',
         hour=19,
         minute=0,
-        args=[bot],
+        args=['daily_notifications'],
         id='daily_notifications'
     )
 
     scheduler.add_job(
-        send_weekly_confession_reminder,
+        enqueue_scheduled,
         'cron',
         day_of_week='fri',
         hour=12,
         minute=0,
-        args=[bot],
+        args=['friday_confessions'],
         id='friday_confessions'
     )
 
     scheduler.add_job(
-        send_weekly_match_reminder,
+        enqueue_scheduled,
         'cron',
         day_of_week='sun',
         hour=14,
         minute=0,
-        args=[bot],
+        args=['sunday_matches'],
         id='sunday_matches'
     )
 
     scheduler.add_job(
-        update_weekly_leaderboard,
+        enqueue_scheduled,
         'cron',
         day_of_week='mon',
         hour=10,
         minute=0,
-        args=[bot],
+        args=['weekly_leaderboard'],
         id='weekly_leaderboard'
     )
 
+    scheduler.add_job(
+        enqueue_scheduled,
+        'cron',
+        minute=15,
+        args=['fsm_cleanup'],
+        id='fsm_cleanup'
+    )
+
+    # One-off, runs right after startup
+    scheduler.add_job(
+        enqueue,
+        'date',
+        args=[db, 'match_queue_priority_backfill'],
+        kwargs={'dedupe_key': 'match_queue_priority_backfill'},
+        id='match_queue_priority_backfill'
+    )
+
     scheduler.start()
     logger.info("Scheduler started with all jobs configured")
 
-    # 🟦 Start match queue scheduler as a standalone async background task
-    import asyncio
-    from scheduler.match_queue_scheduler import run_match_queue_scheduler
 
-    asyncio.create_task(run_match_queue_scheduler(db, bot))
-    logger.info("Match Queue Scheduler started")
+def start_workers(bot, queues=None):
+    """
+    Starts the background side: job worker, match queue scheduler and outbox
+    worker. Runs inside the web process by default, or in worker.py.
+    """
+    global job_worker
+    from scheduler.match_queue_scheduler import match_queue_scheduler
+    from services.outbox import outbox_worker
+    import services.broadcast_service  # registers the broadcast job
+
+    job_worker = JobWorker(db, bot, queues)
+    job_worker.start()
+    match_queue_scheduler.start(db, bot)
+    outbox_worker.start(db, bot)
+    logger.info("Background workers started")
+
+
+async def shutdown_workers():
+    global job_worker
+    from scheduler.match_queue_scheduler import match_queue_scheduler
+    from services.outbox import outbox_worker
+
+    if job_worker:
+        await job_worker.close()
+        job_worker = None
+    await match_queue_scheduler.close()
+    await outbox_worker.close()
+    logger.info("Background workers stopped")
+
 
 def shutdown_scheduler():
     """Shuts down the APScheduler."""
-    scheduler.shutdown()
+    if scheduler.running:
+        scheduler.shutdown()
     logger.info("Scheduler shut down")
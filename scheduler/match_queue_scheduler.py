@@ -1,52 +1,179 @@
 # scheduler/match_queue_scheduler.py
 
 import asyncio
+import logging
+from typing import Optional
+
+import asyncpg
+
 from bot_config import ADMIN_GROUP_ID, CHANNEL_ID
 from services.match_queue_service import MatchQueueService
 from services.content_builder import build_match_drop_text
-MAX_POSTS_PER_SLOT = 3  # maximum number of matches to post per scheduling slot     
-async def run_match_queue_scheduler(db, bot):
-    service = MatchQueueService(db, bot)
+from services.outbound import Priority, outbound_priority
 
-    while True:
-        try:
-            # Fetch all due matches
-            items = await service.get_due_items()
+logger = logging.getLogger(__name__)
 
-            if items:
-                # Rank by score
-                ranked = sorted(items, key=lambda i: service.compute_score(i), reverse=True)
+MAX_POSTS_PER_SLOT = 3  # maximum number of matches to post per scheduling slot
+CHANNEL = "match_queue"  # NOTIFY channel (insert trigger + admin stop/start) and scheduler_state name
+MAX_IDLE = 3600         # re-check at least this often, in case a notification was missed
+RECONNECT_DELAY = 5     # seconds before retrying a lost LISTEN connection
+ERROR_BACKOFF = 60      # seconds to wait after a failed pass
+DIGEST_MAX_IDS = 50     # queue ids listed per digest line
+DIGEST_MAX_ERRORS = 10  # error lines per digest
 
-                # Cap how many to post per slot
-                to_post = ranked[:MAX_POSTS_PER_SLOT]
-                to_reschedule = ranked[MAX_POSTS_PER_SLOT:]
 
-                # Post top matches
-                for item in to_post:
-                    try:
-                        text = build_match_drop_text(item)
-                        await bot.send_message(CHANNEL_ID, text)
-                        await service.mark_sent(item["id"])
-                        await bot.send_message(
-                            ADMIN_GROUP_ID,
-                            f"🟩 MATCH POSTED\nQueue ID: {item['id']}"
-                        )
-                    except Exception as e:
-                        await service.record_error(item["id"], str(e))
-
-                # Reschedule leftovers
-                for item in to_reschedule:
-                    await service.reschedule(item["id"])
-                    await bot.send_message(
-                        ADMIN_GROUP_ID,
-                        f"⏭️ MATCH RESCHEDULED\nQueue ID: {item['id']}"
-                    )
+class MatchQueueScheduler:
+    """
+    Posts due match_queue items to the channel.
+
+    Sleeps until the earliest next_post_time and is woken early by
+    NOTIFY match_queue (sent by the insert trigger and by admin stop/start).
+    Due rows are leased (claimed_until) in one committed statement before
+    posting, so several bot instances can run this without double-posting
+    and no transaction stays open while messages are sent. The paused flag lives in
+    scheduler_state, so a stop applies to all instances and survives restarts.
+    """
+
+    def __init__(self):
+        self.db = None
+        self.bot = None
+        self.service: Optional[MatchQueueService] = None
+        self.paused = False
+        self._task: Optional[asyncio.Task] = None
+        self._listener: Optional[asyncpg.Connection] = None
+        self._wakeup = asyncio.Event()
+
+    def start(self, db, bot):
+        self.db, self.bot = db, bot
+        self.service = MatchQueueService(db, bot)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
 
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self._listener and not self._listener.is_closed():
+            await self._listener.close()
+        self._listener = None
+
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    # ----------------------------------------------------
+    # ADMIN CONTROLS
+    # ----------------------------------------------------
+    async def stop(self, admin_id: int) -> bool:
+        return await self.db.set_scheduler_paused(CHANNEL, True, admin_id)
+
+    async def resume(self, admin_id: int) -> bool:
+        return await self.db.set_scheduler_paused(CHANNEL, False, admin_id)
+
+    # ----------------------------------------------------
+    # LISTEN
+    # ----------------------------------------------------
+    def _on_notify(self, conn, pid, channel, payload):
+        self._wakeup.set()
+
+    async def _ensure_listener(self):
+        if self._listener and not self._listener.is_closed():
+            return
+        try:
+            self._listener = await asyncpg.connect(self.db.dsn)
+            await self._listener.add_listener(CHANNEL, self._on_notify)
+            logger.info(f"Match queue scheduler listening on '{CHANNEL}'")
         except Exception as e:
-            await bot.send_message(
-                ADMIN_GROUP_ID,
-                f"🟥 SCHEDULER ERROR\n{str(e)}"
-            )
+            self._listener = None
+            logger.error(f"Match queue scheduler could not LISTEN (falling back to timed checks): {e}")
+
+    # ----------------------------------------------------
+    # MAIN LOOP
+    # ----------------------------------------------------
+    async def _run(self):
+        with outbound_priority(Priority.NOTIFICATION):
+            while True:
+                # Cleared before the pass: a NOTIFY arriving mid-pass triggers another one
+                self._wakeup.clear()
+                await self._ensure_listener()
+
+                try:
+                    self.paused = await self.db.is_scheduler_paused(CHANNEL)
+                    if self.paused:
+                        delay = MAX_IDLE
+                    else:
+                        await self._post_due()
+                        delay = await self.service.seconds_until_next_due()
+                        delay = MAX_IDLE if delay is None else min(max(float(delay), 0.0), MAX_IDLE)
+                except Exception as e:
+                    logger.error(f"Match queue scheduler error: {e}")
+                    delay = ERROR_BACKOFF
+                    try:
+                        await self.bot.send_message(ADMIN_GROUP_ID, f"🟥 SCHEDULER ERROR\n{str(e)}")
+                    except Exception:
+                        pass
+
+                if self._listener is None:
+                    delay = min(delay, RECONNECT_DELAY)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _post_due(self):
+        service = self.service
+        posted, errors = [], []
+        # Highest priority first, capped per slot; the lease is committed before
+        # any send, so no transaction or row lock is held while posting
+        to_post = await service.claim_due_items(MAX_POSTS_PER_SLOT)
+        if not to_post:
+            return
+
+        for item in to_post:
+            # Marked sent before posting, so a posted item can't be claimed again;
+            # if marking fails nothing is posted and the lease runs out
+            try:
+                await service.mark_sent(item["id"])
+            except Exception as e:
+                logger.error(f"Could not mark match queue item {item['id']} sent: {e}")
+                errors.append((item["id"], f"not posted, marking it sent failed: {e}"))
+                continue
+            try:
+                text = build_match_drop_text(item)
+                await self.bot.send_message(CHANNEL_ID, text)
+                posted.append(item["id"])
+            except Exception as e:
+                await service.record_error(item["id"], str(e), notify=False)  # back to unsent
+                errors.append((item["id"], str(e)))
+
+        # Leftovers and failed items move to the next slot in one statement
+        rescheduled, next_time = await service.reschedule_due()
+
+        await self.bot.send_message(
+            ADMIN_GROUP_ID,
+            format_slot_digest(posted, rescheduled, errors, next_time)
+        )
+
+
+def _id_list(ids) -> str:
+    shown = ", ".join(str(i) for i in ids[:DIGEST_MAX_IDS])
+    if len(ids) > DIGEST_MAX_IDS:
+        shown += f" … (+{len(ids) - DIGEST_MAX_IDS} more)"
+    return shown
+
+
+def format_slot_digest(posted, rescheduled, errors, next_time) -> str:
+    """One admin message per slot instead of one per posted/rescheduled item."""
+    lines = ["🗓 MATCH QUEUE SLOT"]
+    if posted:
+        lines.append(f"🟩 Posted ({len(posted)}): {_id_list(posted)}")
+    if rescheduled:
+        lines.append(f"⏭️ Rescheduled ({len(rescheduled)}) → {next_time:%Y-%m-%d %H:%M}: {_id_list(rescheduled)}")
+    if errors:
+        lines.append(f"🟥 Errors ({len(errors)}):")
+        lines.extend(f"• {queue_id}: {error[:200]}" for queue_id, error in errors[:DIGEST_MAX_ERRORS])
+        if len(errors) > DIGEST_MAX_ERRORS:
+            lines.append(f"… (+{len(errors) - DIGEST_MAX_ERRORS} more)")
+    return "\n".join(lines)
+
 
-        # Check every 5 minutes
-        await asyncio.sleep(300)
+match_queue_scheduler = MatchQueueScheduler()
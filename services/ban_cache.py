@@ -0,0 +1,81 @@
+# services/ban_cache.py
+
+import asyncio
+import logging
+from typing import Dict, Optional, Set
+
+from database import USER_BANNED, USER_UPDATED
+from services.invalidation import invalidation_bus
+from services.memory_diag import memory_stores
+
+logger = logging.getLogger(__name__)
+
+RESYNC_INTERVAL = 300   # full reload, in case an event was missed
+RETRY_DELAY = 5         # until the first load succeeds
+
+
+class BannedUsers:
+    """
+    Process-local set of banned user ids, so the ban check needs no query.
+
+    Loaded at startup and kept current by user_banned / user_updated
+    (deleted) events from the invalidation bus; fully reloaded every
+    RESYNC_INTERVAL and whenever the bus reconnects.
+    """
+
+    def __init__(self):
+        self.db = None
+        self.ids: Set[int] = set()
+        self.loaded = False
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, db):
+        """Call after invalidation_bus.start(), so no change falls between LISTEN and the load."""
+        self.db = db
+        invalidation_bus.subscribe(USER_BANNED, self._on_banned)
+        invalidation_bus.subscribe(USER_UPDATED, self._on_updated)
+        invalidation_bus.on_resync(self.resync)
+        await self.resync()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def is_banned(self, user_id: int) -> Optional[bool]:
+        """O(1) lookup; None until the set has been loaded once."""
+        if not self.loaded:
+            return None
+        return user_id in self.ids
+
+    def apply(self, user_id: int, banned: bool):
+        if banned:
+            self.ids.add(user_id)
+        else:
+            self.ids.discard(user_id)
+
+    async def resync(self) -> bool:
+        ids = await self.db.get_banned_user_ids()
+        if ids is None:
+            return False
+        self.ids = ids
+        self.loaded = True
+        return True
+
+    def _on_banned(self, event: Dict):
+        self.apply(int(event["user_id"]), bool(event["banned"]))
+
+    def _on_updated(self, event: Dict):
+        if event.get("deleted"):
+            self.apply(int(event["user_id"]), False)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(RESYNC_INTERVAL if self.loaded else RETRY_DELAY)
+            await self.resync()
+
+
+banned_users = BannedUsers()
+memory_stores.register("banned_users", lambda: banned_users.ids)
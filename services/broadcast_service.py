@@ -0,0 +1,215 @@
+# services/broadcast_service.py
+
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+from aiogram.enums import ParseMode
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from database import Database, db
+from services.jobs import BROADCAST_QUEUE, enqueue, job
+from services.outbound import Priority, outbound_priority
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100        # recipients fetched and checkpointed per step
+CONCURRENCY = 10        # in-flight sends per job; the outbound limiter does the pacing
+PROGRESS_INTERVAL = 5   # seconds between progress message edits
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_PAUSED = "paused"
+STATUS_CANCELLED = "cancelled"
+STATUS_DONE = "done"
+
+STATUS_LABELS = {
+    STATUS_PENDING: "⏳ Queued",
+    STATUS_RUNNING: "🚀 Sending",
+    STATUS_PAUSED: "⏸ Paused",
+    STATUS_CANCELLED: "⏹ Cancelled",
+    STATUS_DONE: "✅ Complete",
+}
+
+# Live msgs per second of broadcasts sent by this process
+_rates: Dict[int, float] = {}
+
+
+def broadcast_controls_kb(job_id: int, status: str) -> Optional[InlineKeyboardMarkup]:
+    if status in (STATUS_PENDING, STATUS_RUNNING):
+        toggle = InlineKeyboardButton(text="⏸ Pause", callback_data=f"bcast_pause_{job_id}")
+    elif status == STATUS_PAUSED:
+        toggle = InlineKeyboardButton(text="▶ Resume", callback_data=f"bcast_resume_{job_id}")
+    else:
+        return None
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [toggle, InlineKeyboardButton(text="⏹ Cancel", callback_data=f"bcast_cancel_{job_id}")]
+    ])
+
+
+def format_progress(job: dict) -> str:
+    done = job["sent"] + job["failed"]
+    total = max(job["total"], done)
+    pct = (done / total * 100) if total else 100.0
+    rate = _rates.get(job["id"])
+    text = (
+        f"📢 Broadcast #{job['id']} — {STATUS_LABELS.get(job['status'], job['status'])}\n\n"
+        f"📬 Progress: {done}/{total} ({pct:.0f}%)\n"
+        f"✅ Sent: {job['sent']}\n"
+        f"❌ Failed: {job['failed']}"
+    )
+    if rate:
+        text += f"\n⚡ Rate: {rate:.1f} msg/s"
+    return text
+
+
+class BroadcastService:
+    """
+    Persisted, resumable broadcast jobs.
+
+    Recipients are walked in users.id order in batches of BATCH_SIZE; after each
+    batch the cursor and counters are checkpointed in broadcast_jobs, so a restart
+    resumes from the last finished batch. Pause/cancel are stored on the job row
+    and picked up at the next checkpoint, whichever process is sending.
+    """
+
+    def __init__(self, db: Database, bot):
+        self.db = db
+        self.bot = bot
+
+    # ----------------------------------------------------
+    # CONTROL
+    # ----------------------------------------------------
+    async def create(self, text: str, created_by: int, admin_chat_id: int) -> Optional[int]:
+        job_id = await self.db.create_broadcast_job(text, created_by, admin_chat_id)
+        if not job_id:
+            return None
+
+        job = await self.db.get_broadcast_job(job_id)
+        msg = await self.bot.send_message(
+            admin_chat_id,
+            format_progress(job),
+            reply_markup=broadcast_controls_kb(job_id, job["status"])
+        )
+        await self.db.set_broadcast_progress_message(job_id, msg.message_id)
+        await self.start(job_id)
+        return job_id
+
+    async def start(self, job_id: int):
+        """Queues the sending run on the broadcast job queue (no-op if one is already queued/running)."""
+        await enqueue(self.db, "broadcast", {"broadcast_id": job_id}, dedupe_key=f"broadcast:{job_id}")
+
+    async def pause(self, job_id: int) -> bool:
+        ok = await self.db.set_broadcast_status(job_id, STATUS_PAUSED, [STATUS_PENDING, STATUS_RUNNING])
+        if ok:
+            await self.update_progress(job_id)
+        return ok
+
+    async def resume(self, job_id: int) -> bool:
+        ok = await self.db.set_broadcast_status(job_id, STATUS_PENDING, [STATUS_PAUSED])
+        if ok:
+            await self.start(job_id)
+        return ok
+
+    async def cancel(self, job_id: int) -> bool:
+        ok = await self.db.set_broadcast_status(
+            job_id, STATUS_CANCELLED, [STATUS_PENDING, STATUS_RUNNING, STATUS_PAUSED]
+        )
+        if ok:
+            await self.update_progress(job_id)
+        return ok
+
+    async def resume_unfinished(self):
+        """Restarts jobs that were still sending when the process stopped."""
+        rows = await self.db.get_broadcast_jobs_by_status([STATUS_PENDING, STATUS_RUNNING])
+        for row in rows:
+            logger.info(f"Resuming broadcast #{row['id']} after user {row['last_user_id']}")
+            await self.start(row["id"])
+
+    # ----------------------------------------------------
+    # SENDING
+    # ----------------------------------------------------
+    async def _run(self, job_id: int):
+        try:
+            # pending -> running, or running -> running when resuming after a restart
+            if not await self.db.set_broadcast_status(job_id, STATUS_RUNNING, [STATUS_PENDING, STATUS_RUNNING]):
+                return
+
+            job = await self.db.get_broadcast_job(job_id)
+            cursor, text = job["last_user_id"], job["text"]
+            semaphore = asyncio.Semaphore(CONCURRENCY)
+            started = time.monotonic()
+            last_progress = started
+            processed = 0
+            status = STATUS_RUNNING
+
+            with outbound_priority(Priority.BROADCAST):
+                while status == STATUS_RUNNING:
+                    user_ids = await self.db.get_active_user_ids_after(cursor, BATCH_SIZE)
+                    if not user_ids:
+                        await self.db.set_broadcast_status(job_id, STATUS_DONE, [STATUS_RUNNING])
+                        break
+
+                    results = await asyncio.gather(*[self._send(semaphore, uid, text) for uid in user_ids])
+                    sent = sum(results)
+                    cursor = user_ids[-1]
+                    status = await self.db.checkpoint_broadcast(job_id, cursor, sent, len(user_ids) - sent)
+                    if status == STATUS_PENDING:
+                        # Paused and resumed before this batch finished: keep going
+                        await self.db.set_broadcast_status(job_id, STATUS_RUNNING, [STATUS_PENDING])
+                        status = STATUS_RUNNING
+
+                    processed += len(user_ids)
+                    now = time.monotonic()
+                    _rates[job_id] = processed / max(now - started, 1e-6)
+                    if now - last_progress >= PROGRESS_INTERVAL:
+                        last_progress = now
+                        await self.update_progress(job_id)
+
+                await self.update_progress(job_id)
+
+            logger.info(
+                f"Broadcast #{job_id} stopped with status {status}: "
+                f"{processed} recipients at {_rates.get(job_id, 0):.1f} msg/s"
+            )
+        except Exception as e:
+            logger.error(f"Broadcast #{job_id} crashed (resumes from the last checkpoint): {e}")
+
+    async def _send(self, semaphore: asyncio.Semaphore, user_id: int, text: str) -> bool:
+        async with semaphore:
+            try:
+                await self.bot.send_message(user_id, text, parse_mode=ParseMode.HTML)
+                return True
+            except Exception as e:
+                logger.debug(f"Broadcast send to {user_id} failed: {e}")
+                return False
+
+    async def update_progress(self, job_id: int):
+        job = await self.db.get_broadcast_job(job_id)
+        if not job or not job.get("progress_message_id"):
+            return
+        try:
+            await self.bot.edit_message_text(
+                format_progress(job),
+                chat_id=job["admin_chat_id"],
+                message_id=job["progress_message_id"],
+                reply_markup=broadcast_controls_kb(job_id, job["status"])
+            )
+        except Exception:
+            # "message is not modified" and similar are harmless here
+            pass
+
+
+@job("broadcast", queue=BROADCAST_QUEUE)
+async def run_broadcast(bot, broadcast_id: int):
+    service = BroadcastService(db, bot)
+    while True:
+        await service._run(broadcast_id)
+        # Resumed while this run was stopping: its enqueue was deduplicated against us
+        job_row = await db.get_broadcast_job(broadcast_id)
+        if job_row and job_row["status"] == STATUS_RUNNING:
+            # _run crashed; let the job runner retry from the last checkpoint
+            raise RuntimeError(f"Broadcast #{broadcast_id} stopped while running")
+        if not job_row or job_row["status"] != STATUS_PENDING:
+            return
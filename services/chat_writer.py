@@ -0,0 +1,141 @@
+# services/chat_writer.py
+
+import asyncio
+import logging
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 0.005  # seconds to wait for more rows before committing a batch
+MAX_BATCH_SIZE = 200    # commit immediately once this many rows are pending
+
+
+class ChatMessageWriter:
+    """
+    Group-commit writer for the chats table.
+
+    Messages are buffered and committed together every FLUSH_INTERVAL seconds
+    (or as soon as MAX_BATCH_SIZE rows are waiting) with a single COPY.
+    Each caller awaits its own future, which resolves to the new chats.id
+    only after the batch transaction has committed.
+    """
+
+    def __init__(self, pool, flush_interval: float = FLUSH_INTERVAL, max_batch_size: int = MAX_BATCH_SIZE):
+        self.pool = pool
+        self.flush_interval = flush_interval
+        self.max_batch_size = max_batch_size
+
+        self._pending: List[Tuple[int, int, str, asyncio.Future]] = []
+        self._has_rows = asyncio.Event()
+        self._batch_full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+        # Simple counters for monitoring
+        self.batches_written = 0
+        self.rows_written = 0
+
+    # ----------------------------------------------------
+    # LIFECYCLE
+    # ----------------------------------------------------
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Flushes everything still pending, then stops the writer task."""
+        self._closing = True
+        self._has_rows.set()
+        self._batch_full.set()
+        if self._task:
+            await self._task
+            self._task = None
+
+    # ----------------------------------------------------
+    # PUBLIC API
+    # ----------------------------------------------------
+    async def write(self, match_id: int, sender_id: int, message: str) -> int:
+        """Queues one chat row and waits until it is committed. Returns its id."""
+        if self._closing or self._task is None:
+            raise RuntimeError("ChatMessageWriter is not running")
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((match_id, sender_id, message, future))
+
+        self._has_rows.set()
+        if len(self._pending) >= self.max_batch_size:
+            self._batch_full.set()
+
+        return await future
+
+    # ----------------------------------------------------
+    # BACKGROUND LOOP
+    # ----------------------------------------------------
+    async def _run(self):
+        while True:
+            await self._has_rows.wait()
+
+            if not self._pending:
+                if self._closing:
+                    return
+                self._has_rows.clear()
+                continue
+
+            # Give concurrent senders a few ms to join this batch
+            if len(self._pending) < self.max_batch_size and not self._closing:
+                try:
+                    await asyncio.wait_for(self._batch_full.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+            if len(self._pending) < self.max_batch_size and not self._closing:
+                self._batch_full.clear()
+
+            await self._flush(batch)
+
+    async def _flush(self, batch):
+        try:
+            ids = await self._insert_batch([(m, s, text) for m, s, text, _ in batch])
+        except Exception as e:
+            # One bad row (e.g. match deleted mid-chat) must not fail its neighbours:
+            # retry row by row so only the offending callers see an error.
+            logger.warning(f"Chat batch of {len(batch)} failed ({e}); retrying rows individually")
+            for match_id, sender_id, message, future in batch:
+                try:
+                    row_ids = await self._insert_batch([(match_id, sender_id, message)])
+                    self._resolve(future, row_ids[0])
+                except Exception as row_error:
+                    if not future.done():
+                        future.set_exception(row_error)
+            return
+
+        for (_, _, _, future), chat_id in zip(batch, ids):
+            self._resolve(future, chat_id)
+
+    async def _insert_batch(self, rows) -> List[int]:
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                # Reserve ids up front so every caller learns its own row id
+                # while the rows themselves go in through one COPY.
+                id_rows = await conn.fetch(
+                    "SELECT nextval(pg_get_serial_sequence('chats', 'id')) AS id "
+                    "FROM generate_series(1, $1)",
+                    len(rows)
+                )
+                ids = [r["id"] for r in id_rows]
+                await conn.copy_records_to_table(
+                    "chats",
+                    records=[(chat_id, *row) for chat_id, row in zip(ids, rows)],
+                    columns=["id", "match_id", "sender_id", "message"],
+                )
+
+        self.batches_written += 1
+        self.rows_written += len(rows)
+        return ids
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, chat_id: int):
+        if not future.done():
+            future.set_result(chat_id)
@@ -0,0 +1,246 @@
+# services/fsm_storage.py
+
+import asyncio
+import json
+import logging
+import zlib
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import DEFAULT_DESTINY, BaseStorage, StateType, StorageKey
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 7 * 24 * 3600     # idle FSM keys expire after a week
+RETRY_DELAY = 1.0               # seconds before writes that failed to save are retried
+COMPRESS_MIN = 512              # serialized data at least this long is zlib-compressed
+
+_RAW = b"j"
+_ZLIB = b"z"
+
+
+# ----------------------------------------------------
+# SERIALIZATION
+# ----------------------------------------------------
+def _encode_default(value):
+    # Rows copied into FSM data (crush lists, matches) carry timestamps
+    if isinstance(value, datetime):
+        return {"__dt__": value.isoformat()}
+    if isinstance(value, date):
+        return {"__d__": value.isoformat()}
+    raise TypeError(f"{type(value).__name__} is not FSM-serializable")
+
+
+def _decode_hook(obj: Dict):
+    if len(obj) == 1:
+        if "__dt__" in obj:
+            return datetime.fromisoformat(obj["__dt__"])
+        if "__d__" in obj:
+            return date.fromisoformat(obj["__d__"])
+    return obj
+
+
+def dump_data(data: Dict[str, Any]) -> Optional[bytes]:
+    """Compact JSON, compressed when large; None for empty data."""
+    if not data:
+        return None
+    raw = json.dumps(data, separators=(",", ":"), ensure_ascii=False, default=_encode_default).encode()
+    if len(raw) >= COMPRESS_MIN:
+        return _ZLIB + zlib.compress(raw)
+    return _RAW + raw
+
+
+def load_data(blob: Optional[bytes]) -> Dict[str, Any]:
+    if not blob:
+        return {}
+    blob = bytes(blob)
+    raw = zlib.decompress(blob[1:]) if blob[:1] == _ZLIB else blob[1:]
+    return json.loads(raw, object_hook=_decode_hook)
+
+
+# ----------------------------------------------------
+# STORAGE
+# ----------------------------------------------------
+class _Pending:
+    __slots__ = ("state", "data", "set_state", "set_data")
+
+    def __init__(self):
+        self.state: Optional[str] = None
+        self.data: Dict[str, Any] = {}
+        self.set_state = False
+        self.set_data = False
+
+
+class _UpdateScope:
+    __slots__ = ("keys", "open")
+
+    def __init__(self):
+        self.keys: Set[str] = set()
+        self.open = True
+
+
+# Set while an update is being handled (see update_scope); None elsewhere
+_update_scope: ContextVar[Optional[_UpdateScope]] = ContextVar("fsm_update_scope", default=None)
+
+
+class PostgresStorage(BaseStorage):
+    """
+    aiogram FSM storage in the fsm_storage table, so any web process can
+    continue a user's flow.
+
+    Writes made while handling an update (see update_scope) are buffered
+    per key and saved when the update ends: a handler that calls set_state
+    + several update_data costs one upsert, and the next update, in any
+    process, reads the saved state. Writes outside an update are saved at
+    once. Reads see the buffer first. Every write pushes the key's expiry
+    to now + ttl; expired rows are ignored and removed by the fsm_cleanup job.
+    """
+
+    def __init__(self, db, ttl: int = DEFAULT_TTL, retry_delay: float = RETRY_DELAY):
+        self.db = db
+        self.ttl = ttl
+        self.retry_delay = retry_delay
+        self._pending: Dict[str, _Pending] = {}
+        self._inflight: Dict[str, _Pending] = {}    # being written by flush()
+        self._retry_task: Optional[asyncio.Task] = None
+
+        self.writes = 0
+        self.flushed_rows = 0
+
+    @staticmethod
+    def build_key(key: StorageKey) -> str:
+        parts = [str(key.bot_id), str(key.chat_id), str(key.user_id)]
+        if key.thread_id:
+            parts.append(str(key.thread_id))
+        if key.destiny != DEFAULT_DESTINY:
+            parts.append(key.destiny)
+        return ":".join(parts)
+
+    # ----------------------------------------------------
+    # BaseStorage
+    # ----------------------------------------------------
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        skey = self.build_key(key)
+        entry = self._buffer(skey)
+        entry.state = state.state if isinstance(state, State) else state
+        entry.set_state = True
+        await self._write_outside_update(skey)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        skey = self.build_key(key)
+        for entry in self._buffered(skey):
+            if entry.set_state:
+                return entry.state
+        record = await self.db.get_fsm_record(skey)
+        return record[0] if record else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        skey = self.build_key(key)
+        entry = self._buffer(skey)
+        entry.data = data.copy()
+        entry.set_data = True
+        await self._write_outside_update(skey)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        skey = self.build_key(key)
+        for entry in self._buffered(skey):
+            if entry.set_data:
+                return entry.data.copy()
+        record = await self.db.get_fsm_record(skey)
+        return load_data(record[1]) if record else {}
+
+    async def close(self) -> None:
+        if self._retry_task:
+            self._retry_task.cancel()
+            self._retry_task = None
+        await self.flush()
+
+    # ----------------------------------------------------
+    # WRITE COALESCING
+    # ----------------------------------------------------
+    @asynccontextmanager
+    async def update_scope(self):
+        """Buffers FSM writes made inside (one update) and saves them when it exits."""
+        scope = _UpdateScope()
+        token = _update_scope.set(scope)
+        try:
+            yield
+        finally:
+            _update_scope.reset(token)
+            scope.open = False
+            await self.flush(scope.keys)
+
+    def _buffer(self, skey: str) -> _Pending:
+        self.writes += 1
+        entry = self._pending.get(skey)
+        if entry is None:
+            entry = self._pending[skey] = _Pending()
+        return entry
+
+    async def _write_outside_update(self, skey: str):
+        scope = _update_scope.get()
+        if scope is not None and scope.open:
+            scope.keys.add(skey)
+        else:
+            # Scheduler jobs, background tasks, tasks outliving their update
+            await self.flush([skey])
+
+    def _buffered(self, skey: str) -> List[_Pending]:
+        """Unwritten entries for a key, newest first."""
+        return [e for e in (self._pending.get(skey), self._inflight.get(skey)) if e is not None]
+
+    async def _retry_later(self):
+        await asyncio.sleep(self.retry_delay)
+        self._retry_task = None
+        await self.flush()
+
+    async def flush(self, keys: Optional[Iterable[str]] = None) -> int:
+        """Writes the given buffered keys (all by default) now. Returns the number of rows written."""
+        if keys is None:
+            pending, self._pending = self._pending, {}
+        else:
+            pending = {skey: self._pending.pop(skey) for skey in keys if skey in self._pending}
+        if not pending:
+            return 0
+        self._inflight.update(pending)
+
+        records: List = []
+        for skey, entry in pending.items():
+            try:
+                blob = dump_data(entry.data) if entry.set_data else None
+            except (TypeError, ValueError) as e:
+                logger.error(f"Dropping unserializable FSM data for {skey}: {e}")
+                blob, entry.set_data = None, False
+            records.append((skey, entry.state, blob, entry.set_state, entry.set_data, float(self.ttl)))
+
+        saved = await self.db.save_fsm_records(records)
+        for skey, entry in pending.items():
+            if self._inflight.get(skey) is entry:
+                del self._inflight[skey]
+
+        if not saved:
+            # Put them back under any newer writes and retry later
+            for skey, entry in pending.items():
+                newer = self._pending.get(skey)
+                if newer is None:
+                    self._pending[skey] = entry
+                    continue
+                if entry.set_state and not newer.set_state:
+                    newer.state, newer.set_state = entry.state, True
+                if entry.set_data and not newer.set_data:
+                    newer.data, newer.set_data = entry.data, True
+            if self._retry_task is None or self._retry_task.done():
+                self._retry_task = asyncio.create_task(self._retry_later())
+            return 0
+        self.flushed_rows += len(records)
+        return len(records)
+
+    def buffered(self) -> Dict[str, "_Pending"]:
+        """Writes not yet in Postgres, keyed like the table (what this storage holds in memory)."""
+        return {**self._inflight, **self._pending}
+
+    def stats(self) -> Dict:
+        return {"pending": len(self._pending), "writes": self.writes, "flushed_rows": self.flushed_rows}
@@ -0,0 +1,118 @@
+# services/health.py
+
+import logging
+from typing import Dict
+
+from aiohttp import web
+
+from bot_config import RUN_WORKERS_IN_WEB
+from database import db
+from middlewares.api_calls import api_call_stats
+from services.invalidation import invalidation_bus
+from services.metrics import registry
+from services.outbound import outbound
+
+logger = logging.getLogger(__name__)
+
+
+# ----------------------------------------------------
+# COLLECTORS (read at scrape time)
+# ----------------------------------------------------
+@registry.collector
+def _db_pool():
+    pool = db._pool
+    if pool is None:
+        return []
+    size, idle = pool.get_size(), pool.get_idle_size()
+    return [
+        ("db_pool_size", "gauge", "Open pool connections", [({}, size)]),
+        ("db_pool_in_use", "gauge", "Pool connections in use", [({}, size - idle)]),
+        ("db_pool_max", "gauge", "Pool size limit", [({}, pool.get_max_size())]),
+    ]
+
+
+@registry.collector
+def _outbound():
+    stats = outbound.stats()
+    lanes = stats["lanes"]
+    return [
+        ("bot_api_calls_total", "counter", "Outbound Bot API requests by method",
+         [({"method": m}, n) for m, n in api_call_stats.calls_by_method.items()]),
+        ("bot_api_429_total", "counter", "Bot API flood-wait (429) responses",
+         [({}, stats["retry_after_count"])]),
+        ("outbound_queue_depth", "gauge", "Sends waiting for a rate limit token by lane",
+         [({"lane": lane}, s["queue_depth"]) for lane, s in lanes.items()]),
+        ("outbound_errors_total", "counter", "Failed sends by lane",
+         [({"lane": lane}, s["errors"]) for lane, s in lanes.items()]),
+    ]
+
+
+@registry.collector
+async def _backlogs():
+    counts = await db.get_backlog_counts()
+    return [
+        ("match_queue_depth", "gauge", "Match drops waiting to be posted",
+         [({}, counts.get("match_queue", 0))]),
+        ("fsm_storage_keys", "gauge", "Unexpired FSM keys", [({}, counts.get("fsm_keys", 0))]),
+    ]
+
+
+@registry.collector
+def _invalidation():
+    stats = invalidation_bus.stats()
+    return [
+        ("invalidation_events_total", "counter", "Invalidation events received by type",
+         [({"type": t}, n) for t, n in stats["received"].items()]),
+        ("invalidation_lag_seconds", "gauge", "Publish-to-delivery lag of the last event",
+         [({}, stats["last_lag"])]),
+    ]
+
+
+def update_queue_collector(queue):
+    """Webhook queue gauges; registered by create_app once the queue exists."""
+    def collect():
+        stats = queue.stats()
+        return [
+            ("update_queue_depth", "gauge", "Updates waiting for a lane", [({}, stats["depth"])]),
+            ("update_queue_max_wait_seconds", "gauge", "Longest queue wait seen", [({}, stats["max_wait"])]),
+            ("update_queue_total", "counter", "Webhook updates by outcome",
+             [({"outcome": k}, stats.get(k, 0)) for k in ("accepted", "shed", "deferred", "processed", "failed")]),
+        ]
+    registry.collector(collect)
+
+
+# ----------------------------------------------------
+# ENDPOINTS
+# ----------------------------------------------------
+async def metrics(request: web.Request) -> web.Response:
+    body = await registry.render()
+    return web.Response(text=body, content_type="text/plain", charset="utf-8",
+                        headers={"X-Content-Type-Options": "nosniff"})
+
+
+async def readiness_checks() -> Dict[str, bool]:
+    from notifications import job_worker, scheduler
+    from scheduler.match_queue_scheduler import match_queue_scheduler
+    from services.outbox import outbox_worker
+
+    checks = {
+        "database": await db.ping(),
+        "scheduler": scheduler.running,
+    }
+    if RUN_WORKERS_IN_WEB:
+        checks["job_worker"] = job_worker is not None and job_worker.is_running()
+        checks["match_queue_scheduler"] = match_queue_scheduler.is_running()
+        checks["outbox_worker"] = outbox_worker.is_running()
+    return checks
+
+
+async def ready(request: web.Request) -> web.Response:
+    """200 only if the database answers and the schedulers/workers are alive."""
+    checks = await readiness_checks()
+    body = {
+        "ready": all(checks.values()),
+        "checks": checks,
+        # Informational: caches fall back to periodic resyncs while it reconnects
+        "invalidation_bus": invalidation_bus.connected,
+    }
+    return web.json_response(body, status=200 if body["ready"] else 503)
@@ -0,0 +1,148 @@
+# services/invalidation.py
+
+import asyncio
+import json
+import logging
+import time
+from collections import Counter, defaultdict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import asyncpg
+
+from database import INVALIDATION_CHANNEL, LIKE_ADDED, MATCH_CREATED, USER_BANNED, USER_UPDATED
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = (USER_UPDATED, USER_BANNED, LIKE_ADDED, MATCH_CREATED)
+RECONNECT_DELAY = 5     # seconds between LISTEN connection checks / retries
+LAG_WARN = 5.0          # seconds from publish to delivery worth a warning
+
+EventHandler = Callable[[Dict], None]
+ResyncHandler = Callable[[], Awaitable]
+
+
+class InvalidationBus:
+    """
+    Delivers typed cache-invalidation events between bot processes.
+
+    Database write methods publish events with Database.publish_event
+    (NOTIFY invalidation, sent on commit); every process holds one
+    dedicated LISTEN connection and fans events out to local subscribers.
+    NOTIFY is fire-and-forget, so when the connection drops and comes back
+    the resync handlers are run: caches must reload rather than trust
+    they saw every event.
+    """
+
+    def __init__(self):
+        self.db = None
+        self._handlers: Dict[str, List[EventHandler]] = defaultdict(list)
+        self._resync_handlers: List[ResyncHandler] = []
+        self._task: Optional[asyncio.Task] = None
+        self._listener: Optional[asyncpg.Connection] = None
+
+        self.received: Counter = Counter()
+        self.reconnects = 0
+        self.handler_errors = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.last_event_at: Optional[float] = None
+
+    def subscribe(self, event_type: str, handler: EventHandler):
+        """Calls `handler(event)` for each event of this type. Keep it cheap and sync."""
+        if event_type not in EVENT_TYPES:
+            raise ValueError(f"Unknown event type: {event_type}")
+        self._handlers[event_type].append(handler)
+
+    def on_resync(self, handler: ResyncHandler):
+        """Runs `await handler()` whenever events may have been missed."""
+        self._resync_handlers.append(handler)
+
+    async def start(self, db):
+        self.db = db
+        await self._ensure_listener()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self._listener and not self._listener.is_closed():
+            await self._listener.close()
+        self._listener = None
+
+    @property
+    def connected(self) -> bool:
+        return self._listener is not None and not self._listener.is_closed()
+
+    def stats(self) -> Dict:
+        return {
+            "connected": self.connected,
+            "received": dict(self.received),
+            "reconnects": self.reconnects,
+            "handler_errors": self.handler_errors,
+            "last_lag": round(self.last_lag, 3),
+            "max_lag": round(self.max_lag, 3),
+            "last_event_age": round(time.time() - self.last_event_at, 1) if self.last_event_at else None,
+        }
+
+    # ----------------------------------------------------
+    # DELIVERY
+    # ----------------------------------------------------
+    def _on_notify(self, conn, pid, channel, payload):
+        try:
+            event = json.loads(payload)
+            event_type = event["type"]
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"Ignoring malformed invalidation payload: {payload[:200]!r}")
+            return
+
+        now = time.time()
+        self.received[event_type] += 1
+        self.last_event_at = now
+        if "ts" in event:
+            self.last_lag = max(0.0, now - event["ts"])
+            self.max_lag = max(self.max_lag, self.last_lag)
+            if self.last_lag > LAG_WARN:
+                logger.warning(f"Invalidation event {event_type} delivered {self.last_lag:.1f}s after publish")
+
+        for handler in self._handlers.get(event_type, ()):
+            try:
+                handler(event)
+            except Exception as e:
+                self.handler_errors += 1
+                logger.error(f"Invalidation handler for {event_type} failed: {e}")
+
+    async def _resync(self):
+        for handler in self._resync_handlers:
+            try:
+                await handler()
+            except Exception as e:
+                logger.error(f"Invalidation resync handler failed: {e}")
+
+    # ----------------------------------------------------
+    # LISTEN
+    # ----------------------------------------------------
+    async def _ensure_listener(self) -> bool:
+        """True if a new LISTEN connection was opened."""
+        if self.connected:
+            return False
+        try:
+            self._listener = await asyncpg.connect(self.db.dsn)
+            await self._listener.add_listener(INVALIDATION_CHANNEL, self._on_notify)
+            logger.info(f"Invalidation bus listening on '{INVALIDATION_CHANNEL}'")
+            return True
+        except Exception as e:
+            self._listener = None
+            logger.error(f"Invalidation bus could not LISTEN (retrying in {RECONNECT_DELAY}s): {e}")
+            return False
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(RECONNECT_DELAY)
+            if await self._ensure_listener():
+                self.reconnects += 1
+                await self._resync()
+
+
+invalidation_bus = InvalidationBus()
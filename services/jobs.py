@@ -0,0 +1,212 @@
+# services/jobs.py
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+import asyncpg
+
+from services.metrics import job_seconds
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "jobs"        # NOTIFY channel fired by the jobs insert trigger (payload = queue)
+DEFAULT_QUEUE = "default"
+NOTIFICATIONS_QUEUE = "notifications"
+BROADCAST_QUEUE = "broadcast"
+
+# Concurrent jobs per queue in one worker process
+QUEUE_CONCURRENCY = {
+    DEFAULT_QUEUE: 2,
+    NOTIFICATIONS_QUEUE: 1,
+    BROADCAST_QUEUE: 1,
+}
+
+RETRY_BASE = 10         # seconds before the first retry, doubled per attempt
+LEASE = 300             # a running job is reclaimed if not heartbeated for this long
+HEARTBEAT_INTERVAL = 60
+POLL_INTERVAL = 10      # re-check for delayed/retried jobs (and missed notifications)
+PURGE_INTERVAL = 3600
+KEEP_DONE_DAYS = 7
+
+JobHandler = Callable[..., Awaitable]
+
+# name -> (handler, queue); filled by @job at import time
+_handlers: Dict[str, Tuple[JobHandler, str]] = {}
+
+
+def job(name: str, queue: str = DEFAULT_QUEUE):
+    """
+    Registers a coroutine as a background job. It is called as
+    handler(bot, **payload) by a JobWorker serving `queue`.
+    """
+    def decorator(func):
+        _handlers[name] = (func, queue)
+        return func
+    return decorator
+
+
+async def enqueue(db, name: str, payload: Optional[Dict] = None, delay_seconds: float = 0,
+                  dedupe_key: Optional[str] = None, conn=None) -> Optional[int]:
+    """Queues a registered job on its queue. Returns None if deduplicated."""
+    queue = _handlers[name][1] if name in _handlers else DEFAULT_QUEUE
+    return await db.enqueue_job(
+        name, queue=queue, payload=payload, delay_seconds=delay_seconds,
+        dedupe_key=dedupe_key, conn=conn
+    )
+
+
+class JobWorker:
+    """
+    Runs jobs from the jobs table with per-queue concurrency.
+
+    Jobs are claimed with FOR UPDATE SKIP LOCKED, so any number of worker
+    processes can serve the same queues. Failed jobs are retried with
+    exponential backoff up to their max_attempts. Running jobs are
+    heartbeated; if a worker dies, its jobs are reclaimed after LEASE.
+    """
+
+    def __init__(self, db, bot, queues: Optional[Dict[str, int]] = None):
+        self.db = db
+        self.bot = bot
+        self.queues = dict(queues or QUEUE_CONCURRENCY)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._running: Dict[str, Dict[int, asyncio.Task]] = {q: {} for q in self.queues}
+        self._task: Optional[asyncio.Task] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._listener: Optional[asyncpg.Connection] = None
+        self._wakeup = asyncio.Event()
+        self._last_purge = 0.0
+
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            self._heartbeat_task = asyncio.create_task(self._heartbeat())
+            logger.info(f"Job worker {self.worker_id} serving {self.queues}")
+
+    async def close(self):
+        for task in (self._task, self._heartbeat_task):
+            if task:
+                task.cancel()
+        self._task = self._heartbeat_task = None
+
+        # Interrupted jobs go straight back to pending instead of waiting out the lease
+        interrupted = [job_id for running in self._running.values() for job_id in running]
+        for running in self._running.values():
+            for task in running.values():
+                task.cancel()
+        if interrupted:
+            await self.db.release_jobs(interrupted)
+
+        if self._listener and not self._listener.is_closed():
+            await self._listener.close()
+        self._listener = None
+
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def stats(self) -> Dict:
+        return {
+            "worker_id": self.worker_id,
+            "running": {q: len(r) for q, r in self._running.items()},
+            "completed": self.completed,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
+
+    # ----------------------------------------------------
+    # LISTEN
+    # ----------------------------------------------------
+    def _on_notify(self, conn, pid, channel, payload):
+        if payload in self.queues:
+            self._wakeup.set()
+
+    async def _ensure_listener(self):
+        if self._listener and not self._listener.is_closed():
+            return
+        try:
+            self._listener = await asyncpg.connect(self.db.dsn)
+            await self._listener.add_listener(CHANNEL, self._on_notify)
+        except Exception as e:
+            self._listener = None
+            logger.error(f"Job worker could not LISTEN (polling every {POLL_INTERVAL}s): {e}")
+
+    # ----------------------------------------------------
+    # MAIN LOOP
+    # ----------------------------------------------------
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            await self._ensure_listener()
+            try:
+                for queue, concurrency in self.queues.items():
+                    free = concurrency - len(self._running[queue])
+                    if free <= 0:
+                        continue
+                    for row in await self.db.claim_jobs(queue, free, self.worker_id, LEASE):
+                        task = asyncio.create_task(self._execute(row))
+                        self._running[queue][row["id"]] = task
+
+                if time.monotonic() - self._last_purge > PURGE_INTERVAL:
+                    self._last_purge = time.monotonic()
+                    await self.db.purge_jobs(KEEP_DONE_DAYS)
+            except Exception as e:
+                logger.error(f"Job worker error: {e}")
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            running = [job_id for r in self._running.values() for job_id in r]
+            if running:
+                await self.db.heartbeat_jobs(running, self.worker_id)
+
+    async def _execute(self, row: Dict):
+        job_id, name, queue = row["id"], row["name"], row["queue"]
+        started = time.monotonic()
+        try:
+            entry = _handlers.get(name)
+            if entry is None:
+                await self.db.fail_job(job_id, f"No handler registered for job '{name}'")
+                self.failed += 1
+                return
+
+            payload = json.loads(row["payload"] or "{}")
+            try:
+                await entry[0](self.bot, **payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"[:1000]
+                job_seconds.observe(time.monotonic() - started, job=name, status="error")
+                if row["attempts"] >= row["max_attempts"]:
+                    self.failed += 1
+                    logger.error(f"Job {name} #{job_id} failed permanently after {row['attempts']} attempts: {error}")
+                    await self.db.fail_job(job_id, error)
+                else:
+                    self.retried += 1
+                    delay = RETRY_BASE * 2 ** (row["attempts"] - 1)
+                    logger.warning(f"Job {name} #{job_id} failed (attempt {row['attempts']}), retrying in {delay}s: {error}")
+                    await self.db.retry_job(job_id, error, delay)
+                return
+
+            self.completed += 1
+            job_seconds.observe(time.monotonic() - started, job=name, status="done")
+            await self.db.complete_job(job_id)
+            logger.info(f"Job {name} #{job_id} done in {time.monotonic() - started:.1f}s")
+        finally:
+            self._running[queue].pop(job_id, None)
+            # A slot freed up: claim more right away
+            self._wakeup.set()
@@ -0,0 +1,190 @@
+# services/log_pipeline.py
+
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+from bot_config import LOG_FORMAT, LOG_LEVEL, LOG_RATE_LIMIT, LOG_SAMPLING
+from services.metrics import registry
+
+QUEUE_SIZE = 10000      # records waiting for the writer thread; beyond that they are dropped
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# LogRecord attributes that are not user-supplied `extra=` fields
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def parse_sampling(value: str) -> Dict[str, float]:
+    """'handlers_chat=0.1,aiogram.event=0.05' -> {'handlers_chat': 0.1, 'aiogram.event': 0.05}"""
+    rates = {}
+    for part in value.split(","):
+        name, _, rate = part.partition("=")
+        if name.strip() and rate.strip():
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, any `extra=` fields, exc."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class LogSampler(logging.Filter):
+    """
+    Runs on the logging thread before a record is queued. Below WARNING,
+    records are sampled per logger (longest dotted prefix in `rates` wins)
+    and rate limited per logger name with a token bucket of `rate_limit`
+    records/second. The next record let through carries `suppressed=N`.
+    """
+
+    def __init__(self, rates: Dict[str, float], rate_limit: float):
+        super().__init__()
+        self.rates = rates
+        self.rate_limit = rate_limit
+        self.sampled_out = 0
+        self.rate_limited = 0
+        self._rate_cache: Dict[str, float] = {}
+        self._buckets: Dict[str, tuple] = {}        # logger name -> (tokens, last refill)
+        self._suppressed: Dict[str, int] = {}
+
+    def _rate_for(self, name: str) -> float:
+        rate = self._rate_cache.get(name)
+        if rate is None:
+            rate, prefix = 1.0, name
+            while prefix:
+                if prefix in self.rates:
+                    rate = self.rates[prefix]
+                    break
+                prefix = prefix.rpartition(".")[0]
+            self._rate_cache[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        name = record.name
+        rate = self._rate_for(name)
+        if rate < 1.0 and random.random() >= rate:
+            self.sampled_out += 1
+            return False
+
+        if self.rate_limit > 0:
+            now = time.monotonic()
+            tokens, last = self._buckets.get(name, (self.rate_limit, now))
+            tokens = min(self.rate_limit, tokens + (now - last) * self.rate_limit)
+            if tokens < 1:
+                self._buckets[name] = (tokens, now)
+                self._suppressed[name] = self._suppressed.get(name, 0) + 1
+                self.rate_limited += 1
+                return False
+            self._buckets[name] = (tokens - 1, now)
+            suppressed = self._suppressed.pop(name, 0)
+            if suppressed:
+                record.suppressed = suppressed
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Queues the record as is (formatting happens on the writer thread); drops it when the queue is full."""
+
+    def __init__(self, q: queue.Queue):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogPipeline:
+    """
+    Root logging setup: the root logger's only handler puts records on a
+    bounded queue; a QueueListener thread formats them (JSON or text) and
+    writes to stdout and the log file. Logging calls on the event loop then
+    cost a filter check and a queue put, never file I/O.
+    """
+
+    def __init__(self):
+        self.handler: Optional[NonBlockingQueueHandler] = None
+        self.sampler: Optional[LogSampler] = None
+        self._listener: Optional[QueueListener] = None
+
+    def start(self, log_file: Optional[str] = None):
+        if self._listener is not None:
+            return
+        formatter = JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT)
+        outputs = [logging.StreamHandler(sys.stdout)]
+        if log_file:
+            outputs.append(logging.FileHandler(log_file))
+        for output in outputs:
+            output.setFormatter(formatter)
+
+        self.sampler = LogSampler(parse_sampling(LOG_SAMPLING), LOG_RATE_LIMIT)
+        self.handler = NonBlockingQueueHandler(queue.Queue(QUEUE_SIZE))
+        self.handler.addFilter(self.sampler)
+
+        root = logging.getLogger()
+        root.handlers[:] = [self.handler]
+        root.setLevel(LOG_LEVEL)
+
+        self._listener = QueueListener(self.handler.queue, *outputs, respect_handler_level=True)
+        self._listener.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Flushes queued records; safe to call more than once."""
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+    def stats(self) -> Dict:
+        if self.handler is None:
+            return {}
+        return {
+            "queued": self.handler.queue.qsize(),
+            "dropped": self.handler.dropped,
+            "sampled_out": self.sampler.sampled_out,
+            "rate_limited": self.sampler.rate_limited,
+        }
+
+
+log_pipeline = LogPipeline()
+
+
+@registry.collector
+def _logging():
+    stats = log_pipeline.stats()
+    if not stats:
+        return []
+    return [
+        ("log_queue_depth", "gauge", "Log records waiting for the writer thread", [({}, stats["queued"])]),
+        ("log_records_discarded_total", "counter", "Log records not written, by reason",
+         [({"reason": r}, stats[r]) for r in ("dropped", "sampled_out", "rate_limited")]),
+    ]
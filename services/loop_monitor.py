@@ -0,0 +1,133 @@
+# services/loop_monitor.py
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from bot_config import LOOP_BLOCK_THRESHOLD, LOOP_MONITOR_DEBUG
+from services.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+PROBE_INTERVAL = 0.25   # seconds between lag probes
+MAX_REPORTS = 50        # recent blocking reports kept for inspection
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+loop_lag_seconds = registry.histogram(
+    "event_loop_lag_seconds", "How late the loop ran a scheduled wakeup", (), buckets=LAG_BUCKETS
+)
+loop_blocked_total = registry.counter(
+    "event_loop_blocked", "Callbacks that held the event loop past the threshold", ()
+)
+
+
+class LoopMonitor:
+    """
+    Measures event loop lag with a probe task that sleeps PROBE_INTERVAL and
+    records how late it woke up. A wakeup later than `threshold` means some
+    callback held the loop that long; it is counted, logged and kept in
+    `reports`.
+
+    In debug mode a watchdog thread also notices the stalled probe while the
+    loop is still blocked and captures the loop thread's stack, so the
+    report shows the code that was actually running.
+    """
+
+    def __init__(self, threshold: float = LOOP_BLOCK_THRESHOLD, debug: bool = LOOP_MONITOR_DEBUG):
+        self.threshold = threshold
+        self.debug = debug
+        self.reports: Deque[Dict] = deque(maxlen=MAX_REPORTS)
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.blocked = 0
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._expected_wakeup = 0.0
+        self._captured: Optional[Tuple[float, str]] = None    # (wakeup it belongs to, stack)
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._expected_wakeup = time.monotonic() + PROBE_INTERVAL
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._probe())
+        if self.debug:
+            self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._watchdog.start()
+        logger.info(f"Loop monitor started (threshold {self.threshold * 1000:.0f} ms, debug={self.debug})")
+
+    async def close(self):
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self._watchdog:
+            await asyncio.to_thread(self._watchdog.join, 1)
+            self._watchdog = None
+
+    # ----------------------------------------------------
+    # PROBE (on the loop)
+    # ----------------------------------------------------
+    async def _probe(self):
+        while True:
+            self._expected_wakeup = time.monotonic() + PROBE_INTERVAL
+            await asyncio.sleep(PROBE_INTERVAL)
+            lag = max(0.0, time.monotonic() - self._expected_wakeup)
+            loop_lag_seconds.observe(lag)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= self.threshold:
+                self._report(lag)
+
+    def _report(self, lag: float):
+        self.blocked += 1
+        loop_blocked_total.inc()
+        captured, self._captured = self._captured, None
+        stack = captured[1] if captured and captured[0] == self._expected_wakeup else None
+        self.reports.append({"at": time.time(), "blocked_ms": round(lag * 1000, 1), "stack": stack})
+        if stack:
+            logger.warning(f"Event loop blocked for {lag * 1000:.0f} ms in:\n{stack}")
+        else:
+            logger.warning(f"Event loop blocked for {lag * 1000:.0f} ms")
+
+    # ----------------------------------------------------
+    # WATCHDOG (own thread, debug mode)
+    # ----------------------------------------------------
+    def _watch(self):
+        interval = max(self.threshold / 2, 0.01)
+        while not self._stopped.wait(interval):
+            expected = self._expected_wakeup
+            if time.monotonic() - expected < self.threshold:
+                continue
+            if self._captured is not None and self._captured[0] == expected:
+                continue    # this stall is already captured
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is not None:
+                self._captured = (expected, "".join(traceback.format_stack(frame)))
+
+    def stats(self) -> Dict:
+        return {
+            "last_lag": self.last_lag,
+            "max_lag": self.max_lag,
+            "blocked": self.blocked,
+            "threshold": self.threshold,
+            "debug": self.debug,
+        }
+
+
+loop_monitor = LoopMonitor()
+
+
+@registry.collector
+def _loop():
+    return [
+        ("event_loop_max_lag_seconds", "gauge", "Largest loop lag seen since start", [({}, loop_monitor.max_lag)]),
+    ]
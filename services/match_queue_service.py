@@ -6,6 +6,8 @@ from datetime import datetime, timedelta
 from bot_config import CHANNEL_ID, ADMIN_GROUP_ID
 from database import Database
 from services.content_builder import build_match_drop_text
+from services.outbound import Priority
+from services.outbox import message_payload
 
 
 PRIME_POST_TIMES = [
@@ -17,6 +19,7 @@ PRIME_POST_TIMES = [
 ]
 
 MAX_POSTS_PER_SLOT = 3  # cap how many matches to post per prime slot
+CLAIM_LEASE = 900       # seconds a claimed item is reserved for its poster
 
 
 class MatchQueueService:
@@ -43,10 +46,11 @@ class MatchQueueService:
     # ----------------------------------------------------
     # INSERT MATCH INTO QUEUE
     # ----------------------------------------------------
-    async def queue_match(self, match, user1, user2, special_type, vibe_score, interests):
+    async def queue_match(self, match, user1, user2, special_type, vibe_score, interests, conn=None):
         """
         Push match into queue for channel posting.
         `interests` MUST be a list -> stored as JSON string.
+        The admin log goes through the outbox in the same transaction as the insert (pass `conn`).
         """
         
         
@@ -60,15 +64,16 @@ class MatchQueueService:
                 campus1, campus2, department1, department2,
                 year1, year2,
                 interests, vibe_score, special_type,
-                next_post_time
+                next_post_time, priority
             )
             VALUES (
-                $1,$2,$3,$4,$5,$6,$7,$8,$9,$10,$11,$12,$13
+                $1,$2,$3,$4,$5,$6,$7,$8,$9,$10,$11,$12,$13,
+                match_queue_priority($11, $10::jsonb, $12)
             )
             RETURNING id;
         """
 
-        row = await self.db.pool.fetchrow(
+        row = await (conn or self.db.pool).fetchrow(
             query,
             match["id"], user1["id"], user2["id"],
             user1.get("campus"), user2.get("campus"),
@@ -83,8 +88,7 @@ class MatchQueueService:
         queue_id = row["id"]
 
         # Log to admin
-        await self.bot.send_message(
-            ADMIN_GROUP_ID,
+        await self._log_to_admin(
             (
                 "🎉 <b>NEW MATCH QUEUED!</b>\n\n"
                 f"🆔 <b>Queue ID:</b> <code>{queue_id}</code>\n"
@@ -98,28 +102,69 @@ class MatchQueueService:
                 f"💡 <b>Shared Interests:</b> {', '.join(interests) if interests else 'None'}\n\n"
                 "🚀 <i>Ready to drop into the channel!</i>"
             ),
-            parse_mode="HTML"
+            parse_mode="HTML",
+            conn=conn
         )
 
         return queue_id
 
+    async def _log_to_admin(self, text, parse_mode=None, conn=None):
+        if not ADMIN_GROUP_ID:
+            return
+        await self.db.enqueue_outbox(
+            int(ADMIN_GROUP_ID), "admin_log", message_payload(text, parse_mode),
+            priority=Priority.NOTIFICATION, conn=conn
+        )
+
     # ----------------------------------------------------
-    # FETCH ALL ITEMS READY TO POST
+    # CLAIM DUE ITEMS (committed lease)
     # ----------------------------------------------------
-    async def get_due_items(self):
+    async def claim_due_items(self, limit, conn=None):
+        """
+        Leases the top `limit` due rows by priority for CLAIM_LEASE seconds in
+        one committed statement, so the posting happens outside any transaction.
+        Leased rows are skipped by other instances until mark_sent/record_error
+        releases them or the lease runs out (poster crashed mid-slot).
+        Posters mark an item sent before posting it (record_error undoes that),
+        so a posted item can never be claimed again.
+        """
         query = """
-            SELECT *
+            WITH claimed AS (
+                UPDATE match_queue
+                SET claimed_until = NOW() + make_interval(secs => $2)
+                WHERE id IN (
+                    SELECT id
+                    FROM match_queue
+                    WHERE sent = FALSE
+                    AND next_post_time <= NOW()
+                    AND (claimed_until IS NULL OR claimed_until <= NOW())
+                    ORDER BY priority DESC NULLS LAST, created_at ASC
+                    LIMIT $1
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING *
+            )
+            SELECT * FROM claimed ORDER BY priority DESC NULLS LAST, created_at ASC;
+        """
+        return await (conn or self.db.pool).fetch(query, limit, float(CLAIM_LEASE))
+
+    async def seconds_until_next_due(self):
+        """
+        Seconds until the earliest pending item can be claimed (<= 0 if overdue,
+        None if queue empty). A leased row counts from when its lease runs out,
+        so rows being posted elsewhere don't keep the scheduler spinning.
+        """
+        return await self.db.pool.fetchval(
+            """
+            SELECT EXTRACT(EPOCH FROM MIN(
+                CASE WHEN claimed_until > NOW() THEN GREATEST(next_post_time, claimed_until)
+                     ELSE next_post_time END
+            ) - NOW())
             FROM match_queue
             WHERE sent = FALSE
-            AND next_post_time <= NOW()
-            ORDER BY vibe_score DESC, created_at ASC;
-        """
-        return await self.db.pool.fetch(query)
+            """
+        )
 
-    # ----------------------------------------------------
-    # SCORING FUNCTION
-    # ----------------------------------------------------
-    
     async def get_all_pending(self):
             query = """
                 SELECT *
@@ -129,62 +174,75 @@ class MatchQueueService:
             """
             return await self.db.pool.fetch(query)
 
-    def compute_score(self, item):
-        score = (item.get("vibe_score") or 0) * 2
-        try:
-            interests = json.loads(item.get("interests") or "[]")
-        except Exception:
-            interests = []
-
-        score += len(interests) * 5
-
-        special = item.get("special_type")
-        if special == "high-vibe":
-            score += 100  # top priority
-        elif special == "freshman-senior":
-            score += 80
-        elif special == "cross-campus":
-            score += 60
-        elif special == "shared-interests":
-            score += 40
-        elif special == "same-department":
-            score += 20
-        elif special == "opposite-department":
-            score += 10
-
-        return score
+    # ----------------------------------------------------
+    # PRIORITY BACKFILL (rows queued before the priority column)
+    # ----------------------------------------------------
+    async def backfill_priorities(self, batch_size=500):
+        total = 0
+        while True:
+            status = await self.db.pool.execute(
+                """
+                UPDATE match_queue
+                SET priority = match_queue_priority(vibe_score, interests, special_type)
+                WHERE id IN (
+                    SELECT id FROM match_queue WHERE priority IS NULL LIMIT $1
+                )
+                """,
+                batch_size
+            )
+            updated = int(status.split()[-1])
+            total += updated
+            if updated < batch_size:
+                return total
 
     # ----------------------------------------------------
     # MARK QUEUE ITEM AS SENT
     # ----------------------------------------------------
-    async def mark_sent(self, queue_id):
-        await self.db.pool.execute(
-            "UPDATE match_queue SET sent = TRUE, sent_at = NOW() WHERE id = $1",
+    async def mark_sent(self, queue_id, conn=None):
+        await (conn or self.db.pool).execute(
+            "UPDATE match_queue SET sent = TRUE, sent_at = NOW(), claimed_until = NULL WHERE id = $1",
             queue_id
         )
 
     # ----------------------------------------------------
-    # RESCHEDULE ITEM TO NEXT SLOT
+    # RESCHEDULE EVERYTHING STILL DUE (one statement)
     # ----------------------------------------------------
-    async def reschedule(self, queue_id):
+    async def reschedule_due(self, conn=None):
+        """
+        Moves every still-due, unsent item to the next slot. Rows leased or
+        locked by another instance are left alone. Returns (ids, new_time).
+        """
         new_time = self.compute_next_post_time()
-        await self.db.pool.execute(
-            "UPDATE match_queue SET next_post_time = $1 WHERE id = $2",
-            new_time, queue_id
+        rows = await (conn or self.db.pool).fetch(
+            """
+            UPDATE match_queue SET next_post_time = $1
+            WHERE id IN (
+                SELECT id FROM match_queue
+                WHERE sent = FALSE AND next_post_time <= NOW()
+                AND (claimed_until IS NULL OR claimed_until <= NOW())
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id
+            """,
+            new_time
         )
+        return sorted(r["id"] for r in rows), new_time
 
     # ----------------------------------------------------
     # SAVE SEND ERROR
     # ----------------------------------------------------
-    async def record_error(self, queue_id, error_msg):
-        await self.db.pool.execute(
-            "UPDATE match_queue SET error = $1 WHERE id = $2",
+    async def record_error(self, queue_id, error_msg, conn=None, notify=True):
+        # Posting failed: the item goes back to unsent so the next slot retries it
+        await (conn or self.db.pool).execute(
+            "UPDATE match_queue SET error = $1, sent = FALSE, sent_at = NULL, claimed_until = NULL WHERE id = $2",
             error_msg, queue_id
         )
+        if not notify:
+            return
 
-        await self.bot.send_message(
-            ADMIN_GROUP_ID,
+        await self._log_to_admin(
             f"🟥 MATCH ERROR\n"
             f"Queue ID: {queue_id}\n"
-            f"Error: {error_msg}"
+            f"Error: {error_msg}",
+            conn=conn
         )
@@ -0,0 +1,168 @@
+# services/memory_diag.py
+
+import asyncio
+import logging
+import sys
+import tracemalloc
+import types
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_ITEMS = 1000     # containers larger than this are sized from a sample and extrapolated
+MAX_DEPTH = 8
+TRACE_FRAMES = 10       # frames kept per allocation while tracemalloc runs
+TOP_N = 15
+
+_CONTAINERS = (dict, list, tuple, set, frozenset, deque)
+_OPAQUE = (type, types.ModuleType, types.FunctionType, types.MethodType, types.BuiltinFunctionType)
+
+
+def approx_size(obj: Any) -> int:
+    """Deep size in bytes of containers and plain data objects (sampled past SAMPLE_ITEMS items)."""
+    seen = set()
+
+    def size(o, depth: int) -> float:
+        if id(o) in seen or isinstance(o, _OPAQUE):
+            return 0
+        seen.add(id(o))
+        total = sys.getsizeof(o)
+        if depth >= MAX_DEPTH:
+            return total
+
+        if isinstance(o, dict):
+            items = list(o.items()) if len(o) <= SAMPLE_ITEMS else [kv for _, kv in zip(range(SAMPLE_ITEMS), o.items())]
+            children = sum(size(k, depth + 1) + size(v, depth + 1) for k, v in items)
+        elif isinstance(o, _CONTAINERS):
+            items = list(o) if len(o) <= SAMPLE_ITEMS else [v for _, v in zip(range(SAMPLE_ITEMS), o)]
+            children = sum(size(v, depth + 1) for v in items)
+        elif hasattr(o, "__dict__"):
+            return total + size(vars(o), depth + 1)
+        else:
+            return total
+
+        if items and len(o) > len(items):
+            children *= len(o) / len(items)
+        return total + children
+
+    return int(size(obj, 0))
+
+
+def _entries(obj: Any) -> Optional[int]:
+    try:
+        return len(obj)
+    except TypeError:
+        return None
+
+
+def process_memory() -> Dict[str, int]:
+    """Current and peak resident set size in bytes (Linux /proc; empty elsewhere)."""
+    fields = {"VmRSS": "rss", "VmHWM": "peak_rss"}
+    out = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in fields:
+                    out[fields[key]] = int(value.split()[0]) * 1024
+    except OSError:
+        pass
+    return out
+
+
+# ----------------------------------------------------
+# IN-MEMORY STORES
+# ----------------------------------------------------
+class MemoryStores:
+    """
+    Named in-process stores (module-level dicts, caches, buffers) for the
+    admin memory report. Each module registers a getter returning the
+    container to measure, so reassigned containers are still found.
+    """
+
+    def __init__(self):
+        self._stores: Dict[str, Callable[[], Any]] = {}
+
+    def register(self, name: str, getter: Callable[[], Any]):
+        self._stores[name] = getter
+
+    def report(self) -> List[Tuple[str, Optional[int], int]]:
+        """[(name, entries, approx bytes)], largest first."""
+        rows = []
+        for name, getter in self._stores.items():
+            try:
+                obj = getter()
+                rows.append((name, _entries(obj), approx_size(obj)))
+            except Exception as e:
+                logger.error(f"Could not measure store {name}: {e}")
+        return sorted(rows, key=lambda row: row[2], reverse=True)
+
+
+memory_stores = MemoryStores()
+
+
+# ----------------------------------------------------
+# TRACEMALLOC SNAPSHOTS
+# ----------------------------------------------------
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+class AllocationTracker:
+    """
+    On-demand tracemalloc: the first snapshot starts tracing (which slows
+    allocations and costs memory until stop()). Every snapshot becomes the
+    baseline the next diff is compared against.
+    """
+
+    def __init__(self):
+        self.baseline: Optional[tracemalloc.Snapshot] = None
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def stop(self) -> bool:
+        was_tracing = tracemalloc.is_tracing()
+        tracemalloc.stop()
+        self.baseline = None
+        return was_tracing
+
+    async def snapshot(self, limit: int = TOP_N) -> Tuple[bool, List[str]]:
+        """Returns (tracing just started, top allocation sites)."""
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start(TRACE_FRAMES)
+        snapshot = await asyncio.to_thread(self._take)
+        self.baseline = snapshot
+        stats = await asyncio.to_thread(snapshot.statistics, "lineno")
+        return started, [self._format(stat) for stat in stats[:limit]]
+
+    async def diff(self, limit: int = TOP_N) -> Optional[List[str]]:
+        """Growth since the baseline (None without one); the new snapshot becomes the baseline."""
+        if self.baseline is None or not tracemalloc.is_tracing():
+            return None
+        snapshot = await asyncio.to_thread(self._take)
+        stats = await asyncio.to_thread(snapshot.compare_to, self.baseline, "lineno")
+        self.baseline = snapshot
+        return [self._format(stat, diff=True) for stat in stats[:limit]]
+
+    @staticmethod
+    def _take() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+
+    @staticmethod
+    def _format(stat, diff: bool = False) -> str:
+        frame = stat.traceback[0]
+        where = f"{frame.filename.rsplit('/', 1)[-1]}:{frame.lineno}"
+        if diff:
+            return f"{stat.size_diff / 1024:+9.1f} KB {stat.count_diff:+7d}  {where}"
+        return f"{stat.size / 1024:9.1f} KB {stat.count:7d}  {where}"
+
+
+allocation_tracker = AllocationTracker()
@@ -0,0 +1,201 @@
+# services/metrics.py
+
+import bisect
+import functools
+import inspect
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "aaupulse_"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+JOB_BUCKETS = (0.1, 0.5, 1, 5, 15, 60, 300, 900, 1800, 3600)
+
+LabelValues = Tuple[str, ...]
+Sample = Tuple[str, Dict[str, str], float]      # (name suffix, labels, value)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# ----------------------------------------------------
+# METRIC TYPES
+# ----------------------------------------------------
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        self.name = PREFIX + name
+        self.help = help_text
+        self.labels = tuple(labels)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(l, "")) for l in self.labels)
+
+    def samples(self) -> List[Sample]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        return [("_total", dict(zip(self.labels, k)), v) for k, v in self._values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+        # label values -> [bucket counts..., sum, count]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        row = self._values.get(key)
+        if row is None:
+            row = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.buckets):
+            row[i] += 1
+        row[-2] += value
+        row[-1] += 1
+
+    def samples(self):
+        out = []
+        for key, row in self._values.items():
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, row):
+                cumulative += count
+                out.append(("_bucket", {**labels, "le": _format_value(float(bound))}, cumulative))
+            out.append(("_bucket", {**labels, "le": "+Inf"}, row[-1]))
+            out.append(("_sum", labels, row[-2]))
+            out.append(("_count", labels, row[-1]))
+        return out
+
+
+Collector = Callable[[], Union[Iterable[Tuple], Awaitable[Iterable[Tuple]]]]
+
+
+class Registry:
+    """
+    Metrics rendered in Prometheus text format. Besides Counter/Histogram,
+    collectors are called at scrape time for values that already live
+    elsewhere (pool sizes, queue depths, stats() dicts); they return
+    (name, kind, help, [(labels, value), ...]) tuples and may be async.
+    """
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Collector] = []
+
+    def counter(self, name, help_text, labels=()) -> Counter:
+        metric = Counter(name, help_text, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, func: Collector) -> Collector:
+        self._collectors.append(func)
+        return func
+
+    async def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+
+        for func in self._collectors:
+            try:
+                result = func()
+                if inspect.isawaitable(result):
+                    result = await result
+                for name, kind, help_text, samples in result or ():
+                    lines.append(f"# HELP {PREFIX}{name} {help_text}")
+                    lines.append(f"# TYPE {PREFIX}{name} {kind}")
+                    for labels, value in samples:
+                        lines.append(f"{PREFIX}{name}{_format_labels(labels)} {_format_value(value)}")
+            except Exception as e:
+                logger.error(f"Metrics collector {getattr(func, '__name__', func)} failed: {e}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# ----------------------------------------------------
+# SHARED METRICS
+# ----------------------------------------------------
+updates_total = registry.counter(
+    "updates", "Updates handled, by router module and handler", ("event", "router", "handler")
+)
+handler_errors_total = registry.counter(
+    "handler_errors", "Handlers that raised", ("router", "handler")
+)
+handler_seconds = registry.histogram(
+    "handler_duration_seconds", "Handler run time", ("router", "handler")
+)
+db_query_seconds = registry.histogram(
+    "db_query_duration_seconds", "Database method run time", ("method",)
+)
+db_pool_wait_seconds = registry.histogram(
+    "db_pool_wait_seconds", "Time waiting for a pool connection", ()
+)
+job_seconds = registry.histogram(
+    "job_duration_seconds", "Background job run time", ("job", "status"), buckets=JOB_BUCKETS
+)
+
+
+def timed_methods(histogram: Histogram, label: str = "method", skip: Iterable[str] = ()):
+    """Class decorator: times every public coroutine method into `histogram`."""
+    skip = set(skip)
+
+    def decorator(cls):
+        for name, func in list(vars(cls).items()):
+            if name.startswith("_") or name in skip or not inspect.iscoroutinefunction(func):
+                continue
+            setattr(cls, name, _timed(func, histogram, {label: name}))
+        return cls
+    return decorator
+
+
+def _timed(func, histogram: Histogram, labels: Dict[str, str]):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - started, **labels)
+    return wrapper
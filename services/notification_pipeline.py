@@ -0,0 +1,129 @@
+# services/notification_pipeline.py
+
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from database import Database
+from services.outbound import Priority, outbound_priority
+from services.reachability import PERMANENT, classify_send_error
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 200        # recipients fetched (keyset) and checkpointed per step
+CONCURRENCY = 10        # in-flight sends
+DEFAULT_WINDOW = 30 * 60  # seconds to spread one run over
+
+
+class DeliveryReport:
+    """Outcome of one notification run."""
+
+    def __init__(self, job: str):
+        self.job = job
+        self.sent = 0
+        self.failed = 0     # transient errors (network, 5xx, ...)
+        self.skipped = 0    # permanently unreachable (blocked bot, deleted account)
+        self.duration = 0.0
+
+    @property
+    def total(self) -> int:
+        return self.sent + self.failed + self.skipped
+
+    def summary(self) -> str:
+        return (
+            f"📬 {self.job}: {self.total} recipients in {self.duration:.0f}s\n"
+            f"✅ Sent: {self.sent} • ❌ Failed: {self.failed} • 🚫 Skipped: {self.skipped}"
+        )
+
+
+class NotificationPipeline:
+    """
+    Streams a notification to the active user base.
+
+    Recipients are read in keyset pages (users.id order) starting after the
+    job's rotation cursor, wrapping around once. The cursor is saved after each
+    page, so with max_recipients set, consecutive runs rotate through the whole
+    base instead of hitting the same users. Sends are spaced evenly over
+    window_seconds with at most `concurrency` in flight.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        bot,
+        job: str,
+        window_seconds: float = DEFAULT_WINDOW,
+        max_recipients: Optional[int] = None,
+        batch_size: int = BATCH_SIZE,
+        concurrency: int = CONCURRENCY,
+    ):
+        self.db = db
+        self.bot = bot
+        self.job = job
+        self.window_seconds = window_seconds
+        self.max_recipients = max_recipients
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+
+    async def run(self, text: str) -> DeliveryReport:
+        report = DeliveryReport(self.job)
+        started = time.monotonic()
+
+        expected = await self.db.count_active_user_ids()
+        if self.max_recipients is not None:
+            expected = min(expected, self.max_recipients)
+        # Even spacing between send start times across the window
+        spacing = self.window_seconds / expected if expected else 0.0
+
+        start_cursor = await self.db.get_notification_cursor(self.job)
+        cursor, wrapped, index = start_cursor, False, 0
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        with outbound_priority(Priority.NOTIFICATION):
+            while self.max_recipients is None or index < self.max_recipients:
+                limit = self.batch_size
+                if self.max_recipients is not None:
+                    limit = min(limit, self.max_recipients - index)
+
+                user_ids = await self.db.get_active_user_ids_after(cursor, limit)
+                if wrapped:
+                    # Second lap: stop where this run started
+                    user_ids = [uid for uid in user_ids if uid <= start_cursor]
+                if not user_ids:
+                    if wrapped or start_cursor == 0:
+                        break
+                    wrapped, cursor = True, 0
+                    continue
+
+                await asyncio.gather(*[
+                    self._send(semaphore, report, uid, text, started + (index + i) * spacing)
+                    for i, uid in enumerate(user_ids)
+                ])
+                index += len(user_ids)
+                cursor = user_ids[-1]
+                await self.db.set_notification_cursor(self.job, cursor)
+
+        report.duration = time.monotonic() - started
+        logger.info(
+            "Notification run %s: sent=%d failed=%d skipped=%d duration=%.1fs",
+            self.job, report.sent, report.failed, report.skipped, report.duration
+        )
+        return report
+
+    async def _send(self, semaphore: asyncio.Semaphore, report: DeliveryReport, user_id: int, text: str, not_before: float):
+        delay = not_before - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        async with semaphore:
+            try:
+                await self.bot.send_message(user_id, text)
+                report.sent += 1
+            except Exception as e:
+                # Permanent failures are also flagged unreachable by ReachabilityMiddleware
+                if classify_send_error(e) == PERMANENT:
+                    report.skipped += 1
+                else:
+                    report.failed += 1
+                    logger.warning(f"{self.job}: failed to notify {user_id}: {e}")
@@ -0,0 +1,341 @@
+# services/outbound.py
+
+import asyncio
+import functools
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Deque, Dict, Optional, Union
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Telegram limits (https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this)
+GLOBAL_RATE = 30            # messages per second across all chats
+BULK_RATE = 20              # share of GLOBAL_RATE that notifications/broadcasts may use
+PRIVATE_CHAT_RATE = 1       # messages per second into one private chat
+PRIVATE_CHAT_BURST = 5      # short bursts Telegram tolerates (e.g. a card + menu)
+GROUP_CHAT_RATE = 20 / 60   # 20 messages per minute into a group/channel
+GROUP_CHAT_BURST = 5
+
+MAX_RETRIES = 3             # retry_after retries per request
+MAX_RETRY_AFTER = 60        # give up instead of parking a request longer than this
+IDLE_BUCKET_TTL = 120       # drop per-chat buckets unused for this long
+
+# Methods that produce a new message in the target chat (per-chat limit applies)
+SEND_PREFIXES = ("Send", "Copy", "Forward")
+
+
+class Priority(IntEnum):
+    """Outbound lanes, highest priority first."""
+    INTERACTIVE = 0     # direct replies to the user's own action
+    CHAT_RELAY = 1      # relaying a chat message to the match partner
+    NOTIFICATION = 2    # scheduled reminders, admin logs, channel posts
+    BROADCAST = 3       # admin broadcasts and other mass sends
+
+
+BULK_LANES = (Priority.NOTIFICATION, Priority.BROADCAST)
+
+_current_priority: ContextVar[Priority] = ContextVar("outbound_priority", default=Priority.INTERACTIVE)
+
+
+@contextmanager
+def outbound_priority(priority: Priority):
+    """Sends made inside this block (and tasks spawned from it) use the given lane."""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def with_priority(priority: Priority):
+    """Decorator form of outbound_priority for whole jobs/handlers."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with outbound_priority(priority):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated", "blocked_until")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until one token can be taken (0 if available now)."""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, until: float):
+        self.blocked_until = max(self.blocked_until, until)
+
+
+class _Waiter:
+    __slots__ = ("future", "chat_bucket", "enqueued")
+
+    def __init__(self, future: asyncio.Future, chat_bucket: Optional[TokenBucket]):
+        self.future = future
+        self.chat_bucket = chat_bucket
+        self.enqueued = time.monotonic()
+
+
+class _LaneStats:
+    __slots__ = ("sent", "errors", "wait_sum", "wait_max", "latency_sum", "latency_max")
+
+    def __init__(self):
+        self.sent = 0
+        self.errors = 0
+        self.wait_sum = 0.0
+        self.wait_max = 0.0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+
+
+class OutboundDispatcher(BaseRequestMiddleware):
+    """
+    Bot session middleware that puts every chat-targeted Bot API call through
+    token buckets (global, bulk share, per chat) and grants them in priority
+    order, so bulk jobs never get ahead of interactive replies.
+    429 responses block the affected chat (and the bulk lanes) for
+    retry_after seconds and the request is retried.
+    """
+
+    def __init__(self):
+        self.global_bucket = TokenBucket(GLOBAL_RATE, GLOBAL_RATE)
+        self.bulk_bucket = TokenBucket(BULK_RATE, BULK_RATE)
+        self._chat_buckets: Dict[Union[int, str], TokenBucket] = {}
+        self._lanes: Dict[Priority, Deque[_Waiter]] = {p: deque() for p in Priority}
+        self._lane_stats: Dict[Priority, _LaneStats] = {p: _LaneStats() for p in Priority}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._pump_task: Optional[asyncio.Task] = None
+        self._last_prune = time.monotonic()
+
+        self.retry_after_count = 0
+        self.retries = 0
+
+    # ----------------------------------------------------
+    # MIDDLEWARE ENTRY
+    # ----------------------------------------------------
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            # answerCallbackQuery, getMe, setWebhook, ... are not rate limited here
+            return await make_request(bot, method)
+
+        lane = _current_priority.get()
+        stats = self._lane_stats[lane]
+        is_send = type(method).__name__.startswith(SEND_PREFIXES)
+        chat_bucket = self._chat_bucket(chat_id) if is_send else None
+        started = time.monotonic()
+
+        for attempt in range(MAX_RETRIES + 1):
+            await self._acquire(lane, chat_bucket)
+            granted = time.monotonic()
+            try:
+                result = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.retry_after_count += 1
+                until = time.monotonic() + e.retry_after
+                if chat_bucket:
+                    chat_bucket.block(until)
+                # Any flood wait means we are pushing too hard: slow bulk lanes too
+                self.bulk_bucket.block(until)
+
+                if attempt >= MAX_RETRIES or e.retry_after > MAX_RETRY_AFTER:
+                    stats.errors += 1
+                    raise
+                self.retries += 1
+                logger.warning(
+                    "429 on %s to %s, retrying in %ss (attempt %d)",
+                    type(method).__name__, chat_id, e.retry_after, attempt + 1
+                )
+                if not chat_bucket:
+                    await asyncio.sleep(e.retry_after)
+                continue
+            except Exception:
+                stats.errors += 1
+                raise
+
+            done = time.monotonic()
+            wait, latency = granted - started, done - started
+            stats.sent += 1
+            stats.wait_sum += wait
+            stats.wait_max = max(stats.wait_max, wait)
+            stats.latency_sum += latency
+            stats.latency_max = max(stats.latency_max, latency)
+            return result
+
+    # ----------------------------------------------------
+    # BUCKETS
+    # ----------------------------------------------------
+    def _chat_bucket(self, chat_id: Union[int, str]) -> TokenBucket:
+        now = time.monotonic()
+        if now - self._last_prune > IDLE_BUCKET_TTL:
+            self._prune(now)
+
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            # Negative ids and @usernames are groups/channels
+            if isinstance(chat_id, str) or chat_id < 0:
+                bucket = TokenBucket(GROUP_CHAT_RATE, GROUP_CHAT_BURST)
+            else:
+                bucket = TokenBucket(PRIVATE_CHAT_RATE, PRIVATE_CHAT_BURST)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _prune(self, now: float):
+        self._last_prune = now
+        stale = [
+            key for key, b in self._chat_buckets.items()
+            if now - b.updated > IDLE_BUCKET_TTL and now > b.blocked_until
+        ]
+        for key in stale:
+            del self._chat_buckets[key]
+
+    # ----------------------------------------------------
+    # PRIORITY GRANTING
+    # ----------------------------------------------------
+    async def _acquire(self, lane: Priority, chat_bucket: Optional[TokenBucket]):
+        now = time.monotonic()
+        if not self._has_waiters() and self._ready(lane, chat_bucket, now) <= 0:
+            self._take(lane, chat_bucket, now)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = _Waiter(future, chat_bucket)
+        self._lanes[lane].append(waiter)
+        self._ensure_pump()
+        self._wakeup.set()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if waiter in self._lanes[lane]:
+                self._lanes[lane].remove(waiter)
+            raise
+
+    def _ready(self, lane: Priority, chat_bucket: Optional[TokenBucket], now: float) -> float:
+        delay = self.global_bucket.delay(now)
+        if lane in BULK_LANES:
+            delay = max(delay, self.bulk_bucket.delay(now))
+        if chat_bucket:
+            delay = max(delay, chat_bucket.delay(now))
+        return delay
+
+    def _take(self, lane: Priority, chat_bucket: Optional[TokenBucket], now: float):
+        self.global_bucket.take(now)
+        if lane in BULK_LANES:
+            self.bulk_bucket.take(now)
+        if chat_bucket:
+            chat_bucket.take(now)
+
+    def _has_waiters(self) -> bool:
+        return any(self._lanes.values())
+
+    def _ensure_pump(self):
+        if self._pump_task is None or self._pump_task.done():
+            self._wakeup = asyncio.Event()
+            self._pump_task = asyncio.create_task(self._pump())
+
+    async def _pump(self):
+        while True:
+            if not self._has_waiters():
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            granted, wait = self._grant_next(time.monotonic())
+            if granted:
+                continue
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def _grant_next(self, now: float):
+        """
+        Grants a token to the first ready waiter, scanning lanes in priority
+        order. A waiter held back by its own chat bucket does not block other
+        chats in the same lane. Returns (granted, seconds until next try).
+        """
+        min_wait = float("inf")
+        for lane in Priority:
+            queue = self._lanes[lane]
+            for waiter in list(queue):
+                if waiter.future.done():
+                    queue.remove(waiter)
+                    continue
+                delay = self._ready(lane, waiter.chat_bucket, now)
+                if delay <= 0:
+                    self._take(lane, waiter.chat_bucket, now)
+                    queue.remove(waiter)
+                    waiter.future.set_result(None)
+                    return True, 0.0
+                min_wait = min(min_wait, delay)
+        return False, min_wait if min_wait != float("inf") else 0.05
+
+    # ----------------------------------------------------
+    # METRICS
+    # ----------------------------------------------------
+    def stats(self) -> Dict:
+        lanes = {}
+        for lane in Priority:
+            s = self._lane_stats[lane]
+            lanes[lane.name.lower()] = {
+                "queue_depth": len(self._lanes[lane]),
+                "sent": s.sent,
+                "errors": s.errors,
+                "avg_wait_ms": round(s.wait_sum / s.sent * 1000, 1) if s.sent else 0.0,
+                "max_wait_ms": round(s.wait_max * 1000, 1),
+                "avg_latency_ms": round(s.latency_sum / s.sent * 1000, 1) if s.sent else 0.0,
+                "max_latency_ms": round(s.latency_max * 1000, 1),
+            }
+        return {
+            "lanes": lanes,
+            "retry_after_count": self.retry_after_count,
+            "retries": self.retries,
+            "chat_buckets": len(self._chat_buckets),
+        }
+
+
+outbound = OutboundDispatcher()
+
+
+def setup_bot_session(bot):
+    """Registers outbound (Bot API) request middlewares on a bot instance."""
+    from middlewares.api_calls import OutboundCallCounter
+    from services.reachability import ReachabilityMiddleware
+    from services.tracing import TracingRequestMiddleware
+
+    bot.session.middleware(TracingRequestMiddleware())  # outermost: spans include rate limit waits
+    bot.session.middleware(OutboundCallCounter())
+    bot.session.middleware(outbound)  # rate limits, priority lanes, retry_after
+    bot.session.middleware(ReachabilityMiddleware())  # blocked users -> is_reachable = FALSE
@@ -0,0 +1,147 @@
+# services/outbox.py
+
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, Optional
+
+import asyncpg
+from aiogram.types import InlineKeyboardMarkup
+
+from services.outbound import Priority, outbound_priority
+from services.reachability import PERMANENT, classify_send_error
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "outbox"      # NOTIFY channel fired by the outbox insert trigger
+BATCH_SIZE = 50         # messages claimed per pass
+CONCURRENCY = 10        # in-flight sends
+MAX_ATTEMPTS = 5        # then the message is marked failed
+RETRY_BASE = 5          # seconds before the first retry, doubled per attempt
+LEASE = 120             # claimed messages reappear after this if the worker dies
+POLL_INTERVAL = 5       # re-check for due retries (and missed notifications)
+PURGE_INTERVAL = 3600   # seconds between deletions of old sent messages
+KEEP_SENT_DAYS = 7
+
+
+def message_payload(text: str, parse_mode: Optional[str] = None,
+                    reply_markup: Optional[InlineKeyboardMarkup] = None) -> Dict:
+    """Serializable send_message arguments for Database.enqueue_outbox."""
+    payload = {"text": text}
+    if parse_mode:
+        payload["parse_mode"] = parse_mode
+    if reply_markup:
+        payload["reply_markup"] = reply_markup.model_dump(mode="json", exclude_none=True)
+    return payload
+
+
+class OutboxWorker:
+    """
+    Sends queued outbox messages in the background with retries.
+
+    Request handlers only insert outbox rows (ideally in the transaction of
+    the change that causes them); the insert trigger NOTIFYs this worker.
+    Messages are claimed with a lease, so several instances can drain the
+    same table and a crash mid-send just means a later retry.
+    """
+
+    def __init__(self):
+        self.db = None
+        self.bot = None
+        self._task: Optional[asyncio.Task] = None
+        self._listener: Optional[asyncpg.Connection] = None
+        self._wakeup = asyncio.Event()
+        self._last_purge = 0.0
+
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+
+    def start(self, db, bot):
+        self.db, self.bot = db, bot
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self._listener and not self._listener.is_closed():
+            await self._listener.close()
+        self._listener = None
+
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def _on_notify(self, conn, pid, channel, payload):
+        self._wakeup.set()
+
+    async def _ensure_listener(self):
+        if self._listener and not self._listener.is_closed():
+            return
+        try:
+            self._listener = await asyncpg.connect(self.db.dsn)
+            await self._listener.add_listener(CHANNEL, self._on_notify)
+        except Exception as e:
+            self._listener = None
+            logger.error(f"Outbox worker could not LISTEN (polling every {POLL_INTERVAL}s): {e}")
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            await self._ensure_listener()
+            try:
+                claimed = await self.drain_once()
+                if time.monotonic() - self._last_purge > PURGE_INTERVAL:
+                    self._last_purge = time.monotonic()
+                    await self.db.purge_outbox(KEEP_SENT_DAYS)
+            except Exception as e:
+                logger.error(f"Outbox worker error: {e}")
+                claimed = 0
+
+            if claimed >= BATCH_SIZE:
+                continue  # more waiting
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def drain_once(self) -> int:
+        """Sends one batch of due messages. Returns how many were claimed."""
+        messages = await self.db.claim_outbox(BATCH_SIZE, LEASE)
+        if not messages:
+            return 0
+
+        semaphore = asyncio.Semaphore(CONCURRENCY)
+        results = await asyncio.gather(*[self._deliver(semaphore, m) for m in messages])
+        sent_ids = [m["id"] for m, ok in zip(messages, results) if ok]
+        if sent_ids:
+            await self.db.mark_outbox_sent(sent_ids)
+        return len(messages)
+
+    async def _deliver(self, semaphore: asyncio.Semaphore, message: Dict) -> bool:
+        payload = json.loads(message["payload"])
+        if "reply_markup" in payload:
+            payload["reply_markup"] = InlineKeyboardMarkup.model_validate(payload["reply_markup"])
+
+        async with semaphore:
+            try:
+                with outbound_priority(Priority(message["priority"])):
+                    await self.bot.send_message(message["chat_id"], **payload)
+                self.sent += 1
+                return True
+            except Exception as e:
+                error = str(e)[:500]
+                if classify_send_error(e) == PERMANENT or message["attempts"] >= MAX_ATTEMPTS:
+                    self.failed += 1
+                    logger.warning(f"Outbox {message['kind']} #{message['id']} to {message['chat_id']} failed: {e}")
+                    await self.db.mark_outbox_failed(message["id"], error)
+                else:
+                    self.retried += 1
+                    delay = RETRY_BASE * 2 ** (message["attempts"] - 1)
+                    await self.db.mark_outbox_retry(message["id"], error, delay)
+                return False
+
+
+outbox_worker = OutboxWorker()
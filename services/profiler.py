@@ -0,0 +1,275 @@
+# services/profiler.py
+
+import asyncio
+import cProfile
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+MAX_UPDATES = 200       # cap for "profile the next N updates"
+MAX_SECONDS = 120       # cap for a sampling session
+SESSION_TIMEOUT = 600   # an update session ends after this even if fewer updates matched
+SAMPLE_INTERVAL = 0.005 # seconds between stack samples
+MIN_WEIGHT_US = 10      # collapsed cProfile stacks lighter than this are left out
+MAX_DEPTH = 128
+TOP_N = 25
+
+Report = Dict[str, str]     # title, collapsed (flamegraph input), top (summary table)
+OnDone = Callable[[Report], Awaitable]
+
+
+def _code_name(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _func_name(func: Tuple[str, int, str]) -> str:
+    """pstats key (filename, lineno, name) -> frame label."""
+    filename, lineno, name = func
+    label = name if filename == "~" else f"{name} ({os.path.basename(filename)}:{lineno})"
+    return label.replace(";", ",")
+
+
+# ----------------------------------------------------
+# SESSIONS
+# ----------------------------------------------------
+class _Session:
+    kind = ""
+
+    def __init__(self, on_done: OnDone, timeout: float):
+        self.on_done = on_done
+        self.timeout = timeout
+        self.started = time.monotonic()
+
+    def describe(self) -> str:
+        raise NotImplementedError
+
+    async def report(self) -> Report:
+        raise NotImplementedError
+
+
+class UpdateProfileSession(_Session):
+    """
+    cProfile over the next `count` updates whose user id or handler name
+    matches `target`. The profiler is on while any matching update is in
+    flight; other tasks running on the loop meanwhile are included too.
+    """
+
+    kind = "updates"
+
+    def __init__(self, count: int, target: Union[int, str], on_done: OnDone):
+        super().__init__(on_done, SESSION_TIMEOUT)
+        self.count = count
+        self.target = target
+        self.remaining = count
+        self.finished = 0
+        self.profile = cProfile.Profile()
+        self._active = 0
+
+    def matches(self, user_id: Optional[int], router: str, handler: str) -> bool:
+        if self.remaining <= 0:
+            return False
+        if isinstance(self.target, int):
+            return user_id == self.target
+        return self.target in (handler, f"{router}.{handler}")
+
+    @contextmanager
+    def profiling(self):
+        self.remaining -= 1
+        self._active += 1
+        if self._active == 1:
+            self.profile.enable()
+        try:
+            yield
+        finally:
+            self._active -= 1
+            if self._active == 0:
+                self.profile.disable()
+            self.finished += 1
+
+    @property
+    def complete(self) -> bool:
+        return self.finished >= self.count
+
+    def describe(self) -> str:
+        return f"cProfile of updates matching {self.target}: {self.finished}/{self.count} done"
+
+    async def report(self) -> Report:
+        if self.finished == 0:
+            return {"title": f"No update matched {self.target}", "collapsed": "", "top": ""}
+        stats = pstats.Stats(self.profile)
+        return {
+            "title": f"cProfile: {self.finished} update(s) matching {self.target}",
+            "collapsed": collapse_profile(stats),
+            "top": top_profile_functions(stats),
+        }
+
+
+class SamplingSession(_Session):
+    """Statistical profiler: a thread samples every thread's stack each SAMPLE_INTERVAL for `seconds`."""
+
+    kind = "sample"
+
+    def __init__(self, seconds: float, on_done: OnDone):
+        super().__init__(on_done, seconds)
+        self.seconds = seconds
+        self.samples = 0
+        self.stacks: Counter = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stopped.wait(SAMPLE_INTERVAL):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_DEPTH:
+                    stack.append(_code_name(frame.f_code).replace(";", ","))
+                    frame = frame.f_back
+                stack.append(f"thread:{names.get(thread_id, thread_id)}")
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def describe(self) -> str:
+        elapsed = time.monotonic() - self.started
+        return f"Sampling every {SAMPLE_INTERVAL * 1000:.0f} ms: {elapsed:.0f}/{self.seconds:.0f}s, {self.samples} samples"
+
+    async def report(self) -> Report:
+        self._stopped.set()
+        await asyncio.to_thread(self._thread.join)
+        collapsed = "\n".join(f"{stack} {n}" for stack, n in self.stacks.most_common())
+        return {
+            "title": f"Sampler: {self.samples} samples over {time.monotonic() - self.started:.1f}s",
+            "collapsed": collapsed,
+            "top": top_sampled_functions(self.stacks, self.samples),
+        }
+
+
+# ----------------------------------------------------
+# REPORT FORMATTING
+# ----------------------------------------------------
+def collapse_profile(stats: pstats.Stats) -> str:
+    """
+    Flamegraph input from cProfile's caller/callee edges: each function's
+    time is split across the paths it was reached by in proportion to the
+    edge's cumulative time (an approximation; cProfile keeps no full stacks).
+    Weights are microseconds.
+    """
+    callees: Dict[tuple, List[Tuple[tuple, float]]] = defaultdict(list)
+    roots = []
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        if not callers:
+            roots.append(func)
+        for caller, edge in callers.items():
+            callees[caller].append((func, edge[3]))
+
+    lines: Counter = Counter()
+
+    def walk(func, inclusive: float, path: List[tuple]):
+        _, _, self_time, total_time, _ = stats.stats[func]
+        share = min(inclusive / total_time, 1.0) if total_time > 0 else 0.0
+        path = path + [func]
+        own = int(self_time * share * 1e6)
+        if own > 0:
+            lines[";".join(_func_name(f) for f in path)] += own
+        if len(path) >= MAX_DEPTH:
+            return
+        for callee, edge_time in callees.get(func, ()):
+            child = edge_time * share
+            if callee not in path and child * 1e6 >= MIN_WEIGHT_US:
+                walk(callee, child, path)
+
+    for root in roots:
+        walk(root, stats.stats[root][3], [])
+    return "\n".join(f"{stack} {n}" for stack, n in lines.most_common())
+
+
+def top_profile_functions(stats: pstats.Stats, limit: int = TOP_N) -> str:
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:limit]
+    lines = [f"{'self ms':>9} {'cum ms':>9} {'calls':>7}  function"]
+    for func, (_, calls, self_time, total_time, _) in rows:
+        lines.append(f"{self_time * 1000:9.1f} {total_time * 1000:9.1f} {calls:7d}  {_func_name(func)}")
+    return "\n".join(lines)
+
+
+def top_sampled_functions(stacks: Counter, samples: int, limit: int = TOP_N) -> str:
+    """Rows are per thread; percentages are of sampling ticks (a thread always in one function shows 100%)."""
+    total = samples or 1
+    own: Counter = Counter()
+    inclusive: Counter = Counter()
+    for stack, n in stacks.items():
+        thread, *frames = stack.split(";")
+        if not frames:
+            continue
+        own[(thread, frames[-1])] += n
+        for frame in set(frames):
+            inclusive[(thread, frame)] += n
+    lines = [f"{'self %':>7} {'incl %':>7}  function [thread]"]
+    for (thread, frame), n in own.most_common(limit):
+        share = inclusive[(thread, frame)]
+        lines.append(f"{100 * n / total:7.1f} {100 * share / total:7.1f}  {frame} [{thread[len('thread:'):]}]")
+    return "\n".join(lines)
+
+
+# ----------------------------------------------------
+# PROFILER (one session at a time)
+# ----------------------------------------------------
+class Profiler:
+    """
+    Admin-started, bounded profiling sessions (see handlers_admin /profiler).
+    Only the process that handled the command is profiled.
+    """
+
+    def __init__(self):
+        self.session: Optional[_Session] = None
+
+    def start_updates(self, count: int, target: Union[int, str], on_done: OnDone) -> Optional[_Session]:
+        if self.session is not None:
+            return None
+        return self._begin(UpdateProfileSession(min(count, MAX_UPDATES), target, on_done))
+
+    def start_sampling(self, seconds: float, on_done: OnDone) -> Optional[_Session]:
+        if self.session is not None:
+            return None
+        return self._begin(SamplingSession(min(seconds, MAX_SECONDS), on_done))
+
+    def _begin(self, session: _Session) -> _Session:
+        self.session = session
+        asyncio.create_task(self._expire(session))
+        logger.info(f"Profiling session started: {session.describe()}")
+        return session
+
+    async def _expire(self, session: _Session):
+        await asyncio.sleep(session.timeout)
+        if self.session is session:
+            await self.finish()
+
+    async def finish(self) -> bool:
+        """Ends the current session and hands its report to the session's callback."""
+        session, self.session = self.session, None
+        if session is None:
+            return False
+        try:
+            report = await session.report()
+            await session.on_done(report)
+        except Exception as e:
+            logger.error(f"Could not deliver profiling report: {e}")
+        return True
+
+    def on_update_done(self, session: UpdateProfileSession):
+        if session.complete and self.session is session:
+            asyncio.create_task(self.finish())
+
+
+profiler = Profiler()
@@ -0,0 +1,112 @@
+# services/rate_limiter.py
+
+import logging
+import time
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Per-user bucket: refills RATE tokens per second up to BURST
+RATE = 1.0
+BURST = 6.0
+
+# Action cost classes (tokens per event)
+COST_TAP = 1.0      # menu taps and navigation
+COST_CHAT = 0.5     # chat relays: people type in short bursts
+COST_DECK = 4.0     # builds a candidate deck (❤️ Find Matches, start swiping)
+
+MAX_KEYS = 50_000       # memory store hard bound
+PRUNE_INTERVAL = 60     # seconds between sweeps of refilled buckets
+
+
+# ----------------------------------------------------
+# STORES
+# ----------------------------------------------------
+class MemoryBucketStore:
+    """
+    Per-process GCRA store: one float (theoretical arrival time) per key.
+    A key whose TAT is in the past is a full bucket and is dropped by the
+    periodic sweep, so the map only holds users who are active right now.
+    """
+
+    def __init__(self, max_keys: int = MAX_KEYS):
+        self.max_keys = max_keys
+        self._tat: Dict[str, float] = {}
+        self._last_prune = 0.0
+
+    async def consume(self, key: str, cost: float, rate: float, burst: float,
+                      now: float) -> Tuple[bool, float]:
+        self._maybe_prune(now)
+        tat = max(self._tat.get(key, now), now)
+        new_tat = tat + cost / rate
+        over = new_tat - now - burst / rate
+        if over > 0:
+            return False, over
+        self._tat[key] = new_tat
+        return True, 0.0
+
+    def _maybe_prune(self, now: float):
+        if now - self._last_prune < PRUNE_INTERVAL and len(self._tat) < self.max_keys:
+            return
+        self._last_prune = now
+        self._tat = {k: t for k, t in self._tat.items() if t > now}
+        if len(self._tat) >= self.max_keys:
+            # Still full of live buckets: forget the ones closest to refilled
+            keep = sorted(self._tat.items(), key=lambda kv: kv[1], reverse=True)[: self.max_keys // 2]
+            self._tat = dict(keep)
+            logger.warning(f"Rate limit store hit {self.max_keys} keys; evicted the oldest half")
+
+    def buckets(self) -> Dict[str, float]:
+        return self._tat
+
+    def __len__(self):
+        return len(self._tat)
+
+
+class PostgresBucketStore:
+    """Shared store so limits hold across web processes (one upsert per event)."""
+
+    def __init__(self, db):
+        self.db = db
+        self._last_prune = 0.0
+
+    async def consume(self, key: str, cost: float, rate: float, burst: float,
+                      now: float) -> Tuple[bool, float]:
+        if now - self._last_prune > PRUNE_INTERVAL:
+            self._last_prune = now
+            await self.db.purge_rate_limits(now)
+        return await self.db.consume_rate_limit(key, cost, rate, burst, now)
+
+
+# ----------------------------------------------------
+# LIMITER
+# ----------------------------------------------------
+class TokenBucketLimiter:
+    """Token buckets with per-action costs over a pluggable store."""
+
+    def __init__(self, store=None, rate: float = RATE, burst: float = BURST):
+        self.store = store or MemoryBucketStore()
+        self.rate = rate
+        self.burst = burst
+        self.allowed: Counter = Counter()
+        self.throttled: Counter = Counter()
+
+    async def hit(self, user_id: int, cost: float = COST_TAP,
+                  action: str = "tap", now: Optional[float] = None) -> Tuple[bool, float]:
+        """Spends `cost` tokens from the user's bucket. Returns (allowed, retry_after)."""
+        allowed, retry_after = await self.store.consume(
+            str(user_id), cost, self.rate, self.burst, time.time() if now is None else now
+        )
+        if allowed:
+            self.allowed[action] += 1
+        else:
+            self.throttled[action] += 1
+        return allowed, retry_after
+
+    def stats(self) -> Dict:
+        return {
+            "store": type(self.store).__name__,
+            "allowed": dict(self.allowed),
+            "throttled": dict(self.throttled),
+        }
@@ -0,0 +1,111 @@
+# services/reachability.py
+
+import asyncio
+import logging
+from typing import Optional, Set
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramNotFound
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 5      # seconds between deactivation batches
+MAX_PENDING = 200       # flush early once this many users are waiting
+
+PERMANENT = "permanent"
+TRANSIENT = "transient"
+
+# Bad Request descriptions that mean the user can never be reached again
+_PERMANENT_BAD_REQUESTS = (
+    "chat not found",
+    "user not found",
+    "user is deactivated",
+    "peer_id_invalid",
+    "bot can't initiate conversation",
+)
+
+
+def classify_send_error(error: Exception) -> str:
+    """
+    PERMANENT: the user blocked the bot, deleted their account or never
+    started it; retrying is pointless. Everything else is TRANSIENT.
+    """
+    if isinstance(error, (TelegramForbiddenError, TelegramNotFound)):
+        return PERMANENT
+    if isinstance(error, TelegramBadRequest):
+        message = (error.message or "").lower()
+        if any(reason in message for reason in _PERMANENT_BAD_REQUESTS):
+            return PERMANENT
+    return TRANSIENT
+
+
+class UnreachableUserWriter:
+    """
+    Collects users that permanently failed a send and flags them
+    is_reachable = FALSE in batches, so recipient queries skip them.
+    """
+
+    def __init__(self):
+        self.db = None
+        self._pending: Set[int] = set()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.users_marked = 0
+
+    def start(self, db):
+        self.db = db
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    def add(self, user_id: int):
+        self._pending.add(user_id)
+        if len(self._pending) >= MAX_PENDING:
+            self._wakeup.set()
+
+    def discard(self, user_id: int):
+        """The user is reachable again (e.g. unblocked before we flushed)."""
+        self._pending.discard(user_id)
+
+    async def flush(self):
+        if not self._pending or not self.db:
+            return
+        user_ids = list(self._pending)
+        self._pending.clear()
+        count = await self.db.mark_users_unreachable(user_ids)
+        self.users_marked += count
+        logger.info(f"Marked {count} users unreachable")
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing unreachable users: {e}")
+
+
+unreachable_writer = UnreachableUserWriter()
+
+
+class ReachabilityMiddleware(BaseRequestMiddleware):
+    """Bot session middleware: feeds permanent send failures to the writer."""
+
+    async def __call__(self, make_request, bot, method):
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            chat_id = getattr(method, "chat_id", None)
+            # Only private chats map to users
+            if isinstance(chat_id, int) and chat_id > 0 and classify_send_error(e) == PERMANENT:
+                unreachable_writer.add(chat_id)
+            raise
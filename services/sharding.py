@@ -0,0 +1,101 @@
+# services/sharding.py
+
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import struct
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+VNODES = 64             # ring points per worker; more = smoother spread
+_HEADER = struct.Struct(">I")
+MAX_FRAME = 16 * 1024 * 1024
+ACK, NACK = b"+", b"-"  # one byte back per frame: queued / shard busy, Telegram should retry
+
+
+# ----------------------------------------------------
+# CONSISTENT HASHING
+# ----------------------------------------------------
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring of worker ids. Removing a worker only moves the
+    users it owned; adding it back moves exactly those users back.
+    """
+
+    def __init__(self, nodes: Iterable[int] = (), vnodes: int = VNODES):
+        self.vnodes = vnodes
+        self._points: List[int] = []
+        self._owners: Dict[int, int] = {}
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: int):
+        for i in range(self.vnodes):
+            point = _hash(f"{node}:{i}")
+            if point not in self._owners:
+                bisect.insort(self._points, point)
+                self._owners[point] = node
+
+    def remove(self, node: int):
+        self._points = [p for p in self._points if self._owners[p] != node]
+        self._owners = {p: n for p, n in self._owners.items() if n != node}
+
+    def __contains__(self, node: int) -> bool:
+        return node in self._owners.values()
+
+    def nodes(self) -> List[int]:
+        return sorted(set(self._owners.values()))
+
+    def get(self, key: int) -> Optional[int]:
+        if not self._points:
+            return None
+        i = bisect.bisect(self._points, _hash(str(key))) % len(self._points)
+        return self._owners[self._points[i]]
+
+
+# ----------------------------------------------------
+# FRAMING (ingress <-> shard over a unix socket)
+# ----------------------------------------------------
+def encode_frame(update: Dict) -> bytes:
+    body = json.dumps(update, separators=(",", ":")).encode()
+    return _HEADER.pack(len(body)) + body
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Optional[Dict]:
+    """Next update from the stream, or None at EOF."""
+    try:
+        header = await reader.readexactly(_HEADER.size)
+    except asyncio.IncompleteReadError:
+        return None
+    (size,) = _HEADER.unpack(header)
+    if size > MAX_FRAME:
+        raise ValueError(f"Frame of {size} bytes exceeds {MAX_FRAME}")
+    return json.loads(await reader.readexactly(size))
+
+
+async def serve_shard(socket_path: str, queue, bot) -> asyncio.AbstractServer:
+    """
+    Feeds updates forwarded by the ingress into this process's UpdateQueue
+    and answers each frame with ACK, or NACK when its lane is full so the
+    ingress can answer Telegram 503 instead of losing the update.
+    """
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while (update := await read_frame(reader)) is not None:
+                deferred = queue.put(bot, update) == queue.DEFERRED
+                writer.write(NACK if deferred else ACK)
+                await writer.drain()
+        except Exception as e:
+            logger.error(f"Ingress connection error: {e}")
+        finally:
+            writer.close()
+
+    return await asyncio.start_unix_server(handle, path=socket_path)
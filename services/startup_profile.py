@@ -0,0 +1,115 @@
+# services/startup_profile.py
+
+import logging
+import os
+import sys
+import time
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("STARTUP_PROFILE") == "1"
+TOP_N = 25
+
+
+class _TimedLoader:
+    """Wraps a module loader so create/exec time is recorded; everything else passes through."""
+
+    def __init__(self, loader, profile: "StartupProfile"):
+        self._loader = loader
+        self._profile = profile
+
+    def create_module(self, spec):
+        started = time.perf_counter()
+        try:
+            return self._loader.create_module(spec)
+        finally:
+            self._profile._created[spec.name] = time.perf_counter() - started
+
+    def exec_module(self, module):
+        self._profile._enter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profile._exit(module.__name__)
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+class StartupProfile:
+    """
+    Startup profile mode (STARTUP_PROFILE=1): a meta path finder times every
+    module import (self and cumulative, like `python -X importtime`) and
+    mark() records startup phases. The report is logged once startup
+    completes. Installed on import, so bot.py imports this module first.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.imports: Dict[str, Tuple[float, float]] = {}   # module -> (self, cumulative) seconds
+        self.phases: List[Tuple[str, float]] = []
+        self._created: Dict[str, float] = {}
+        self._stack: List[List[float]] = []                 # [started, time in child imports]
+
+    def install(self):
+        if self not in sys.meta_path:
+            sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    # ----------------------------------------------------
+    # IMPORT HOOK
+    # ----------------------------------------------------
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            find = getattr(finder, "find_spec", None)
+            if finder is self or find is None:
+                continue
+            spec = find(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimedLoader(spec.loader, self)
+                return spec
+        return None
+
+    def _enter(self):
+        self._stack.append([time.perf_counter(), 0.0])
+
+    def _exit(self, name: str):
+        started, children = self._stack.pop()
+        total = time.perf_counter() - started + self._created.pop(name, 0.0)
+        if self._stack:
+            self._stack[-1][1] += total
+        self.imports[name] = (total - children, total)
+
+    # ----------------------------------------------------
+    # PHASES / REPORT
+    # ----------------------------------------------------
+    def mark(self, phase: str):
+        self.phases.append((phase, time.perf_counter() - self.started))
+
+    def report(self, limit: int = TOP_N) -> str:
+        lines = ["Startup profile (seconds since process start):"]
+        lines += [f"  {phase:<24} {at:8.3f}" for phase, at in self.phases]
+
+        def table(title: str, index: int):
+            rows = sorted(self.imports.items(), key=lambda item: item[1][index], reverse=True)[:limit]
+            lines.append(f"{title} ({len(self.imports)} modules):  self ms / cumulative ms")
+            lines.extend(f"  {own * 1000:8.1f} {total * 1000:9.1f}  {name}" for name, (own, total) in rows)
+
+        table("Slowest imports by cumulative time", 1)
+        table("Slowest imports by self time", 0)
+        return "\n".join(lines)
+
+    def log_report(self):
+        if ENABLED:
+            self.uninstall()
+            logger.info(self.report())
+
+
+startup_profile = StartupProfile()
+if ENABLED:
+    startup_profile.install()
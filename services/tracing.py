@@ -0,0 +1,192 @@
+# services/tracing.py
+
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import os
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterable, List, Optional
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+from bot_config import TRACE_FILE, TRACE_SAMPLE_RATE
+from services.memory_diag import memory_stores
+
+logger = logging.getLogger(__name__)
+
+RING_SIZE = 2000        # spans kept in memory
+FLUSH_INTERVAL = 1.0    # seconds between file writes (done off the event loop)
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start", "duration", "attrs", "root", "children")
+
+    def __init__(self, name: str, kind: str, parent: Optional["Span"] = None, **attrs):
+        self.trace_id = parent.trace_id if parent else os.urandom(8).hex()
+        self.span_id = os.urandom(4).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.kind = kind
+        self.start = time.time()
+        self.duration: Optional[float] = None
+        self.attrs: Dict[str, Any] = attrs
+        self.root: "Span" = parent.root if parent else self
+        self.children: List["Span"] = []
+
+    def to_dict(self) -> Dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start": round(self.start, 6),
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            **({"attrs": self.attrs} if self.attrs else {}),
+        }
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("trace_span", default=None)
+
+
+def hash_user_id(user_id: int) -> str:
+    """Stable pseudonymous id, so traces can be grouped per user without storing the id."""
+    return hashlib.sha256(f"aaupulse:{user_id}".encode()).hexdigest()[:12]
+
+
+class Tracer:
+    """
+    Per-update traces: a root span per sampled update with child spans for
+    Database methods and Bot API calls. Finished traces go to an in-memory
+    ring and, if a file is configured, are appended there as JSON lines by
+    a background flush (one span per line).
+    """
+
+    def __init__(self, sample_rate: float = 0.0, path: Optional[str] = None, ring_size: int = RING_SIZE):
+        self.sample_rate = sample_rate
+        self.path = path
+        self.ring: Deque[Dict] = deque(maxlen=ring_size)
+        self._file_buffer: List[str] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self.traces = 0
+
+    # ----------------------------------------------------
+    # SPANS
+    # ----------------------------------------------------
+    @contextmanager
+    def trace(self, name: str, force: bool = False, **attrs):
+        """Root span; sampled at sample_rate unless forced. Yields None when not sampled."""
+        if not force and (self.sample_rate <= 0 or random.random() >= self.sample_rate):
+            yield None
+            return
+        span = Span(name, "update", **attrs)
+        token = _current_span.set(span)
+        started = time.perf_counter()
+        try:
+            yield span
+        except Exception as e:
+            span.attrs["error"] = type(e).__name__
+            raise
+        finally:
+            span.duration = time.perf_counter() - started
+            _current_span.reset(token)
+            self._export(span)
+
+    @contextmanager
+    def span(self, name: str, kind: str, **attrs):
+        """Child span of the current trace; a no-op outside sampled updates."""
+        parent = _current_span.get()
+        if parent is None or parent.root.duration is not None:
+            yield None
+            return
+        span = Span(name, kind, parent, **attrs)
+        parent.root.children.append(span)
+        token = _current_span.set(span)
+        started = time.perf_counter()
+        try:
+            yield span
+        except Exception as e:
+            span.attrs["error"] = type(e).__name__
+            raise
+        finally:
+            span.duration = time.perf_counter() - started
+            _current_span.reset(token)
+
+    def annotate(self, **attrs):
+        """Adds attributes to the current update's root span (e.g. router/handler)."""
+        span = _current_span.get()
+        if span is not None:
+            span.root.attrs.update(attrs)
+
+    # ----------------------------------------------------
+    # EXPORT
+    # ----------------------------------------------------
+    def _export(self, root: Span):
+        self.traces += 1
+        spans = [root.to_dict()] + [child.to_dict() for child in root.children]
+        self.ring.extend(spans)
+        if self.path:
+            self._file_buffer.extend(json.dumps(s, separators=(",", ":")) for s in spans)
+            if self._flush_task is None or self._flush_task.done():
+                self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def _flush_later(self):
+        while self._file_buffer:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            lines, self._file_buffer = self._file_buffer, []
+            try:
+                await asyncio.to_thread(self._append, self.path, lines)
+            except Exception as e:
+                logger.error(f"Could not write traces to {self.path}: {e}")
+
+    @staticmethod
+    def _append(path: str, lines: List[str]):
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def recent(self, limit: int = 50) -> List[Dict]:
+        return list(self.ring)[-limit:]
+
+
+tracer = Tracer(TRACE_SAMPLE_RATE, TRACE_FILE or None)
+memory_stores.register("trace_ring", lambda: tracer.ring)
+
+
+def traced_methods(kind: str, skip: Iterable[str] = ()):
+    """Class decorator: every public coroutine method opens a child span of the current trace."""
+    skip = set(skip)
+
+    def decorator(cls):
+        for name, func in list(vars(cls).items()):
+            if name.startswith("_") or name in skip or not inspect.iscoroutinefunction(func):
+                continue
+            setattr(cls, name, _traced(func, f"{cls.__name__}.{name}", kind))
+        return cls
+    return decorator
+
+
+def _traced(func, span_name: str, kind: str):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if _current_span.get() is None:
+            return await func(*args, **kwargs)
+        with tracer.span(span_name, kind):
+            return await func(*args, **kwargs)
+    return wrapper
+
+
+class TracingRequestMiddleware(BaseRequestMiddleware):
+    """Bot session middleware: a child span per Bot API call (including rate-limit waits)."""
+
+    async def __call__(self, make_request, bot, method):
+        if _current_span.get() is None:
+            return await make_request(bot, method)
+        with tracer.span(type(method).__name__, "bot_api"):
+            return await make_request(bot, method)
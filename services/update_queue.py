@@ -0,0 +1,182 @@
+# services/update_queue.py
+
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = 1000       # buffered updates per process, split evenly between lanes
+LANES = 16              # one worker each; a user's updates always go to the same lane
+SHED_AT = 0.8           # above this fill ratio, low-priority updates are dropped
+DRAIN_TIMEOUT = 10      # seconds to finish buffered updates on shutdown
+
+# Users are waiting on these; everything else (edits, member updates, ...) can be shed
+HIGH_PRIORITY_TYPES = {"message", "callback_query", "pre_checkout_query"}
+
+
+def update_type(update: Dict[str, Any]) -> str:
+    return next((k for k in update if k != "update_id"), "unknown")
+
+
+def partition_key(update: Dict[str, Any]) -> int:
+    """The sender's id (chat id for chat-only updates), so one user's updates stay ordered."""
+    payload = update.get(update_type(update))
+    if isinstance(payload, dict):
+        for field in ("from", "chat", "user"):
+            if isinstance(payload.get(field), dict) and "id" in payload[field]:
+                return int(payload[field]["id"])
+    return int(update.get("update_id", 0))
+
+
+class _Lane:
+    __slots__ = ("queue", "processed", "busy_time", "max_time", "last_wait")
+
+    def __init__(self, maxsize: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.processed = 0
+        self.busy_time = 0.0
+        self.max_time = 0.0
+        self.last_wait = 0.0
+
+    def stats(self) -> Dict:
+        return {
+            "depth": self.queue.qsize(),
+            "processed": self.processed,
+            "avg_ms": round(1000 * self.busy_time / self.processed, 1) if self.processed else 0.0,
+            "max_ms": round(1000 * self.max_time, 1),
+            "last_wait": round(self.last_wait, 3),
+        }
+
+
+class UpdateQueue:
+    """
+    Bounded in-process buffer between the webhook and the dispatcher,
+    partitioned into lanes by user.
+
+    The webhook answers Telegram as soon as an update is queued. Each
+    update goes to lane hash(user) % LANES, and each lane has one worker,
+    so a user's rapid taps and chat messages are handled in arrival order
+    while different users run in parallel. Under load, low-priority
+    updates are shed once the queue passes SHED_AT, and when a lane is
+    full its high-priority updates are deferred: the webhook answers 503
+    and Telegram redelivers them later.
+    """
+
+    ACCEPTED, SHED, DEFERRED = "accepted", "shed", "deferred"
+
+    def __init__(self, dispatcher: Dispatcher, maxsize: int = QUEUE_SIZE, lanes: int = LANES, **data: Any):
+        self.dispatcher = dispatcher
+        self.data = data
+        self.maxsize = maxsize
+        self._lanes = [_Lane(max(1, maxsize // lanes)) for _ in range(lanes)]
+        self._tasks: List[asyncio.Task] = []
+        self._depth = 0
+        self._busy = 0
+
+        self.counts: Counter = Counter()
+        self.shed_by_type: Counter = Counter()
+        self.max_wait = 0.0
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker(lane)) for lane in self._lanes]
+            logger.info(f"Update queue started ({len(self._lanes)} lanes, {self.maxsize} slots)")
+
+    async def close(self, timeout: float = DRAIN_TIMEOUT):
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*[lane.queue.join() for lane in self._lanes]), timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"Dropping {self._depth} queued updates on shutdown")
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def put(self, bot: Bot, update: Dict[str, Any]) -> str:
+        kind = update_type(update)
+        if kind not in HIGH_PRIORITY_TYPES and self._depth / self.maxsize >= SHED_AT:
+            self.counts[self.SHED] += 1
+            self.shed_by_type[kind] += 1
+            return self.SHED
+        lane = self._lanes[partition_key(update) % len(self._lanes)]
+        try:
+            lane.queue.put_nowait((time.monotonic(), bot, update))
+        except asyncio.QueueFull:
+            self.counts[self.DEFERRED] += 1
+            return self.DEFERRED
+        self._depth += 1
+        self.counts[self.ACCEPTED] += 1
+        return self.ACCEPTED
+
+    async def _worker(self, lane: _Lane):
+        while True:
+            queued_at, bot, update = await lane.queue.get()
+            started = time.monotonic()
+            lane.last_wait = started - queued_at
+            self.max_wait = max(self.max_wait, lane.last_wait)
+            self._depth -= 1
+            self._busy += 1
+            try:
+                result = await self.dispatcher.feed_raw_update(bot=bot, update=update, **self.data)
+                if isinstance(result, TelegramMethod):
+                    await self.dispatcher.silent_call_request(bot=bot, result=result)
+                self.counts["processed"] += 1
+            except Exception as e:
+                self.counts["failed"] += 1
+                logger.error(f"Update {update.get('update_id')} failed: {e}")
+            finally:
+                elapsed = time.monotonic() - started
+                lane.processed += 1
+                lane.busy_time += elapsed
+                lane.max_time = max(lane.max_time, elapsed)
+                self._busy -= 1
+                lane.queue.task_done()
+
+    def stats(self) -> Dict:
+        return {
+            "depth": self._depth,
+            "capacity": self.maxsize,
+            "busy_lanes": self._busy,
+            "max_wait": round(self.max_wait, 3),
+            **self.counts,
+            "shed_by_type": dict(self.shed_by_type),
+            "lanes": [lane.stats() for lane in self._lanes],
+        }
+
+
+class QueuedRequestHandler(SimpleRequestHandler):
+    """SimpleRequestHandler that acknowledges at once and hands updates to an UpdateQueue."""
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, maxsize: int = QUEUE_SIZE,
+                 lanes: int = LANES, secret_token: Optional[str] = None, **data: Any):
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True,
+                         secret_token=secret_token, **data)
+        self.queue = UpdateQueue(dispatcher, maxsize=maxsize, lanes=lanes, **data)
+
+    def register(self, app: web.Application, /, path: str, **kwargs: Any) -> None:
+        app.on_startup.append(self._handle_start)
+        super().register(app, path=path, **kwargs)
+
+    async def _handle_start(self, app: web.Application) -> None:
+        self.queue.start()
+
+    async def close(self) -> None:
+        await self.queue.close()
+        await super().close()
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        update = await request.json(loads=bot.session.json_loads)
+        if self.queue.put(bot, update) == UpdateQueue.DEFERRED:
+            return web.Response(status=503, text="Busy")
+        return web.json_response({}, dumps=bot.session.json_dumps)
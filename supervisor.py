@@ -0,0 +1,216 @@
+"""
+Multi-process webhook mode: one ingress process receives Telegram webhooks
+and forwards each update over a unix socket to one of K bot processes,
+picked by consistent hashing of the user id. A user always lands on the
+same process, so per-process state (rate limit buckets, chat sessions,
+caches) stays local while handling spreads across cores.
+
+    python supervisor.py --workers 4
+
+Crashed workers are restarted; while one is down its users move to the
+others and come back when it returns (only its share is remapped).
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import sys
+import tempfile
+from typing import Dict, Optional
+
+from aiogram import Bot
+from aiohttp import web
+
+from bot_config import BOT_TOKEN
+from services.sharding import ACK, HashRing, encode_frame
+from services.update_queue import partition_key
+
+BASE_URL = os.getenv("BASE_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+PORT = int(os.getenv("PORT", "8080"))
+
+RESTART_BACKOFF_MAX = 30    # seconds between restarts of a crash-looping worker
+PROBE_INTERVAL = 1          # seconds between reconnect attempts to workers out of the ring
+ACK_TIMEOUT = 5             # seconds a worker has to acknowledge a forwarded update
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    handlers=[logging.StreamHandler(sys.stdout)],
+)
+logger = logging.getLogger(__name__)
+
+
+class WorkerLink:
+    """One bot process and the ingress's socket connection to it."""
+
+    def __init__(self, worker_id: int, socket_path: str):
+        self.worker_id = worker_id
+        self.socket_path = socket_path
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.restarts = 0
+        self.forwarded = 0
+        self.deferred = 0
+        self._lock = asyncio.Lock()     # one frame in flight, so each ack matches its frame
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    async def connect(self) -> bool:
+        try:
+            self.reader, self.writer = await asyncio.open_unix_connection(self.socket_path)
+            return True
+        except OSError:
+            self.writer = None
+            return False
+
+    async def send(self, frame: bytes) -> Optional[bool]:
+        """True if the worker queued the update, False if it is busy, None if the link is down."""
+        async with self._lock:
+            if self.writer is None or self.writer.is_closing():
+                return None
+            try:
+                self.writer.write(frame)
+                await self.writer.drain()
+                ack = await asyncio.wait_for(self.reader.readexactly(1), ACK_TIMEOUT)
+            except (ConnectionError, OSError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                self.writer = None
+                return None
+        if ack != ACK:
+            self.deferred += 1
+            return False
+        self.forwarded += 1
+        return True
+
+    def disconnect(self):
+        if self.writer:
+            self.writer.close()
+        self.writer = None
+
+
+class Supervisor:
+    def __init__(self, workers: int, socket_dir: str):
+        self.links: Dict[int, WorkerLink] = {
+            i: WorkerLink(i, os.path.join(socket_dir, f"aaupulse-shard-{i}.sock")) for i in range(workers)
+        }
+        self.ring = HashRing()
+        self.dropped = 0
+        self._tasks = []
+        self._stopping = False
+
+    # ----------------------------------------------------
+    # WORKER PROCESSES
+    # ----------------------------------------------------
+    async def _run_worker(self, link: WorkerLink):
+        backoff = 1
+        while not self._stopping:
+            link.process = await asyncio.create_subprocess_exec(
+                sys.executable, "bot.py", "--socket", link.socket_path,
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+            )
+            logger.info(f"Worker {link.worker_id} started (pid {link.process.pid})")
+            code = await link.process.wait()
+
+            self._take_out(link)
+            if self._stopping:
+                return
+            link.restarts += 1
+            logger.error(f"Worker {link.worker_id} exited with {code}; restarting in {backoff}s")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, RESTART_BACKOFF_MAX)
+
+    async def _probe(self):
+        """Puts running workers whose socket accepts connections (back) into the ring."""
+        while True:
+            for link in self.links.values():
+                if link.alive and link.worker_id not in self.ring and await link.connect():
+                    self.ring.add(link.worker_id)
+                    logger.info(f"Worker {link.worker_id} joined the ring {self.ring.nodes()}")
+            await asyncio.sleep(PROBE_INTERVAL)
+
+    def _take_out(self, link: WorkerLink):
+        link.disconnect()
+        if link.worker_id in self.ring:
+            self.ring.remove(link.worker_id)
+            logger.warning(f"Worker {link.worker_id} left the ring {self.ring.nodes()}")
+
+    # ----------------------------------------------------
+    # INGRESS
+    # ----------------------------------------------------
+    async def forward(self, update: Dict) -> bool:
+        """Whether a worker queued the update; if not, Telegram should redeliver it."""
+        frame = encode_frame(update)
+        key = partition_key(update)
+        while (worker_id := self.ring.get(key)) is not None:
+            link = self.links[worker_id]
+            queued = await link.send(frame)
+            if queued is not None:
+                return queued
+            self._take_out(link)
+        self.dropped += 1
+        return False
+
+    async def handle_webhook(self, request: web.Request) -> web.Response:
+        if not await self.forward(await request.json()):
+            # No worker up, or the user's lane is full: let Telegram redeliver later
+            return web.Response(status=503, text="Busy")
+        return web.json_response({})
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "ring": self.ring.nodes(),
+            "dropped": self.dropped,
+            "workers": {
+                i: {"alive": l.alive, "restarts": l.restarts, "forwarded": l.forwarded, "deferred": l.deferred}
+                for i, l in self.links.items()
+            },
+        })
+
+    async def on_startup(self, app: web.Application):
+        self._tasks = [asyncio.create_task(self._run_worker(link)) for link in self.links.values()]
+        self._tasks.append(asyncio.create_task(self._probe()))
+
+        bot = Bot(token=BOT_TOKEN)
+        try:
+            webhook_url = f"{BASE_URL}{WEBHOOK_PATH}"
+            await bot.set_webhook(webhook_url, drop_pending_updates=True)
+            logger.info(f"Webhook set to: {webhook_url}")
+        finally:
+            await bot.session.close()
+
+    async def on_cleanup(self, app: web.Application):
+        self._stopping = True
+        for link in self.links.values():
+            link.disconnect()
+            if link.alive:
+                link.process.send_signal(signal.SIGTERM)
+        await asyncio.gather(*[l.process.wait() for l in self.links.values() if l.process], return_exceptions=True)
+        for task in self._tasks:
+            task.cancel()
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/health", self.health)
+        app.router.add_post(WEBHOOK_PATH, self.handle_webhook)
+        app.on_startup.append(self.on_startup)
+        app.on_cleanup.append(self.on_cleanup)
+        return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AAUPulse multi-process webhook supervisor")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="bot processes (default: CPU count)")
+    parser.add_argument("--socket-dir", default=tempfile.gettempdir(), help="where the worker sockets live")
+    args = parser.parse_args()
+
+    if not BOT_TOKEN:
+        raise RuntimeError("BOT_TOKEN is missing")
+    if not BASE_URL:
+        logger.warning("BASE_URL is empty — webhook may not work. Set BASE_URL to your Render URL.")
+    logger.info(f"Starting ingress on http://0.0.0.0:{PORT} with {args.workers} workers")
+    web.run_app(Supervisor(args.workers, args.socket_dir).create_app(), host="0.0.0.0", port=PORT)
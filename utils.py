@@ -1,13 +1,15 @@
 from datetime import datetime
 import io
 import logging
-from PIL import Image
-import aiohttp
 from typing import List, Optional
 
 logger = logging.getLogger(__name__)
 
 async def download_and_resize_image(file_url: str, max_size: tuple = (800, 800)) -> Optional[bytes]:
+    # Imported here: only photo uploads need them, and Pillow is slow to import at startup
+    import aiohttp
+    from PIL import Image
+
     try:
         async with aiohttp.ClientSession() as session:
             async with session.get(file_url) as response:
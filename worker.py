@@ -0,0 +1,95 @@
+"""
+Background worker process: runs queued jobs (broadcasts, notifications,
+leaderboard rebuilds), the match queue scheduler and the outbox, next to
+the webhook server.
+
+    python worker.py                                  # all queues
+    python worker.py --queues broadcast=2,default=4   # selected queues
+    python worker.py --metrics-port 9100              # also serve /metrics
+
+Set RUN_WORKERS_IN_WEB=0 on the web service when workers run separately
+(the Procfile does). Job metrics such as job_duration_seconds are recorded
+in this process, so scrape its /metrics; the web one doesn't see them.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import signal
+
+from aiogram import Bot
+from aiogram.client.default import DefaultBotProperties
+from aiogram.enums import ParseMode
+from aiohttp import web
+
+from bot_config import BOT_TOKEN
+from database import db
+from notifications import shutdown_workers, start_workers
+from services import health
+from services.log_pipeline import log_pipeline
+from services.loop_monitor import loop_monitor
+from services.outbound import setup_bot_session
+from services.reachability import unreachable_writer
+
+log_pipeline.start()
+logger = logging.getLogger(__name__)
+
+
+def parse_queues(value: str):
+    """'broadcast=2,default=4' -> {'broadcast': 2, 'default': 4}"""
+    queues = {}
+    for part in value.split(","):
+        name, _, concurrency = part.partition("=")
+        queues[name.strip()] = int(concurrency or 1)
+    return queues
+
+
+async def start_metrics_server(port: int) -> web.AppRunner:
+    app = web.Application()
+    app.router.add_get("/metrics", health.metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "0.0.0.0", port).start()
+    logger.info(f"Worker metrics on http://0.0.0.0:{port}/metrics")
+    return runner
+
+
+async def main(queues=None, metrics_port: int = 0):
+    if not BOT_TOKEN:
+        raise RuntimeError("BOT_TOKEN is missing")
+
+    bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    setup_bot_session(bot)
+    loop_monitor.start()
+    await db.connect()
+    unreachable_writer.start(db)
+    start_workers(bot, queues)
+    metrics_runner = await start_metrics_server(metrics_port) if metrics_port else None
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    logger.info("Worker running")
+    await stop.wait()
+
+    logger.info("Worker shutting down...")
+    if metrics_runner:
+        await metrics_runner.cleanup()
+    await shutdown_workers()
+    await unreachable_writer.close()
+    await db.close()
+    await loop_monitor.close()
+    await bot.session.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AAUPulse background worker")
+    parser.add_argument("--queues", type=parse_queues, default=None,
+                        help="queue=concurrency list, e.g. broadcast=2,default=4 (default: all queues)")
+    parser.add_argument("--metrics-port", type=int, default=int(os.getenv("WORKER_METRICS_PORT", "0")),
+                        help="serve this process's /metrics on this port (default: off)")
+    args = parser.parse_args()
+    asyncio.run(main(args.queues, args.metrics_port))